@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 
 from PySide2.QtCore import QCoreApplication, QObject, QSysInfo, Qt
 from PySide2.QtWidgets import QApplication
@@ -10,6 +11,7 @@ from activity_browser import log
 class ABApplication(QApplication):
     _main_window = None
     _controllers = None
+    _headless = False
 
     @property
     def main_window(self) -> QObject:
@@ -24,6 +26,17 @@ class ABApplication(QApplication):
     def main_window(self, widget):
         self._main_window = widget
 
+    @property
+    def headless(self) -> bool:
+        """Whether the Activity Browser runs without user interface, e.g. from
+        `activity-browser-run`. No dialogs may be opened in that case.
+        """
+        return self._headless or self.platformName() == "offscreen"
+
+    @headless.setter
+    def headless(self, value: bool):
+        self._headless = value
+
     def show(self):
         self.main_window.showMaximized()
 
@@ -51,6 +64,15 @@ if QSysInfo.productType() in ["arch", "nixos"]:
     os.environ["QTWEBENGINE_CHROMIUM_FLAGS"] = "--no-sandbox"
     log.info("Info: QtWebEngine sandbox disabled")
 
+if os.environ.get("AB_HEADLESS") or (
+    sys.platform.startswith("linux")
+    and not os.environ.get("DISPLAY")
+    and not os.environ.get("WAYLAND_DISPLAY")
+):
+    # No display available (e.g. on a compute server), Qt's offscreen platform
+    # still allows importing the Activity Browser for headless calculations.
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
 QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts, True)
 
 application = ABApplication()
@@ -9,7 +9,8 @@ from .montecarlo import MonteCarloLCA
 from .multilca import MLCA, Contributions
 from .pedigree import PedigreeMatrix
 from .sensitivity_analysis import GlobalSensitivityAnalysis
-from .superstructure import SuperstructureContributions, SuperstructureMLCA
+from .superstructure import (SuperstructureContributions, SuperstructureMLCA,
+                             SuperstructureMonteCarloLCA)
 from .uncertainty import (CFUncertaintyInterface, ExchangeUncertaintyInterface,
                           ParameterUncertaintyInterface,
                           get_uncertainty_interface)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Headless calculation of calculation setups.
+
+The functions in this module run the LCA, scenario LCA and Monte Carlo
+calculations of calculation setups without any user interaction and return
+their results as long-format dataframes. They are used by the
+`activity-browser-run` command line tool, see `activity_browser.cli`.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from activity_browser import log
+from activity_browser.mod import bw2data as bd
+
+from ..settings import ab_settings
+from .calculations import do_LCA_calculations
+from .commontasks import format_activity_label
+from .errors import ScenarioDatabaseNotFoundError, WrongFileTypeImportError
+from .parallel import headless_workers, open_project
+from .superstructure import (SUPERSTRUCTURE, ABCSVImporter, ABFeatherImporter,
+                             SuperstructureManager, import_from_excel)
+
+
+def read_scenario_file(
+    path: Union[str, Path], sheet: int = 1, separator: str = ";"
+) -> pd.DataFrame:
+    """Read and check a scenario difference file as the scenario import in the
+    LCA setup tab does.
+
+    Parameters
+    ----------
+    path : Path of a feather, Excel or CSV scenario difference file
+    sheet : Index of the sheet to read from an Excel file
+    separator : Field separator of a CSV file
+
+    Raises
+    ------
+    WrongFileTypeImportError
+        If the file is not a scenario difference file (parameter scenario
+        files are not supported)
+    ScenarioDatabaseNotFoundError
+        If the file refers to databases which are not in the current project
+
+    """
+    path = Path(path)
+    if path.suffix == ".feather":
+        df = ABFeatherImporter.read_file(path)
+    elif path.suffix.startswith(".xls"):
+        df = import_from_excel(path, sheet)
+    else:
+        df = ABCSVImporter.read_file(path, separator=separator)
+    if df is None or len(df.columns.intersection(SUPERSTRUCTURE)) < 12:
+        raise WrongFileTypeImportError(
+            "'{}' is not a scenario difference file.".format(path.name)
+        )
+
+    dbs = set(df.loc[:, "from database"]).union(df.loc[:, "to database"])
+    unlinkable = dbs.difference(bd.databases)
+    if unlinkable:
+        raise ScenarioDatabaseNotFoundError(
+            "Databases of '{}' not found in project '{}': {}".format(
+                path.name, bd.projects.current, ", ".join(sorted(unlinkable))
+            )
+        )
+    df = SuperstructureManager.fill_empty_process_keys_in_exchanges(df)
+    SuperstructureManager.verify_scenario_process_keys(df)
+    return SuperstructureManager.check_duplicates(df)
+
+
+def combine_scenario_files(
+    paths: Iterable[Union[str, Path]], kind: str = "product", **kwargs
+) -> pd.DataFrame:
+    """Read one or more scenario difference files and combine them into the
+    scenario dataframe used by `SuperstructureMLCA`.
+
+    `kind` is either 'product' or 'addition', see
+    `SuperstructureManager.combined_data`, further keyword arguments are
+    passed on to `read_scenario_file`.
+    """
+    frames = [read_scenario_file(path, **kwargs) for path in paths]
+    return SuperstructureManager(*frames).combined_data(kind)
+
+
+def _reference_flow_frame(cs_name: str, func_units: list) -> pd.DataFrame:
+    """Describe the reference flows of a calculation setup, one row each."""
+    keys = [next(iter(fu)) for fu in func_units]
+    return pd.DataFrame(
+        {
+            "setup": cs_name,
+            "reference flow": [format_activity_label(k, style="pnld") for k in keys],
+            "database": [k[0] for k in keys],
+            "code": [k[1] for k in keys],
+            "amount": [next(iter(fu.values())) for fu in func_units],
+        }
+    )
+
+
+def scores_dataframe(mlca) -> pd.DataFrame:
+    """Return the LCA scores of a calculated (scenario) MLCA in long format,
+    with one row per reference flow, impact category and scenario.
+    """
+    scores = np.asarray(mlca.lca_scores)
+    scenarios = getattr(mlca, "scenario_names", None)
+    if scores.ndim == 2:
+        scores = scores[:, :, np.newaxis]
+    fu, method, scenario = (a.ravel() for a in np.indices(scores.shape))
+
+    df = _reference_flow_frame(mlca.cs_name, mlca.func_units).iloc[fu]
+    df["method"] = [", ".join(mlca.methods[m]) for m in method]
+    if scenarios is not None:
+        df["scenario"] = [scenarios[s] for s in scenario]
+    df["score"] = scores.ravel()
+    return df.reset_index(drop=True)
+
+
+def monte_carlo_dataframe(mc) -> pd.DataFrame:
+    """Return the results of a Monte Carlo LCA in long format, with one row
+    per iteration, reference flow, impact category and scenario, if any.
+    """
+    results = np.asarray(mc.results)
+    scenarios = getattr(mc, "scenario_names", None)
+    if results.ndim == 3:
+        results = results[..., np.newaxis]
+    iteration, fu, method, scenario = (a.ravel() for a in np.indices(results.shape))
+
+    df = _reference_flow_frame(mc.cs_name, mc.func_units).iloc[fu]
+    df["method"] = [", ".join(mc.methods[m]) for m in method]
+    if scenarios is not None:
+        df["scenario"] = [scenarios[s] for s in scenario]
+    df["iteration"] = iteration
+    df["score"] = results.ravel()
+    return df.reset_index(drop=True)
+
+
+def run_calculation_setup(
+    cs_name: str,
+    scenario_data: Optional[pd.DataFrame] = None,
+    iterations: int = 0,
+    seed: Optional[int] = None,
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Calculate a calculation setup of the current project.
+
+    Parameters
+    ----------
+    cs_name : Name of the calculation setup
+    scenario_data : Combined scenario dataframe, see `combine_scenario_files`,
+        a scenario LCA is calculated if given
+    iterations : Number of Monte Carlo iterations, none are run if 0
+    seed : Seed of the Monte Carlo random number generators
+
+    Returns
+    -------
+    The LCA scores, see `scores_dataframe`, and the Monte Carlo results, see
+    `monte_carlo_dataframe`, or None if no iterations were run.
+
+    """
+    data = {"cs_name": cs_name, "calculation_type": "simple"}
+    if scenario_data is not None:
+        data.update(calculation_type="scenario", data=scenario_data)
+    mlca, _, mc = do_LCA_calculations(data)
+    scores = scores_dataframe(mlca)
+    if not iterations:
+        return scores, None
+    mc.calculate(
+        iterations=iterations, seed=seed, processes=ab_settings.calculation_processes
+    )
+    return scores, monte_carlo_dataframe(mc)
+
+
+def _run_in_project(project: tuple, cs_name: str, *args):
+    """Run `run_calculation_setup` in a worker process of `run_batch`.
+
+    The `project` is given as the (data directory, project name).
+    """
+    open_project(*project)
+    return run_calculation_setup(cs_name, *args)
+
+
+def run_batch(
+    project: str,
+    setups: Optional[List[str]] = None,
+    scenario_data: Optional[pd.DataFrame] = None,
+    iterations: int = 0,
+    seed: Optional[int] = None,
+    jobs: int = 1,
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame], List[str]]:
+    """Calculate several calculation setups of a project.
+
+    With `jobs` larger than 1 the setups are divided over as many worker
+    processes. A setup which fails is logged and skipped.
+
+    Returns
+    -------
+    The concatenated LCA scores and Monte Carlo results (or None) of all
+    setups and the names of the setups which failed.
+
+    """
+    bd.projects.set_current(project)
+    setups = list(setups or bd.calculation_setups)
+    args = (scenario_data, iterations, seed)
+
+    if jobs > 1 and len(setups) > 1:
+        # Worker processes are spawned, forking a process with a running
+        # QApplication is not safe.
+        location = (bd.projects.base_dir, project)
+        with headless_workers():
+            executor = ProcessPoolExecutor(
+                max_workers=min(jobs, len(setups)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            futures = [
+                executor.submit(_run_in_project, location, cs_name, *args)
+                for cs_name in setups
+            ]
+        with executor:
+            outcomes = [
+                _outcome(cs_name, f.result) for cs_name, f in zip(setups, futures)
+            ]
+    else:
+        outcomes = [
+            _outcome(cs_name, lambda: run_calculation_setup(cs_name, *args))
+            for cs_name in setups
+        ]
+
+    failed = [cs_name for cs_name, result in zip(setups, outcomes) if result is None]
+    results = [result for result in outcomes if result is not None]
+    scores = (
+        pd.concat([r[0] for r in results], ignore_index=True)
+        if results
+        else pd.DataFrame()
+    )
+    mc = [r[1] for r in results if r[1] is not None]
+    return scores, pd.concat(mc, ignore_index=True) if mc else None, failed
+
+
+def _outcome(cs_name: str, get_result):
+    """Return the result of a setup calculation, or None if it failed."""
+    try:
+        result = get_result()
+    except Exception as e:
+        log.error("Calculation of setup '{}' failed: {!r}".format(cs_name, e))
+        return None
+    log.info("Calculated setup '{}'".format(cs_name))
+    return result
+
+
+def write_results(df: pd.DataFrame, path: Union[str, Path]) -> None:
+    """Write a results dataframe to a parquet, feather, CSV or Excel file,
+    depending on the file extension of `path`.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    elif path.suffix == ".feather":
+        df.to_feather(path)
+    elif path.suffix == ".csv":
+        df.to_csv(path, index=False)
+    elif path.suffix.startswith(".xls"):
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError("Unsupported results file type: '{}'".format(path.suffix))
@@ -1,58 +1,72 @@
 # -*- coding: utf-8 -*-
+from typing import Callable, Optional
+
 from bw2calc.errors import BW2CalcError
-from PySide2.QtWidgets import QApplication
 
 from activity_browser import log
 
 from ..bwutils import (MLCA, Contributions, MonteCarloLCA,
-                       SuperstructureContributions, SuperstructureMLCA)
+                       SuperstructureContributions, SuperstructureMLCA,
+                       SuperstructureMonteCarloLCA)
+from ..settings import ab_settings
 from .errors import CriticalCalculationError, ScenarioExchangeNotFoundError
+from .results_cache import MLCAResultsCache
+
 
+def do_LCA_calculations(
+    data: dict, progress: Optional[Callable[[int, int], None]] = None
+):
+    """Perform the MLCA calculation.
 
-def do_LCA_calculations(data: dict):
-    """Perform the MLCA calculation."""
+    `progress` is passed on to `MLCA.calculate`, this function contains no
+    user interaction so it can be run from a worker thread.
+    """
     cs_name = data.get("cs_name", "new calculation")
     calculation_type = data.get("calculation_type", "simple")
 
     if calculation_type == "simple":
         try:
-            mlca = MLCA(cs_name)
+            cache = MLCAResultsCache(cs_name)
+            mlca = cache.load()
+            if mlca is None:
+                mlca = MLCA(cs_name, processes=ab_settings.calculation_processes)
+                mlca.calculate(progress)
+                cache.save(mlca)
             contributions = Contributions(mlca)
         except KeyError as e:
             raise BW2CalcError("LCA Failed", str(e)).with_traceback(e.__traceback__)
     elif calculation_type == "scenario":
         try:
             df = data.get("data")
-            mlca = SuperstructureMLCA(cs_name, df)
+            mlca = SuperstructureMLCA(
+                cs_name, df, processes=ab_settings.calculation_processes
+            )
             contributions = SuperstructureContributions(mlca)
         except AssertionError as e:
             # This occurs if the superstructure itself detects something is wrong.
-            QApplication.restoreOverrideCursor()
             raise BW2CalcError("Scenario LCA failed.", str(e)).with_traceback(
                 e.__traceback__
             )
         except ValueError as e:
             # This occurs if the LCA matrix does not contain any of the
             # exchanges mentioned in the superstructure data.
-            QApplication.restoreOverrideCursor()
             raise BW2CalcError(
                 "Scenario LCA failed.",
                 "Constructed LCA matrix does not contain any exchanges from the superstructure",
             ).with_traceback(e.__traceback__)
         except KeyError as e:
-            QApplication.restoreOverrideCursor()
             raise BW2CalcError("LCA Failed", str(e)).with_traceback(e.__traceback__)
         except CriticalCalculationError as e:
-            QApplication.restoreOverrideCursor()
             raise Exception(e)
         except ScenarioExchangeNotFoundError as e:
-            QApplication.restoreOverrideCursor()
-            raise CriticalCalculationError
+            raise CriticalCalculationError(*e.args) from e
+        mlca.calculate(progress)
+        mc = SuperstructureMonteCarloLCA(cs_name, mlca.scenario_df)
     else:
         log.error("Calculation type must be: simple or scenario. Given:", cs_name)
         raise ValueError
 
-    mlca.calculate()
-    mc = MonteCarloLCA(cs_name)
+    if calculation_type == "simple":
+        mc = MonteCarloLCA(cs_name)
 
     return mlca, contributions, mc
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from typing import Optional
+
+import numpy as np
+
+
+class CompactContributionArray(object):
+    """Memory-efficient stand-in for the dense contribution arrays of `MLCA`.
+
+    The last axis holds the flows (biosphere or technosphere), all leading
+    axes (reference flows, methods and optionally scenarios) select one
+    contribution vector. Values are written and read with numpy-style
+    indexing, reading always returns a dense float64 `numpy.ndarray`, so the
+    contribution analysis works on it transparently.
+
+    Parameters
+    ----------
+    shape : Shape of the dense array this object replaces
+    mode : How the contribution vectors are stored:
+        * 'sparse': only the non-zero values are kept (lossless)
+        * 'topk': only the `top_n` largest absolute values are kept, the sum
+          of all others is kept per vector in `rest`
+        * 'float32': a dense array with single precision
+    top_n : Number of contributors to keep per vector in 'topk' mode
+
+    Attributes
+    ----------
+    rest : `numpy.ndarray`
+        Summed contributions not stored individually per vector, shaped as
+        the leading axes with a trailing axis of length 1 so it can be
+        indexed the same way as the contributions themselves
+    """
+
+    MODES = ("sparse", "topk", "float32")
+
+    def __init__(self, shape: tuple, mode: str = "sparse", top_n: int = 100):
+        if mode not in self.MODES:
+            raise ValueError(
+                "Mode must be one of {}, '{}' given.".format(self.MODES, mode)
+            )
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.mode = mode
+        self.top_n = top_n
+        self.rest = np.zeros(self.shape[:-1] + (1,))
+
+        self._dense: Optional[np.ndarray] = None
+        if mode == "float32":
+            self._dense = np.zeros(self.shape, dtype=np.float32)
+        else:
+            size = int(np.prod(self.shape[:-1]))
+            self._indices = [None] * size
+            self._values = [None] * size
+
+    @property
+    def nbytes(self) -> int:
+        if self._dense is not None:
+            return self._dense.nbytes + self.rest.nbytes
+        return self.rest.nbytes + sum(
+            a.nbytes for a in self._indices + self._values if a is not None
+        )
+
+    def _split_key(self, key) -> (np.ndarray, object):
+        """Split an index into an array of flat positions of the selected
+        vectors and the index along the flow axis.
+        """
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        leading, lead_shape = key[:-1], self.shape[:-1]
+        if not all(isinstance(k, (int, np.integer, slice)) for k in leading):
+            # Advanced indexes follow the numpy rules for their axes.
+            positions = np.arange(self.rest.size).reshape(lead_shape)
+            return np.asarray(positions[leading]), key[-1]
+        # Integers and slices select the axes independently, so only the
+        # selected positions of each axis are needed.
+        axes = [np.arange(n)[k] for k, n in zip(leading, lead_shape)]
+        dims = sum(np.ndim(a) for a in axes)
+        grid, axis = [], 0
+        for a in axes:
+            if np.ndim(a):
+                shape = [1] * dims
+                shape[axis] = len(a)
+                a, axis = a.reshape(shape), axis + 1
+            grid.append(a)
+        return np.asarray(np.ravel_multi_index(tuple(grid), lead_shape)), key[-1]
+
+    def __setitem__(self, key, value) -> None:
+        if self._dense is not None:
+            self._dense[key] = value
+            return
+        positions, flow_key = self._split_key(key)
+        if not (isinstance(flow_key, slice) and flow_key == slice(None)):
+            raise IndexError("Contribution vectors can only be set as a whole.")
+        values = np.broadcast_to(
+            np.asarray(value, dtype=np.float64), np.shape(positions) + self.shape[-1:]
+        )
+        for position, row in zip(
+            np.ravel(positions), values.reshape(-1, self.shape[-1])
+        ):
+            indices = np.flatnonzero(row)
+            rest = 0.0
+            if self.mode == "topk" and len(indices) > self.top_n:
+                top = np.argpartition(np.abs(row[indices]), -self.top_n)[-self.top_n :]
+                kept = np.sort(indices[top])
+                rest = row.sum() - row[kept].sum()
+                indices = kept
+            self._indices[position] = indices.astype(np.int32)
+            self._values[position] = row[indices]
+            self.rest.flat[position] = rest
+
+    def __getitem__(self, key) -> np.ndarray:
+        if self._dense is not None:
+            return self._dense[key].astype(np.float64)
+        positions, flow_key = self._split_key(key)
+        out = np.zeros(np.shape(positions) + self.shape[-1:])
+        for out_index, position in np.ndenumerate(positions):
+            indices = self._indices[position]
+            if indices is not None:
+                out[out_index][indices] = self._values[position]
+        return out[(Ellipsis, flow_key)]
+
+    def take(self, index: int, axis: int) -> np.ndarray:
+        """Same as `numpy.ndarray.take` for a single index."""
+        key = [slice(None)] * self.ndim
+        key[axis] = index
+        return self[tuple(key)]
@@ -88,6 +88,12 @@ class CriticalCalculationError(ABError):
     pass
 
 
+class CalculationCanceledError(ABError):
+    """Raised from a progress callback to stop a running calculation when the user cancels it."""
+
+    pass
+
+
 class CriticalScenarioExtensionError(ABError):
     """Should be raised when combinging multiple scenario files by extension leads to zero scenario columns. Due to no
     scenario columns being found in common between the scenario files."""
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Vectorized evaluation of Brightway parameter and exchange formulas.
+
+The `ParameterManager` recalculates all parameters by handing every formula
+to an `asteval` interpreter, one set of parameter values at a time. The
+`FormulaProgram` instead compiles the formulas of a project once into a
+list of steps, ordered so that every formula comes after the parameters it
+uses, and evaluates each step for many sets of values at once over numpy
+arrays.
+
+Formulas using anything beyond arithmetic, numeric constants and a set of
+mathematical functions are evaluated by an `asteval` interpreter instead,
+one value at a time, as before.
+"""
+import ast
+from functools import reduce
+from types import CodeType
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+from asteval import Interpreter
+from bw2parameters.errors import MissingName
+
+from activity_browser import log
+
+from .utils import Parameters, StaticParameters
+
+# Functions available to compiled formulas, mirroring the numpy functions
+# `asteval` provides.
+FUNCTIONS = {
+    name: getattr(np, name)
+    for name in (
+        "sqrt",
+        "exp",
+        "expm1",
+        "log",
+        "log10",
+        "log2",
+        "log1p",
+        "sin",
+        "cos",
+        "tan",
+        "arcsin",
+        "arccos",
+        "arctan",
+        "sinh",
+        "cosh",
+        "tanh",
+        "fabs",
+        "floor",
+        "ceil",
+        "power",
+    )
+}
+FUNCTIONS.update(
+    {
+        "abs": np.abs,
+        "min": lambda *args: reduce(np.minimum, args),
+        "max": lambda *args: reduce(np.maximum, args),
+    }
+)
+CONSTANTS = {"pi": np.pi, "e": np.e, "inf": np.inf, "nan": np.nan}
+
+_OPERATORS = (
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+)
+
+
+class Step(NamedTuple):
+    """A single instruction of a `FormulaProgram`.
+
+    Depending on the `kind`, the `source` is the position of the parameter
+    in the values ("value"), a fixed amount ("constant") or a formula
+    ("compiled" or "interpreted"). `symbols` maps the names used by a
+    formula to the slots holding their values.
+    """
+
+    slot: int
+    kind: str
+    source: Union[int, float, str]
+    symbols: Dict[str, int] = {}
+    code: Optional[CodeType] = None
+
+
+class FormulaProgram(object):
+    """The formulas of all project, database and activity parameters and of
+    the parameterized exchanges of a project, compiled into one program.
+
+    Parameters are resolved in the same scopes as the `ParameterManager`
+    does: project parameters are available to all formulas, database
+    parameters to the parameters of their database and activity parameters
+    and parameterized exchanges to their own group.
+
+    `evaluate` takes a 2-dimensional array with a row of values for each
+    sample, in the order of `parameters`, and returns the amounts of the
+    parameterized exchanges for each sample.
+    """
+
+    def __init__(self, parameters: Parameters, initial: StaticParameters):
+        self.steps: List[Step] = []
+        self.outputs: List[int] = []
+        # Names known to the interpreter, like `round` or `sum`.
+        self.builtins = set(Interpreter().symtable)
+        self.positions = {}
+        for i, p in enumerate(parameters):
+            self.positions.setdefault((p.name, p.group), i)
+
+        project = self._add_scope(initial.project(), "project", {})
+        databases = {
+            db: self._add_scope(initial.by_database(db), db, project)
+            for db in initial.databases
+        }
+        for p in initial.act_by_group_db:
+            scope = dict(project, **databases.get(p.database, {}))
+            scope.update(self._add_scope(initial.act_by_group(p.group), p.group, scope))
+            for formula in initial.exc_by_group(p.group).values():
+                self.outputs.append(self._add_formula(formula, scope, strict=False))
+
+    @property
+    def interpreted(self) -> List[str]:
+        """The formulas which could not be compiled."""
+        return [step.source for step in self.steps if step.kind == "interpreted"]
+
+    def _add_scope(self, data: dict, group: str, glo: dict) -> dict:
+        """Add the parameters in `data` as steps, in order of their
+        dependencies, and return their names mapped to their slots.
+        """
+        dependencies = {
+            name: self.symbols(values["formula"]) & set(data)
+            for name, values in data.items()
+            if values.get("formula")
+        }
+        ordered = {}
+
+        def visit(name: str, path: tuple) -> None:
+            if name in path:
+                raise ValueError(
+                    "Circular reference in parameters: {}".format(", ".join(path))
+                )
+            if name in ordered:
+                return
+            for dependency in sorted(dependencies.get(name, ())):
+                visit(dependency, path + (name,))
+            ordered[name] = None
+
+        for name in data:
+            visit(name, ())
+
+        scope = {}
+        for name in ordered:
+            formula = data[name].get("formula")
+            if formula:
+                scope[name] = self._add_formula(formula, dict(glo, **scope))
+            elif (name, group) in self.positions:
+                scope[name] = self._add_step("value", self.positions[(name, group)])
+            else:
+                scope[name] = self._add_step("constant", data[name].get("amount"))
+        return scope
+
+    def _add_step(self, kind: str, source, symbols: dict = None, code=None) -> int:
+        slot = len(self.steps)
+        self.steps.append(Step(slot, kind, source, symbols or {}, code))
+        return slot
+
+    def _add_formula(self, formula: str, scope: dict, strict: bool = True) -> int:
+        """Add a step evaluating `formula` with the parameters in `scope`.
+
+        Raises a `MissingName` error for names which are not defined if
+        `strict`, otherwise the formula is left to the interpreter, which
+        reports the missing names itself.
+        """
+        names = self.symbols(formula)
+        missing = names.difference(scope, self.builtins)
+        if missing and strict:
+            raise MissingName(
+                "The following variables aren't defined:\n{}".format("|".join(missing))
+            )
+        symbols = {name: scope[name] for name in names if name in scope}
+        code = None
+        if not names.difference(symbols, FUNCTIONS, CONSTANTS):
+            code = self.compile(formula, symbols)
+        if code is None:
+            return self._add_step("interpreted", formula, symbols)
+        return self._add_step("compiled", formula, symbols, code)
+
+    @staticmethod
+    def symbols(formula: str) -> set:
+        """Return the names used in `formula`."""
+        try:
+            tree = ast.parse(formula.strip(), mode="eval")
+        except SyntaxError:
+            return set()
+        return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+    @staticmethod
+    def compile(formula: str, symbols: dict) -> Optional[CodeType]:
+        """Compile `formula` for evaluation over arrays, or return None if
+        it uses anything besides arithmetic, numbers and `FUNCTIONS`.
+        """
+        try:
+            tree = ast.parse(formula.strip(), mode="eval")
+        except SyntaxError:
+            return None
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call):
+                if (
+                    not isinstance(node.func, ast.Name)
+                    or node.func.id not in FUNCTIONS
+                    or node.func.id in symbols
+                    or node.keywords
+                ):
+                    return None
+            elif isinstance(node, ast.Constant):
+                if isinstance(node.value, bool) or not isinstance(
+                    node.value, (int, float)
+                ):
+                    return None
+            elif not isinstance(
+                node,
+                (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load)
+                + _OPERATORS,
+            ):
+                return None
+        return compile(tree, "<formula>", "eval")
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        """Evaluate the program for every row of `values`.
+
+        Parameters
+        ----------
+        values : 2-dimensional array of shape (samples, parameters)
+
+        Returns
+        -------
+        2-dimensional array of shape (samples, parameterized exchanges)
+
+        """
+        samples = values.shape[0]
+        slots = [None] * len(self.steps)
+        namespace = dict(CONSTANTS, __builtins__={}, **FUNCTIONS)
+        for step in self.steps:
+            if step.kind == "value":
+                result = values[:, step.source]
+            elif step.kind == "constant":
+                result = step.source
+            elif step.kind == "compiled":
+                local = {name: slots[slot] for name, slot in step.symbols.items()}
+                try:
+                    with np.errstate(all="ignore"):
+                        result = eval(step.code, namespace, local)
+                except (ArithmeticError, TypeError, ValueError) as e:
+                    log.debug(
+                        f"Interpreting formula after array evaluation failed: {e}"
+                    )
+                    result = self._interpret(step, slots, samples)
+            else:
+                result = self._interpret(step, slots, samples)
+            slots[step.slot] = np.broadcast_to(
+                np.asarray(result, dtype=np.float64), (samples,)
+            )
+
+        amounts = np.empty((samples, len(self.outputs)))
+        for i, slot in enumerate(self.outputs):
+            amounts[:, i] = slots[slot]
+        return amounts
+
+    @staticmethod
+    def _interpret(step: Step, slots: list, samples: int) -> np.ndarray:
+        """Evaluate the formula of `step` one sample at a time."""
+        interpreter = Interpreter()
+        result = np.empty(samples)
+        for i in range(samples):
+            interpreter.symtable.update(
+                {name: slots[slot][i] for name, slot in step.symbols.items()}
+            )
+            value = interpreter(step.source)
+            result[i] = np.nan if value is None else value
+        return result
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Callable, Hashable, Iterator
+
+import numpy as np
+
+
+def matrix_nbytes(matrix) -> int:
+    """Return the memory used by a dense array or a scipy sparse matrix."""
+    if isinstance(matrix, np.ndarray):
+        return matrix.nbytes
+    return sum(
+        getattr(matrix, attr).nbytes
+        for attr in ("data", "indices", "indptr", "row", "col")
+        if hasattr(matrix, attr)
+    )
+
+
+class LazyMatrixDict(Mapping):
+    """Read-only mapping which calculates its values when they are accessed.
+
+    Only the keys are stored up front, the value for a key is created by
+    calling `factory(key)` and kept in a least-recently-used cache. The total
+    size of the cached values never exceeds `max_bytes`, values that are
+    larger than the budget on their own are returned but not cached.
+
+    Parameters
+    ----------
+    factory : Callable which returns the value (a matrix) for a key
+    max_bytes : Memory budget of the cache in bytes
+    """
+
+    def __init__(self, factory: Callable, max_bytes: int):
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.cached_bytes = 0
+        self._keys = dict()
+        self._cache = OrderedDict()
+
+    def add(self, key: Hashable) -> None:
+        """Register a key for which the value can be calculated."""
+        self._keys[key] = None
+        self.invalidate(key)
+
+    def discard(self, key: Hashable) -> None:
+        """Remove a key and any cached value."""
+        self._keys.pop(key, None)
+        self.invalidate(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the cached value of a key, it is recalculated on next access."""
+        if key in self._cache:
+            self.cached_bytes -= matrix_nbytes(self._cache.pop(key))
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._cache.clear()
+        self.cached_bytes = 0
+
+    def __getitem__(self, key: Hashable):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key not in self._keys:
+            raise KeyError(key)
+        value = self.factory(key)
+        size = matrix_nbytes(value)
+        if size <= self.max_bytes:
+            while self._cache and self.cached_bytes + size > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self.cached_bytes -= matrix_nbytes(evicted)
+            self._cache[key] = value
+            self.cached_bytes += size
+        return value
+
+    def __iter__(self) -> Iterator:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
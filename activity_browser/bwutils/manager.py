@@ -6,9 +6,11 @@ import numpy as np
 from bw2calc import LCA
 from stats_arrays import MCRandomNumberGenerator, UncertaintyBase
 
+from activity_browser import log
 from activity_browser.mod.bw2data.backends import ExchangeDataset
 from activity_browser.mod.bw2data.parameters import *
 
+from .formulas import FormulaProgram
 from .utils import Index, Indices, Parameters, StaticParameters
 
 
@@ -21,6 +23,27 @@ class ParameterManager(object):
         self.parameters: Parameters = Parameters.from_bw_parameters()
         self.initial: StaticParameters = StaticParameters()
         self.indices: Indices = self.construct_indices()
+        self.program: Optional[FormulaProgram] = self.construct_program()
+
+    def construct_program(self) -> Optional[FormulaProgram]:
+        """Compile all the formulas into a `FormulaProgram`, which evaluates
+        many sets of parameter values at once.
+
+        If the formulas contain errors, None is returned and the formulas
+        are interpreted one by one, which reports these errors.
+        """
+        try:
+            program = FormulaProgram(self.parameters, self.initial)
+        except (MissingName, ValueError) as e:
+            log.warning(f"Could not compile the parameter formulas: {e}")
+            return None
+        if program.interpreted:
+            log.info(
+                "Parameter formulas evaluated by the interpreter: {}".format(
+                    ", ".join(program.interpreted)
+                )
+            )
+        return program
 
     def construct_indices(self) -> Indices:
         """Given that ParameterizedExchanges will always have the same order of
@@ -158,11 +181,35 @@ class ParameterManager(object):
         All parameter types are recalculated in turn before interpreting the
         ParameterizedExchange formulas into amounts.
         """
+        if self.program is not None:
+            values = np.array([[p.amount for p in self.parameters]])
+            return self.program.evaluate(values)[0]
         global_project = self.recalculate_project_parameters()
         all_db = self.process_database_parameters(global_project)
         data = self.process_exchanges(global_project, all_db)
         return data
 
+    def calculate_samples(self, values: np.ndarray) -> np.ndarray:
+        """Calculate the exchange amounts for every row of parameter
+        `values`, as if `recalculate` was called for each row in turn.
+
+        NaN values keep the amount of the parameter in the previous row.
+        After the calculation, the parameters hold the values of the last
+        row.
+        """
+        values = np.vstack([[p.amount for p in self.parameters], values])
+        filled = np.where(np.isnan(values), 0, np.arange(len(values)).reshape(-1, 1))
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        values = np.take_along_axis(values, filled, axis=0)[1:]
+        if self.program is None:
+            amounts = []
+            for row in values:
+                self.parameters.update(row)
+                amounts.append(self.calculate())
+            return np.array(amounts)
+        self.parameters.update(values[-1])
+        return self.program.evaluate(values)
+
     @abstractmethod
     def recalculate(self, values: List[float]) -> np.ndarray:
         """Convenience function that takes the given new values and recalculates.
@@ -206,8 +253,8 @@ class ParameterManager(object):
         Side-note on presamples: Presamples was used in AB for calculating scenarios,
         presamples was superseded by this implementation. For more reading:
         https://presamples.readthedocs.io/en/latest/index.html"""
-        sample_data = [self.ps_recalculate(list(values)) for _, values in scenarios]
-        samples = np.concatenate(sample_data, axis=1)
+        values = np.array([list(values) for _, values in scenarios], dtype=np.float64)
+        samples = self.calculate_samples(values).T
         indices = self.reformat_indices()
         return samples, indices
 
@@ -309,6 +356,9 @@ class MonteCarloParameterManager(ParameterManager, Iterator):
             *[getattr(p, "data", {}) for p in parameters]
         )
         self.mc_generator = MCRandomNumberGenerator(self.uncertainties, seed=seed)
+        self._positions = {}
+        for i, p in enumerate(self.parameters):
+            self._positions.setdefault((p.name, p.group), i)
 
     def __iter__(self):
         return self
@@ -325,13 +375,11 @@ class MonteCarloParameterManager(ParameterManager, Iterator):
         all_data = np.empty((iterations, len(self.indices)), dtype=Indices.array_dtype)
         random_bounded_values = self.mc_generator.generate(iterations)
 
-        # Now, repeatedly replace parameter amounts with sampled data and
-        # recalculate. Every processed row is added to the sized array.
+        # Recalculate all samples at once, then add every processed row to
+        # the sized array.
+        data = self.calculate_samples(random_bounded_values.T)
         for i in range(iterations):
-            values = random_bounded_values.take(i, axis=1)
-            self.parameters.update(values)
-            data = self.calculate()
-            all_data[i] = self.indices.mock_params(data)
+            all_data[i] = self.indices.mock_params(data[i])
 
         return all_data
 
@@ -339,24 +387,32 @@ class MonteCarloParameterManager(ParameterManager, Iterator):
         """Similar to `recalculate` but only performs a single sampling and
         recalculation.
         """
+        return self.indices.mock_params(self.next_amounts())
+
+    def next_amounts(self) -> np.ndarray:
+        """Same as `next`, but only returns the recalculated exchange
+        amounts, in the order of `indices`.
+        """
         values = self.mc_generator.next()
         self.parameters.update(values)
-        data = self.calculate()
-        return self.indices.mock_params(data)
+        return self.calculate()
+
+    def next_samples(self, iterations: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample the parameters `iterations` times in one draw and
+        recalculate the exchange amounts of all samples at once.
+
+        Returns the sampled values and the exchange amounts, with a row for
+        each sample.
+        """
+        values = np.ascontiguousarray(self.mc_generator.generate(iterations).T)
+        return values, self.calculate_samples(values)
 
     def retrieve_sampled_values(self, data: dict):
         """Enters the sampled values into the 'exchanges' list in the 'data'
         dictionary.
         """
         for name, vals in data.items():
-            param = next(
-                (
-                    p
-                    for p in self.parameters
-                    if p.name == vals.get("name") and p.group == vals.get("group")
-                ),
-                None,
-            )
-            if param is None:
+            i = self._positions.get((vals.get("name"), vals.get("group")))
+            if i is None:
                 continue
-            data[name]["values"].append(param.amount)
+            data[name]["values"].append(self.parameters[i].amount)
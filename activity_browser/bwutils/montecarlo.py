@@ -1,20 +1,61 @@
+import os
+import tempfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from time import time
-from typing import Optional, Union
+from typing import Callable, List, Optional, Tuple, Union
 
 import bw2calc as bc
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from stats_arrays import MCRandomNumberGenerator
 
 from activity_browser import log
 from activity_browser.mod import bw2data as bd
 
+from .errors import CalculationCanceledError
 from .manager import MonteCarloParameterManager
+from .montecarlo_store import MonteCarloStore
+from .parallel import headless_workers, open_project
+from .sampling import SAMPLING_MODES, QuasiRandomGenerator
+from .solvers import IterativeSolver, build_demand_matrix, solve_demand_matrix
+from .statistics import RunningStatistics, relative_widths
 
 
 class MonteCarloLCA(object):
-    """A Monte Carlo LCA for multiple reference flows and methods loaded from a calculation setup."""
+    """A Monte Carlo LCA for multiple reference flows and methods loaded from a calculation setup.
+
+    The iterations are calculated in blocks of `BLOCK_SIZE`, every block
+    draws its samples from its own random stream spawned from the seed with
+    `numpy.random.SeedSequence`. Blocks can therefore be calculated in any
+    process and the results only depend on the seed, not on the number of
+    processes.
+
+    Within a block, the random samples of all generators are drawn for many
+    iterations at once, see `draw_samples`. The number of iterations per
+    draw only depends on the size of the sampled data, so the samples stay
+    reproducible by seed.
+    """
+
+    BLOCK_SIZE = 50
+    # Progress callback of a running `calculate`, see `_finish_block`
+    _progress: Optional[Callable[[int, int], None]] = None
+    # Quantiles of the results checked for convergence, besides the mean.
+    CONVERGENCE_QUANTILES = (0.05, 0.5, 0.95)
+    # Standard normal quantile of the 95% confidence intervals.
+    CONFIDENCE_Z = 1.959964
+    # Quantiles of the results in `get_statistics_dataframe`.
+    SUMMARY_QUANTILES = (0.025, 0.05, 0.5, 0.95, 0.975)
+    # Maximum number of bytes of random samples drawn at once.
+    SAMPLE_MEMORY = 2**28
+    PARAM_EXCHANGE_DTYPE = [
+        ("row", "<u4"),
+        ("col", "<u4"),
+        ("type", "u1"),
+        ("amount", "<f4"),
+    ]
 
     def __init__(self, cs_name):
         if cs_name not in bd.calculation_setups:
@@ -29,8 +70,20 @@ class MonteCarloLCA(object):
         self.include_biosphere = True
         self.include_cfs = True
         self.include_parameters = True
+        self.solver = "direct"
+        self.tolerance = 1e-8
+        self.sampling = "random"
+        self.iterative_solver: Optional[IterativeSolver] = None
         self.param_rng = None
         self.param_cols = ["row", "col", "type"]
+        # Mappings of the tech_params and bio_params onto the stored values
+        # of the matrices, see `prepare_matrix_updates`.
+        self._tech_update: Optional[tuple] = None
+        self._bio_update: Optional[tuple] = None
+        # The characterization factors of all methods stacked as one
+        # (methods x biosphere) matrix, see `prepare_matrix_updates`.
+        self.stacked_cf_matrix: Optional[sparse.csr_matrix] = None
+        self._cf_update: Optional[tuple] = None
 
         self.tech_rng: Optional[Union[MCRandomNumberGenerator, np.ndarray]] = None
         self.bio_rng: Optional[Union[MCRandomNumberGenerator, np.ndarray]] = None
@@ -54,15 +107,33 @@ class MonteCarloLCA(object):
         self.method_index = {m: i for i, m in enumerate(self.methods)}
         self.rev_method_index = {i: m for i, m in enumerate(self.methods)}
 
-        # GSA calculation variables
-        self.A_matrices = list()
-        self.B_matrices = list()
+        # GSA calculation variables, the sampled technosphere and biosphere
+        # params amounts per iteration (None if not included), of the params
+        # in the sample columns only, see `prepare_sample_columns`
+        self.tech_samples: Optional[np.ndarray] = None
+        self.bio_samples: Optional[np.ndarray] = None
+        self.tech_sample_columns: Optional[np.ndarray] = None
+        self.bio_sample_columns: Optional[np.ndarray] = None
         self.CF_dict = defaultdict(list)
         self.parameter_exchanges = list()
         self.parameters = list()
         self.parameter_data = defaultdict(dict)
 
         self.results = list()
+        # Statistics of the results, updated with every stored block.
+        self.statistics: Optional[RunningStatistics] = None
+        self.keep_results = True
+        self.store: Optional[MonteCarloStore] = None
+
+        # Stopping rule, see `calculate`
+        self.convergence: Optional[float] = None
+        self.convergence_interval = 100
+        self.convergence_history: List[Tuple[int, float]] = []
+        self.iterations_used = 0
+        self._checked = 0
+        self.canceled = False
+        # Set by `cancel`, shared with the worker processes.
+        self._stop_event = None
 
         self.lca = bc.LCA(demand=self.func_units_dict, method=self.methods[0])
 
@@ -74,88 +145,402 @@ class MonteCarloLCA(object):
         it will be dropped from the returned array.
         """
 
-        def key_to_rowcol(x) -> Optional[tuple]:
-            if x["type"] in [0, 1]:
-                row = self.lca.activity_dict.get(x["input"], None)
-                col = self.lca.product_dict.get(x["output"], None)
-            else:
-                row = self.lca.biosphere_dict.get(x["input"], None)
-                col = self.lca.activity_dict.get(x["output"], None)
-            # if either the row or the column is None, return np.NaN.
-            if row is None or col is None:
-                return None
-            return row, col, x["type"], x["amount"]
-
-        # Convert the data and store in a new array, dropping Nones.
-        converted = (key_to_rowcol(d) for d in data)
+        converted = (
+            self._exchange_row_col(x["input"], x["output"], x["type"]) for x in data
+        )
+        # Store in a new array, dropping Nones.
         unified = np.array(
-            [x for x in converted if x is not None],
-            dtype=[("row", "<u4"), ("col", "<u4"), ("type", "u1"), ("amount", "<f4")],
+            [
+                rowcol + (x["amount"],)
+                for rowcol, x in zip(converted, data)
+                if rowcol is not None
+            ],
+            dtype=self.PARAM_EXCHANGE_DTYPE,
         )
         return unified
 
-    def load_data(self) -> None:
-        """Constructs the random number generators for all of the matrices that
-        can be altered by uncertainty.
+    def _exchange_row_col(self, input_key, output_key, exc_type) -> Optional[tuple]:
+        """Return the (row, col, type) of an exchange in the LCA matrices, or
+        None if it is not part of them.
+        """
+        if exc_type in [0, 1]:
+            row = self.lca.activity_dict.get(input_key, None)
+            col = self.lca.product_dict.get(output_key, None)
+        else:
+            row = self.lca.biosphere_dict.get(input_key, None)
+            col = self.lca.activity_dict.get(output_key, None)
+        if row is None or col is None:
+            return None
+        return row, col, exc_type
 
-        If any of these uncertain calculations are not included, the initial
-        amounts of the 'params' matrices are used in place of generating
-        a vector
+    @staticmethod
+    def _match_params(params: np.ndarray, exchanges: np.ndarray) -> tuple:
+        """Return the positions in `params` of the `exchanges` with the same
+        row, col and type, and the matching positions in `exchanges`.
         """
-        self.lca.load_lci_data()
+        if not len(exchanges):
+            return np.array([], dtype=int), np.array([], dtype=int)
 
-        self.tech_rng = (
-            MCRandomNumberGenerator(self.lca.tech_params, seed=self.seed)
-            if self.include_technosphere
-            else self.lca.tech_params["amount"].copy()
+        n_cols = int(max(params["col"].max(initial=0), exchanges["col"].max())) + 1
+
+        def cells(a: np.ndarray) -> np.ndarray:
+            return (
+                a["row"].astype(np.int64) * n_cols + a["col"].astype(np.int64)
+            ) * 256 + a["type"]
+
+        wanted = cells(exchanges)
+        order = np.argsort(wanted, kind="stable")
+        found = cells(params)
+        position = np.searchsorted(wanted, found, sorter=order).clip(0, len(order) - 1)
+        matched = wanted[order[position]] == found
+        return np.flatnonzero(matched), order[position[matched]]
+
+    def prepare_parameter_mapping(self) -> None:
+        """Map the parameterized exchanges of the parameter manager onto the
+        `tech_params` and `bio_params` arrays.
+
+        The mapping is the same for every iteration, so each sample of
+        recalculated exchange amounts is inserted with a single scatter.
+        """
+        converted = [
+            self._exchange_row_col(index.input, index.output, index.exchange_type)
+            for index in self.param_rng.indices
+        ]
+        self._param_sources = np.array(
+            [i for i, rowcol in enumerate(converted) if rowcol is not None], dtype=int
         )
-        self.bio_rng = (
-            MCRandomNumberGenerator(self.lca.bio_params, seed=self.seed)
-            if self.include_biosphere
-            else self.lca.bio_params["amount"].copy()
+        self._param_exchanges = np.array(
+            [converted[i] + (0.0,) for i in self._param_sources],
+            dtype=self.PARAM_EXCHANGE_DTYPE,
+        )
+
+        tech = np.flatnonzero(np.isin(self._param_exchanges["type"], [0, 1]))
+        self._tech_positions, sources = self._match_params(
+            self.lca.tech_params, self._param_exchanges[tech]
+        )
+        self._tech_sources = self._param_sources[tech[sources]]
+        bio = np.flatnonzero(self._param_exchanges["type"] == 2)
+        self._bio_positions, sources = self._match_params(
+            self.lca.bio_params, self._param_exchanges[bio]
         )
+        self._bio_sources = self._param_sources[bio[sources]]
+
+        # Only the amounts of the GSA parameter tuples change.
+        self._gsa_parameters = self.param_rng.parameters.to_gsa()
+
+    @staticmethod
+    def _data_mapping(
+        matrix: sparse.csr_matrix, params: np.ndarray, signs: np.ndarray
+    ) -> Optional[tuple]:
+        """Map the `params` onto the stored values (`.data`) of the CSR
+        `matrix` that was built from them.
 
+        If every stored value comes from exactly one exchange, the mapping
+        is the permutation of the params into the order of the stored
+        values, with the matching `signs`. Otherwise, the positions of the
+        exchanges in `.data` are returned, as their amounts have to be
+        summed. Returns None if the params do not match the matrix.
+        """
+        matrix.sum_duplicates()
+        n_rows, n_cols = matrix.shape
+        rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(matrix.indptr))
+        cells = rows * n_cols + matrix.indices
+        found = params["row"].astype(np.int64) * n_cols + params["col"]
+        positions = np.searchsorted(cells, found).clip(0, max(matrix.nnz - 1, 0))
+        if matrix.nnz == 0 or not np.array_equal(cells[positions], found):
+            return None
+        if len(positions) == matrix.nnz and np.all(np.bincount(positions) == 1):
+            order = np.argsort(positions)
+            return True, order, signs[order]
+        return False, positions, signs
+
+    def prepare_sample_columns(self) -> None:
+        """Select the params of which the sampled amounts are kept for the
+        GSA: those with an uncertainty distribution and, when parameters are
+        included, those recalculated from parameters. The amounts of all
+        other params never change.
+        """
+        tech = [np.flatnonzero(self.lca.tech_params["uncertainty_type"] > 1)]
+        bio = [np.flatnonzero(self.lca.bio_params["uncertainty_type"] > 1)]
+        if self.include_parameters:
+            tech.append(self._tech_positions)
+            bio.append(self._bio_positions)
+        self.tech_sample_columns = np.unique(np.hstack(tech)).astype(int)
+        self.bio_sample_columns = np.unique(np.hstack(bio)).astype(int)
+
+    def prepare_matrix_updates(self) -> None:
+        """Map the `tech_params` and `bio_params` arrays onto the stored
+        values of the technosphere and biosphere matrices, and the
+        `cf_params` of all methods onto the `stacked_cf_matrix`.
+
+        The sparsity structure of the matrices is the same for every
+        iteration, so the sampled amounts are written into the existing
+        matrices with a single gather (see `update_matrix`), instead of
+        building new matrices with `rebuild_technosphere_matrix` and
+        `rebuild_biosphere_matrix`. Technosphere inputs are negated, like
+        `bw2calc` does.
+        """
+        cf_params = [self.cf_params[m] for m in self.methods]
+        stacked = np.zeros(
+            sum(len(params) for params in cf_params), dtype=self.PARAM_EXCHANGE_DTYPE
+        )
+        stacked["row"] = np.repeat(
+            np.arange(len(cf_params)), [len(params) for params in cf_params]
+        )
+        stacked["col"] = np.hstack([params["row"] for params in cf_params])
+        cf_amounts = np.hstack([params["amount"] for params in cf_params])
+        self.stacked_cf_matrix = sparse.coo_matrix(
+            (cf_amounts.astype(np.float64), (stacked["row"], stacked["col"])),
+            (len(self.methods), self.lca.biosphere_matrix.shape[0]),
+        ).tocsr()
+        self._cf_update = self._data_mapping(
+            self.stacked_cf_matrix, stacked, np.ones(len(stacked))
+        )
+
+        tech_signs = np.where(
+            self.lca.tech_params["type"] == bd.utils.TYPE_DICTIONARY["technosphere"],
+            -1.0,
+            1.0,
+        )
+        self._tech_update = self._data_mapping(
+            self.lca.technosphere_matrix, self.lca.tech_params, tech_signs
+        )
+        self._bio_update = self._data_mapping(
+            self.lca.biosphere_matrix,
+            self.lca.bio_params,
+            np.ones(len(self.lca.bio_params)),
+        )
+
+    @staticmethod
+    def update_matrix(matrix: sparse.csr_matrix, update: tuple, vector: np.ndarray):
+        """Write the amounts of `vector`, in the order of its params array,
+        into the stored values of `matrix`, see `_data_mapping`.
+        """
+        permutation, index, signs = update
+        if permutation:
+            np.take(vector, index, out=matrix.data)
+            matrix.data *= signs
+        else:
+            matrix.data[:] = np.bincount(
+                index, weights=vector * signs, minlength=matrix.nnz
+            )
+
+    def load_data(self) -> None:
+        """Loads the matrix data and constructs the random number generators
+        for all of the matrices that can be altered by uncertainty, see
+        `seed_generators`.
+        """
+        self.lca.load_lci_data()
+
+        self.cf_params = {}
         if self.lca.lcia:
-            self.cf_rngs = (
-                {}
-            )  # we need as many cf_rng as impact categories, because they are of different size
+            # we need as many cf_rng as impact categories, because they are of different size
             for m in self.methods:
                 self.lca.switch_method(m)
                 self.lca.load_lcia_data()
-                self.cf_rngs[m] = (
-                    MCRandomNumberGenerator(self.lca.cf_params, seed=self.seed)
-                    if self.include_cfs
-                    else self.lca.cf_params["amount"].copy()
-                )
+                self.cf_params[m] = self.lca.cf_params
         # Construct the MC parameter manager
         if self.include_parameters:
             self.param_rng = MonteCarloParameterManager(seed=self.seed)
+            self.prepare_parameter_mapping()
+        self.prepare_matrix_updates()
+        self.prepare_sample_columns()
 
         (
             self.lca.activity_dict_rev,
             self.lca.product_dict_rev,
             self.lca.biosphere_dict_rev,
         ) = self.lca.reverse_dict()
+        self.seed_generators(self.seed)
 
-    def calculate(self, iterations=10, seed: int = None, **kwargs):
+        # Constructed by the first `calculate_block`, so that the matrix is
+        # only factorized in the process which calculates the iterations.
+        self.iterative_solver = None
+        self.demands = build_demand_matrix(self.lca, self.func_units)
+
+    def seed_generators(self, seed: Optional[int], first: int = 0) -> None:
+        """(Re)constructs the random number generators with the given seed.
+
+        If any of these uncertain calculations are not included, the initial
+        amounts of the 'params' matrices are used in place of generating
+        a vector, as float64 like the samples.
+
+        With quasi-random `sampling`, the Sobol sequences continue from
+        iteration `first`, see `generator`.
+        """
+        self.tech_rng = (
+            self.generator(self.lca.tech_params, seed, first, 0)
+            if self.include_technosphere
+            else self.lca.tech_params["amount"].astype(np.float64)
+        )
+        self.bio_rng = (
+            self.generator(self.lca.bio_params, seed, first, 1)
+            if self.include_biosphere
+            else self.lca.bio_params["amount"].astype(np.float64)
+        )
+        self.cf_rngs = {
+            m: (
+                self.generator(params, seed, first, 3 + i)
+                if self.include_cfs
+                else params["amount"].astype(np.float64)
+            )
+            for i, (m, params) in enumerate(self.cf_params.items())
+        }
+        if self.include_parameters:
+            self.param_rng.mc_generator = self.generator(
+                self.param_rng.uncertainties, seed, first, 2
+            )
+
+    def generator(
+        self, params: np.ndarray, seed: Optional[int], first: int, stream: int
+    ) -> Union[MCRandomNumberGenerator, QuasiRandomGenerator]:
+        """Construct the generator of `params` for the `sampling` mode.
+
+        Every generator of quasi-random samples follows its own Sobol
+        sequence, scrambled with the seed of the simulation and the
+        `stream` number, so the blocks of iterations continue the same
+        sequences.
+        """
+        if self.sampling == "random":
+            return MCRandomNumberGenerator(params, seed=seed)
+        return QuasiRandomGenerator(
+            params,
+            self.sampling,
+            seed=seed,
+            sequence_seed=np.random.SeedSequence(self.seed, spawn_key=(stream,)),
+            first=first,
+        )
+
+    @classmethod
+    def iteration_blocks(cls, iterations: int, seed: int) -> List[Tuple[int, int, int]]:
+        """Divide the iterations into blocks of (first, last, seed), with the
+        block seeds spawned from `seed`.
+        """
+        starts = range(0, iterations, cls.BLOCK_SIZE)
+        streams = np.random.SeedSequence(seed).spawn(len(starts))
+        return [
+            (
+                first,
+                min(first + cls.BLOCK_SIZE, iterations),
+                int(stream.generate_state(1)[0]),
+            )
+            for first, stream in zip(starts, streams)
+        ]
+
+    def calculate(
+        self,
+        iterations=10,
+        seed: int = None,
+        processes: int = 1,
+        samples_dir: Optional[str] = None,
+        resumable: bool = False,
+        convergence: Optional[float] = None,
+        convergence_interval: int = 100,
+        progress: Optional[Callable[[int, int], None]] = None,
+        isolated: bool = False,
+        keep_results: bool = True,
+        **kwargs,
+    ):
         """Main calculate method for the MC LCA class, allows fine-grained control
         over which uncertainties are included when running MC sampling.
+
+        With `solver="iterative"` every iteration is solved with an
+        `IterativeSolver` within the relative `tolerance` (default 1e-8),
+        instead of with a direct solve of the technosphere matrix.
+
+        With `sampling="lhs"` every block of iterations is sampled from a
+        Latin hypercube and with `sampling="sobol"` from scrambled Sobol
+        sequences, instead of pseudo-randomly, see `QuasiRandomGenerator`.
+
+        With `processes` larger than 1 the iteration blocks are divided over
+        as many worker processes, each with its own LCA, the results are
+        identical to those of a single process.
+
+        The sampled technosphere and biosphere amounts of the params in
+        `tech_sample_columns` and `bio_sample_columns` are kept for the GSA
+        in arrays of (iterations, columns). They are memory-mapped to files
+        in `samples_dir` if given, and to temporary files in the project
+        directory otherwise.
+
+        With `resumable`, the results and samples are streamed to a
+        `MonteCarloStore` in the project directory as the iteration blocks
+        finish. Calculating the same simulation again continues where an
+        interrupted run stopped, the results are then read lazily from disk.
+
+        The mean, standard deviation, extremes and approximate quantiles of
+        the results are kept up to date in `statistics` as the blocks
+        finish. Without `keep_results`, the results of the iterations
+        themselves are not kept, `results` is then None and only the
+        `statistics` and `get_statistics_dataframe` are available. Resumable
+        runs always keep their results, on disk.
+
+        With a `convergence` tolerance, the results are checked every
+        `convergence_interval` iterations. The simulation stops early once
+        the 95% confidence intervals of the mean and `CONVERGENCE_QUANTILES`
+        of every reference flow and method are narrower than plus or minus
+        `convergence` times their estimate. The number of iterations
+        actually calculated is kept in `iterations_used`, the results and
+        samples are trimmed to it.
+
+        `progress` is called with the number of finished and total
+        iterations whenever a block is finished. When it raises a
+        `CalculationCanceledError`, the blocks which have not started are
+        canceled and the iterations finished so far are kept, `canceled` is
+        then set. `cancel` does the same from another thread, without waiting
+        for the running blocks to finish. With `isolated`, all iterations are calculated in worker
+        processes, even with a single process, leaving only the sampling
+        setup to the calling thread.
         """
         start = time()
         self.iterations = iterations
+        self.convergence = convergence
+        self.convergence_interval = max(1, int(convergence_interval))
+        self.convergence_history = []
+        self._checked = 0
+        self.iterations_used = 0
+        self.canceled = False
+        self._stop_event = get_context("spawn").Event()
         self.seed = seed or bc.utils.get_seed()
-        self.include_technosphere = kwargs.get("technosphere", True)
-        self.include_biosphere = kwargs.get("biosphere", True)
-        self.include_cfs = kwargs.get("cf", True)
-        self.include_parameters = kwargs.get("parameters", True)
+        self.set_options(**kwargs)
 
         self.load_data()
 
-        self.results = np.zeros((iterations, len(self.func_units), len(self.methods)))
+        self.store = None
+        store = MonteCarloStore(self, self.options) if resumable else None
+        self.keep_results = keep_results or resumable
+        self.statistics = RunningStatistics(self.score_shape)
+        self.results = (
+            self._allocate("results", (iterations,) + self.score_shape, store)
+            if self.keep_results
+            else None
+        )
 
         # Reset GSA variables to empty.
-        self.A_matrices = list()
-        self.B_matrices = list()
+        temporary = samples_dir is None
+        if temporary:
+            samples_dir = os.path.join(str(bd.projects.dir), "ab_monte_carlo_samples")
+        self.tech_samples = (
+            self._allocate(
+                "technosphere_samples",
+                (iterations, len(self.tech_sample_columns)),
+                store,
+                samples_dir,
+                temporary,
+            )
+            if self.include_technosphere
+            else None
+        )
+        self.bio_samples = (
+            self._allocate(
+                "biosphere_samples",
+                (iterations, len(self.bio_sample_columns)),
+                store,
+                samples_dir,
+                temporary,
+            )
+            if self.include_biosphere
+            else None
+        )
         self.CF_dict = defaultdict(list)
         self.parameter_exchanges = list()
         self.parameters = list()
@@ -167,89 +552,467 @@ class MonteCarloLCA(object):
             for k in self.parameter_data:
                 self.parameter_data[k]["values"] = []
 
+        blocks = self.iteration_blocks(iterations, self.seed)
+        if store is not None:
+            # Restore the blocks finished by a previous run.
+            finished = list(store.finished_blocks(blocks))
+            for first, data in finished:
+                last = data.pop("last")
+                self.store_block(
+                    first, dict(data, scores=self.results[first:last], tech=[], bio=[])
+                )
+            blocks = blocks[len(finished) :]
+            if finished:
+                log.info(
+                    "Monte Carlo LCA: resuming after {} of {} iterations".format(
+                        last, iterations
+                    )
+                )
+                if self.converged(last):
+                    blocks = []
+            self.store = store
+
+        self._progress = progress
+        try:
+            if progress is not None:
+                progress(self.iterations_used, iterations)
+            if blocks and (isolated or (processes > 1 and len(blocks) > 1)):
+                self._calculate_in_processes(blocks, processes, self.options)
+            else:
+                for first, last, block_seed in blocks:
+                    block = self.calculate_block(first, last, block_seed)
+                    self.store_block(first, block)
+                    if self._finish_block(last):
+                        break
+        except CalculationCanceledError:
+            self.canceled = True
+            log.info(
+                "Monte Carlo LCA: canceled after {} iterations".format(
+                    self.iterations_used
+                )
+            )
+        finally:
+            self._progress = None
+
+        if self.iterations_used < iterations:
+            if not self.canceled:
+                log.info(
+                    "Monte Carlo LCA: converged after {} iterations".format(
+                        self.iterations_used
+                    )
+                )
+            self.trim(self.iterations_used)
+
+        log.info(
+            "Monte Carlo LCA: finished {} iterations for {} reference flows and {} methods in {} seconds.".format(
+                self.iterations_used,
+                len(self.func_units),
+                len(self.methods),
+                np.round(time() - start, 2),
+            )
+        )
+
+    @classmethod
+    def relative_half_widths(
+        cls, results: np.ndarray, quantiles: Optional[tuple] = None
+    ) -> np.ndarray:
+        """Return the half-widths of the 95% confidence intervals of the
+        mean and `quantiles` (default `CONVERGENCE_QUANTILES`) of `results`,
+        relative to their estimates.
+
+        The intervals of the quantiles are distribution-free, taken from
+        the order statistics around each quantile.
+
+        Parameters
+        ----------
+        results : Array of shape (iterations, reference flows, methods)
+
+        Returns
+        -------
+        Array of shape (1 + quantiles, reference flows, methods)
+
+        """
+        n = len(results)
+        z = cls.CONFIDENCE_Z
+        estimates = [results.mean(axis=0)]
+        widths = [z * results.std(axis=0, ddof=1) / np.sqrt(n)]
+        quantiles = cls.CONVERGENCE_QUANTILES if quantiles is None else quantiles
+        ordered = np.sort(results, axis=0) if len(quantiles) else results
+        for q in quantiles:
+            spread = z * np.sqrt(n * q * (1 - q))
+            low = int(np.clip(np.floor(n * q - spread), 0, n - 1))
+            high = int(np.clip(np.ceil(n * q + spread), 0, n - 1))
+            estimates.append(np.quantile(ordered, q, axis=0))
+            widths.append((ordered[high] - ordered[low]) / 2)
+        return relative_widths(np.array(widths), np.array(estimates))
+
+    def converged(self, iterations: int) -> bool:
+        """Apply the stopping rule to the first `iterations` results, at
+        most once every `convergence_interval` iterations.
+        """
+        if (
+            self.convergence is None
+            or iterations - self._checked < self.convergence_interval
+        ):
+            return False
+        self._checked = iterations
+        if self.results is None:
+            widths = self.statistics.relative_half_widths(
+                self.CONVERGENCE_QUANTILES, self.CONFIDENCE_Z
+            )
+        else:
+            widths = self.relative_half_widths(self.results[:iterations])
+        self.convergence_history.append((iterations, float(widths.max())))
+        return bool(widths.max() <= self.convergence)
+
+    def cancel(self) -> None:
+        """Stop a running `calculate` at the next iteration of every block,
+        in this and in the worker processes.
+        """
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def _finish_block(self, last: int) -> bool:
+        """Report the progress once the block ending at `last` is stored and
+        return whether the results have converged.
+        """
+        if self._progress is not None:
+            self._progress(self.iterations_used, self.iterations)
+        return self.converged(last)
+
+    def trim(self, iterations: int) -> None:
+        """Drop the results and samples beyond the first `iterations`."""
+        if self.results is not None:
+            self.results = self.results[:iterations]
+        if self.tech_samples is not None:
+            self.tech_samples = self.tech_samples[:iterations]
+        if self.bio_samples is not None:
+            self.bio_samples = self.bio_samples[:iterations]
+
+    @staticmethod
+    def _allocate(
+        name: str,
+        shape: tuple,
+        store: Optional[MonteCarloStore] = None,
+        directory: Optional[str] = None,
+        temporary: bool = False,
+    ) -> np.ndarray:
+        """Preallocate a result array, memory-mapped in `store` or in
+        `directory` if either is given. With `temporary`, the file in
+        `directory` is anonymous and removed once the array is released.
+        """
+        if store is not None:
+            return store.array(name, shape)
+        if directory is None or not int(np.prod(shape)):
+            return np.zeros(shape)
+        os.makedirs(directory, exist_ok=True)
+        if temporary:
+            return np.memmap(
+                tempfile.TemporaryFile(prefix=name, dir=directory),
+                dtype=np.float64,
+                mode="w+",
+                shape=shape,
+            )
+        return np.lib.format.open_memmap(
+            os.path.join(directory, name + ".npy"),
+            mode="w+",
+            dtype=np.float64,
+            shape=shape,
+        )
+
+    @property
+    def options(self) -> dict:
+        """The calculation options, see `set_options`."""
+        return {
+            "technosphere": self.include_technosphere,
+            "biosphere": self.include_biosphere,
+            "cf": self.include_cfs,
+            "parameters": self.include_parameters,
+            "solver": self.solver,
+            "tolerance": self.tolerance,
+            "sampling": self.sampling,
+        }
+
+    def set_options(self, **kwargs) -> None:
+        """Set which uncertainties are included and the solver, see `calculate`."""
+        self.include_technosphere = kwargs.get("technosphere", True)
+        self.include_biosphere = kwargs.get("biosphere", True)
+        self.include_cfs = kwargs.get("cf", True)
+        self.include_parameters = kwargs.get("parameters", True)
+        self.solver = kwargs.get("solver", "direct")
+        self.tolerance = kwargs.get("tolerance", 1e-8)
+        self.sampling = kwargs.get("sampling", "random")
+        if self.solver not in ("direct", "iterative"):
+            raise ValueError(
+                "Solver must be 'direct' or 'iterative', '{}' given.".format(
+                    self.solver
+                )
+            )
+        if self.sampling not in SAMPLING_MODES:
+            raise ValueError(
+                "Sampling must be one of {}, '{}' given.".format(
+                    ", ".join(SAMPLING_MODES), self.sampling
+                )
+            )
+
+    def draw_size(self, iterations: int) -> int:
+        """Return the number of iterations to draw random samples for at
+        once, keeping the samples of a draw below `SAMPLE_MEMORY` bytes.
+        """
+        values = 0
+        if self.include_technosphere:
+            values += len(self.lca.tech_params)
+        if self.include_biosphere:
+            values += len(self.lca.bio_params)
+        if self.include_cfs:
+            values += sum(len(params) for params in self.cf_params.values())
+        if self.include_parameters:
+            values += len(self.param_rng.parameters) + len(self.param_rng.indices)
+        per_iteration = max(values, 1) * np.dtype(np.float64).itemsize
+        return max(1, min(iterations, self.SAMPLE_MEMORY // per_iteration))
+
+    def draw_samples(self, iterations: int) -> dict:
+        """Draw the random samples of `iterations` iterations from every
+        included generator in one call.
+
+        Each array holds a contiguous row of samples per iteration.
+        """
+
+        def draw(rng: MCRandomNumberGenerator) -> np.ndarray:
+            return np.ascontiguousarray(rng.generate(iterations).T)
+
+        samples = {
+            "tech": draw(self.tech_rng) if self.include_technosphere else None,
+            "bio": draw(self.bio_rng) if self.include_biosphere else None,
+            "cf": {m: draw(rng) for m, rng in self.cf_rngs.items() if self.include_cfs},
+        }
+        if self.include_parameters:
+            samples["parameters"] = self.param_rng.next_samples(iterations)
+        return samples
+
+    def calculate_block(self, first: int, last: int, seed: int) -> dict:
+        """Calculate the iterations `first` up to `last` with the random
+        streams seeded by `seed`.
+
+        Returns the scores and the sampled values of the block, which are
+        added to the results with `store_block`.
+        """
+        self.seed_generators(seed, first)
+        if self.solver == "iterative":
+            if self.iterative_solver is None:
+                # The matrices still hold the static amounts before the
+                # first block.
+                self.iterative_solver = IterativeSolver(
+                    self.lca.technosphere_matrix, tolerance=self.tolerance
+                )
+            # Warm starts stay within a block to keep blocks independent.
+            self.iterative_solver.reset()
+        block = {
+            "scores": np.zeros((last - first,) + self.score_shape),
+            "tech": [],
+            "bio": [],
+            "cf": defaultdict(list),
+            "parameter_exchanges": [],
+            "parameters": [],
+            "parameter_values": {
+                k: [] for k in (self.parameter_data if self.include_parameters else {})
+            },
+        }
+        iterations = last - first
+        draw_size = self.draw_size(iterations)
         for iteration in range(iterations):
+            if self._stop_event is not None and self._stop_event.is_set():
+                raise CalculationCanceledError("Monte Carlo simulation canceled.")
+            i = iteration % draw_size
+            if i == 0:
+                samples = self.draw_samples(min(draw_size, iterations - iteration))
             tech_vector = (
-                self.tech_rng.next() if self.include_technosphere else self.tech_rng
+                samples["tech"][i] if self.include_technosphere else self.tech_rng
             )
-            bio_vector = self.bio_rng.next() if self.include_biosphere else self.bio_rng
+            bio_vector = samples["bio"][i] if self.include_biosphere else self.bio_rng
             if self.include_parameters:
-                # Convert the input/output keys into row/col keys, and then match them against
-                # the tech_ and bio_params
-                data = self.param_rng.next()
-                param_exchanges = self.unify_param_exchanges(data)
-
-                # Select technosphere subset from param_exchanges.
-                subset = param_exchanges[np.isin(param_exchanges["type"], [0, 1])]
-                # Create index of where to insert new values from tech_params array.
-                idx = np.argwhere(
-                    np.isin(
-                        self.lca.tech_params[self.param_cols], subset[self.param_cols]
-                    )
-                ).flatten()
-                # Construct unique array of row+col+type combinations
-                uniq = np.unique(self.lca.tech_params[idx][self.param_cols])
-                # Use the unique array to sort the subset (ensures values
-                # are inserted at the correct index)
-                sort_idx = np.searchsorted(uniq, subset[self.param_cols])
-                # Finally, insert the sorted subset amounts into the tech_vector
-                # at the correct indexes.
-                tech_vector[idx] = subset[sort_idx]["amount"]
-                # Repeat the above, but for the biosphere array.
-                subset = param_exchanges[param_exchanges["type"] == 2]
-                idx = np.argwhere(
-                    np.isin(
-                        self.lca.bio_params[self.param_cols], subset[self.param_cols]
-                    )
-                ).flatten()
-                uniq = np.unique(self.lca.bio_params[idx][self.param_cols])
-                sort_idx = np.searchsorted(uniq, subset[self.param_cols])
-                bio_vector[idx] = subset[sort_idx]["amount"]
+                # Insert the recalculated amounts of the parameterized
+                # exchanges, see `prepare_parameter_mapping`.
+                param_values, param_amounts = samples["parameters"]
+                self.param_rng.parameters.update(param_values[i])
+                amounts = param_amounts[i]
+                tech_vector[self._tech_positions] = amounts[self._tech_sources]
+                bio_vector[self._bio_positions] = amounts[self._bio_sources]
 
                 # Store parameter data for GSA
-                self.parameter_exchanges.append(param_exchanges)
-                self.parameters.append(self.param_rng.parameters.to_gsa())
+                param_exchanges = self._param_exchanges.copy()
+                param_exchanges["amount"] = amounts[self._param_sources]
+                block["parameter_exchanges"].append(param_exchanges)
+                block["parameters"].append(
+                    [
+                        gsa[:-1] + (p.amount,)
+                        for gsa, p in zip(
+                            self._gsa_parameters, self.param_rng.parameters
+                        )
+                    ]
+                )
                 # Extract sampled values for parameters, store.
-                self.param_rng.retrieve_sampled_values(self.parameter_data)
-
-            self.lca.rebuild_technosphere_matrix(tech_vector)
-            self.lca.rebuild_biosphere_matrix(bio_vector)
-
-            # store matrices for GSA
-            self.A_matrices.append(self.lca.technosphere_matrix)
-            self.B_matrices.append(self.lca.biosphere_matrix)
+                self.param_rng.retrieve_sampled_values(
+                    {
+                        k: dict(v, values=block["parameter_values"][k])
+                        for k, v in self.parameter_data.items()
+                    }
+                )
 
-            if not hasattr(self.lca, "demand_array"):
-                self.lca.build_demand_array()
-            self.lca.lci_calculation()
+            # store the sampled values of the sample columns for GSA
+            if self.include_technosphere:
+                block["tech"].append(tech_vector[self.tech_sample_columns])
+            if self.include_biosphere:
+                block["bio"].append(bio_vector[self.bio_sample_columns])
 
             # pre-calculating CF vectors enables the use of the SAME CF vector for each FU in a given run
             cf_vectors = {}
             for m in self.methods:
                 cf_vectors[m] = (
-                    self.cf_rngs[m].next() if self.include_cfs else self.cf_rngs[m]
+                    samples["cf"][m][i] if self.include_cfs else self.cf_rngs[m]
                 )
                 # store CFs for GSA (in a list defaultdict)
-                self.CF_dict[m].append(cf_vectors[m])
+                block["cf"][m].append(cf_vectors[m])
 
-            # iterate over FUs
-            for row, func_unit in self.rev_fu_index.items():
-                self.lca.redo_lci(func_unit)  # lca calculation
+            block["scores"][iteration] = self.iteration_scores(
+                tech_vector, bio_vector, cf_vectors
+            )
+        return block
 
-                # iterate over methods
-                for col, m in self.rev_method_index.items():
-                    self.lca.switch_method(m)
-                    self.lca.rebuild_characterization_matrix(cf_vectors[m])
-                    self.lca.lcia_calculation()
-                    self.results[iteration, row, col] = self.lca.score
+    def iteration_scores(
+        self,
+        tech_vector: np.ndarray,
+        bio_vector: np.ndarray,
+        cf_vectors: dict,
+        key: tuple = (),
+    ) -> np.ndarray:
+        """Calculate the scores of all reference flows and methods with the
+        sampled amounts of one iteration.
 
-        log.info(
-            "Monte Carlo LCA: finished {} iterations for {} reference flows and {} methods in {} seconds.".format(
-                iterations,
-                len(self.func_units),
-                len(self.methods),
-                np.round(time() - start, 2),
+        Returns an array of shape `score_shape`. The `key` distinguishes the
+        warm starts of the iterative solver of differing matrices.
+        """
+        if self._tech_update is None:
+            self.lca.rebuild_technosphere_matrix(tech_vector)
+        else:
+            self.update_matrix(
+                self.lca.technosphere_matrix, self._tech_update, tech_vector
             )
-        )
+        if self._bio_update is None:
+            self.lca.rebuild_biosphere_matrix(bio_vector)
+        else:
+            self.update_matrix(self.lca.biosphere_matrix, self._bio_update, bio_vector)
+
+        # All reference flows are solved at once, the direct solver
+        # factorizes every sampled technosphere matrix a single time.
+        if self.iterative_solver is None:
+            self.lca.decompose_technosphere()
+            supply = solve_demand_matrix(self.lca, self.demands)
+        else:
+            supply = np.column_stack(
+                [
+                    self.iterative_solver.solve(
+                        self.lca.technosphere_matrix,
+                        self.demands[:, row],
+                        key=key + (row,),
+                    )
+                    for row in range(len(self.func_units))
+                ]
+            )
+        inventory = self.lca.biosphere_matrix * supply
+
+        # All methods at once through the stacked characterization factors.
+        if self._cf_update is not None:
+            self.update_matrix(
+                self.stacked_cf_matrix,
+                self._cf_update,
+                np.hstack([cf_vectors[m] for m in self.methods]),
+            )
+        return np.asarray(self.stacked_cf_matrix * inventory).T
+
+    def store_block(self, first: int, block: dict) -> None:
+        """Add the results of a block calculated by `calculate_block`.
+
+        Blocks must be stored in iteration order, as the samples kept for
+        the GSA are appended.
+        """
+        last = first + len(block["scores"])
+        if self.results is not None:
+            self.results[first:last] = block["scores"]
+        self.statistics.update(block["scores"])
+        self.iterations_used = last
+        if block["tech"]:
+            self.tech_samples[first:last] = block["tech"]
+        if block["bio"]:
+            self.bio_samples[first:last] = block["bio"]
+        for m, vectors in block["cf"].items():
+            self.CF_dict[m].extend(vectors)
+        self.parameter_exchanges.extend(block["parameter_exchanges"])
+        self.parameters.extend(block["parameters"])
+        for k, values in block["parameter_values"].items():
+            self.parameter_data[k]["values"].extend(values)
+        if self.store is not None:
+            self.store.save_block(
+                first, block, [self.results, self.tech_samples, self.bio_samples]
+            )
+
+    def _calculate_in_processes(self, blocks: list, processes: int, options: dict):
+        """Calculate the iteration blocks with a pool of worker processes and
+        store their results in iteration order.
+
+        When the calculation stops early, the blocks which have not started
+        are canceled and the running ones stop at their next iteration,
+        without waiting for them.
+        """
+        with headless_workers():
+            executor = ProcessPoolExecutor(
+                max_workers=max(1, min(processes, len(blocks))),
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    (bd.projects.base_dir, bd.projects.current),
+                    type(self),
+                    self._worker_arguments(),
+                    self.seed,
+                    options,
+                    self._stop_event,
+                ),
+            )
+            futures = [executor.submit(_calculate_block, *block) for block in blocks]
+        try:
+            for (first, last, _), future in zip(blocks, futures):
+                self.store_block(first, future.result())
+                if self._finish_block(last):
+                    break
+        finally:
+            # Nothing is left to wait for after the last block, or the
+            # remaining blocks are no longer needed.
+            self._stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _worker_arguments(self) -> tuple:
+        """Positional arguments with which a worker process reconstructs this
+        object, see `_calculate_in_processes`.
+        """
+        return (self.cs_name,)
+
+    @property
+    def score_shape(self) -> tuple:
+        """The shape of the scores of a single iteration."""
+        return len(self.func_units), len(self.methods)
+
+    def current_view(self, array: np.ndarray) -> np.ndarray:
+        """Select the reference flows and methods shown by `get_results_by`
+        and `get_statistics_dataframe` from an array of scores.
+        """
+        return array
+
+    @property
+    def current_results(self) -> np.ndarray:
+        """The results of all iterations, reference flows and methods shown
+        by `get_results_by`.
+        """
+        return self.current_view(self.results)
 
     @property
     def func_units_dict(self) -> dict:
@@ -264,7 +1027,11 @@ class MonteCarloLCA(object):
         - if nothing is given, all results are returned
         """
 
-        if not self.results.any():
+        if self.results is None:
+            raise ValueError(
+                "The results of the iterations were not kept, only their statistics."
+            )
+        if not len(self.results):
             raise ValueError("You need to perform a Monte Carlo Simulation first.")
             return None
 
@@ -275,15 +1042,16 @@ class MonteCarloLCA(object):
             method_index = self.method_index.get(method)
             log.info("Method provided", method, method_index)
 
+        results = self.current_results
         if not act_key and not method:
-            return self.results
+            return results
         elif act_key and not method:
-            return np.squeeze(self.results[:, act_index, :])
+            return np.squeeze(results[:, act_index, :])
         elif method and not act_key:
-            return np.squeeze(self.results[:, :, method_index])
+            return np.squeeze(results[:, :, method_index])
         elif method and act_key:
             log.info(act_index, method_index)
-            return np.squeeze(self.results[:, act_index, method_index])
+            return np.squeeze(results[:, act_index, method_index])
 
     def get_results_dataframe(self, act_key=None, method=None, labelled=True):
         """Return a Pandas DataFrame with results for all runs either for
@@ -294,7 +1062,11 @@ class MonteCarloLCA(object):
         readable format.
         """
 
-        if not self.results.any():
+        if self.results is None:
+            raise ValueError(
+                "The results of the iterations were not kept, only their statistics."
+            )
+        if not len(self.results):
             raise ValueError("You need to perform a Monte Carlo Simulation first.")
             return None
 
@@ -315,6 +1087,52 @@ class MonteCarloLCA(object):
 
         return df
 
+    def statistics_summary(self) -> dict:
+        """Return the mean, standard deviation, extremes and
+        `SUMMARY_QUANTILES` of the results so far, each an array of shape
+        `score_shape`.
+
+        The quantiles are approximate, see `RunningStatistics`.
+        """
+        if self.statistics is None or not self.statistics.count:
+            raise ValueError("You need to perform a Monte Carlo Simulation first.")
+        stats = self.statistics
+        summary = {"mean": stats.mean, "std": stats.std, "min": stats.minimum}
+        quantiles = stats.quantile(self.SUMMARY_QUANTILES)
+        for q, values in zip(self.SUMMARY_QUANTILES, quantiles):
+            summary["{:g}%".format(q * 100)] = values
+        summary["max"] = stats.maximum
+        return summary
+
+    def get_statistics_dataframe(
+        self,
+        act_key=None,
+        method=None,
+        labelled=True,
+        summary: Optional[dict] = None,
+    ) -> pd.DataFrame:
+        """Return a Pandas DataFrame with the `statistics_summary`, or the
+        given `summary`, either for
+        - all reference flows and a selected impact category or
+        - all impact categories and a selected reference flow.
+        """
+        if act_key and method or not act_key and not method:
+            raise ValueError("Must provide activity key or method, but not both.")
+        summary = self.statistics_summary() if summary is None else summary
+
+        if method:
+            select = (slice(None), self.method_index[method])
+            labels = self.activity_keys
+            if labelled:
+                labels = self.get_labels(labels, max_length=20)
+        else:
+            select = (self.activity_index[act_key], slice(None))
+            labels = self.methods
+        return pd.DataFrame(
+            {k: self.current_view(v)[select] for k, v in summary.items()},
+            index=labels,
+        )
+
     @staticmethod
     def get_labels(
         key_list, fields: list = None, separator=" | ", max_length: int = None
@@ -330,6 +1148,34 @@ class MonteCarloLCA(object):
         return translated_keys
 
 
+# The Monte Carlo LCA of a worker process of `MonteCarloLCA.calculate`.
+_worker_mc: Optional[MonteCarloLCA] = None
+
+
+def _init_worker(
+    project: tuple, cls, args: tuple, seed: int, options: dict, stop_event
+) -> None:
+    """Load the data of the Monte Carlo LCA once per worker process.
+
+    The `project` is given as the (data directory, project name).
+    """
+    global _worker_mc
+    open_project(*project)
+    _worker_mc = cls(*args)
+    _worker_mc.seed = seed
+    _worker_mc._stop_event = stop_event
+    _worker_mc.set_options(**options)
+    _worker_mc.load_data()
+    if _worker_mc.include_parameters:
+        _worker_mc.parameter_data = _worker_mc.param_rng.extract_active_parameters(
+            _worker_mc.lca
+        )
+
+
+def _calculate_block(first: int, last: int, seed: int) -> dict:
+    return _worker_mc.calculate_block(first, last, seed)
+
+
 def perform_MonteCarlo_LCA(project="default", cs_name=None, iterations=10):
     """Performs Monte Carlo LCA based on a calculation setup and returns the
     Monte Carlo LCA object."""
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pickle
+import shutil
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from activity_browser import log
+from activity_browser.mod import bw2data as bd
+
+
+class MonteCarloStore(object):
+    """Persistent, resumable storage of a Monte Carlo run in the project
+    directory.
+
+    Each run is a directory named after a hash of everything its results
+    depend on: the calculation setup, the number of iterations, the seed,
+    the calculation options and the params arrays of all matrices. Running
+    the same simulation again therefore continues in the same directory.
+
+    The results and the sampled technosphere and biosphere amounts are
+    memory-mapped `.npy` files, written as the iteration blocks finish. The
+    other data of each finished block is pickled into its own file once the
+    arrays are flushed, so a block is either stored completely or not at
+    all. The random state of a block is fully determined by its seed, see
+    `MonteCarloLCA.iteration_blocks`, so an interrupted run is resumed by
+    calculating the missing blocks only.
+    """
+
+    VERSION = 4
+    MAX_ENTRIES = 10
+
+    def __init__(self, mc, options: dict):
+        self.directory = os.path.join(str(bd.projects.dir), "ab_monte_carlo")
+        self.path = os.path.join(self.directory, self.run_key(mc, options))
+        os.makedirs(self.path, exist_ok=True)
+        # Mark the run as recently used for pruning.
+        os.utime(self.path)
+        self.prune()
+
+    @classmethod
+    def run_key(cls, mc, options: dict) -> str:
+        """Hash the Monte Carlo settings and the loaded data of `mc`."""
+        digest = hashlib.sha256()
+        digest.update(
+            repr(
+                (
+                    cls.VERSION,
+                    mc.cs["inv"],
+                    mc.cs["ia"],
+                    mc.iterations,
+                    mc.seed,
+                    mc.BLOCK_SIZE,
+                    sorted(options.items()),
+                )
+            ).encode()
+        )
+        digest.update(mc.lca.tech_params.tobytes())
+        digest.update(mc.lca.bio_params.tobytes())
+        for params in mc.cf_params.values():
+            digest.update(params.tobytes())
+        if mc.include_parameters:
+            digest.update(mc.param_rng.uncertainties.tobytes())
+        if hasattr(mc, "scenario_names"):
+            digest.update(repr((mc.scenario_names, list(mc.indices))).encode())
+            digest.update(mc.values.tobytes())
+        return digest.hexdigest()
+
+    def array(self, name: str, shape: tuple) -> np.ndarray:
+        """Open, or create if missing, a memory-mapped array of the run."""
+        path = os.path.join(self.path, name + ".npy")
+        if os.path.isfile(path):
+            array = np.load(path, mmap_mode="r+")
+            if array.shape == shape:
+                return array
+            del array
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape)
+
+    def _block_path(self, first: int) -> str:
+        return os.path.join(self.path, "block_{:08d}.pkl".format(first))
+
+    def save_block(self, first: int, block: dict, arrays: list) -> None:
+        """Flush the memory-mapped `arrays` and store the remaining data of
+        a block, marking it as finished.
+        """
+        for array in arrays:
+            if isinstance(array, np.memmap):
+                array.flush()
+        data = {k: v for k, v in block.items() if k not in ("scores", "tech", "bio")}
+        data["last"] = first + len(block["scores"])
+        tmp = self._block_path(first) + ".tmp"
+        with open(tmp, "wb") as outfile:
+            pickle.dump(data, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._block_path(first))
+
+    def finished_blocks(self, blocks: list) -> Iterator[Tuple[int, dict]]:
+        """Yield (first, data) of the finished blocks at the start of
+        `blocks`, in iteration order.
+        """
+        for first, _, _ in blocks:
+            try:
+                with open(self._block_path(first), "rb") as infile:
+                    data = pickle.load(infile)
+            except FileNotFoundError:
+                return
+            except (OSError, pickle.UnpicklingError, EOFError) as e:
+                log.warning(f"Could not read Monte Carlo block {first}: {e}")
+                return
+            yield first, data
+
+    def prune(self) -> None:
+        """Remove the least recently used runs beyond `MAX_ENTRIES`."""
+        entries = sorted(
+            (os.path.join(self.directory, d) for d in os.listdir(self.directory)),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for entry in entries[self.MAX_ENTRIES :]:
+            shutil.rmtree(entry, ignore_errors=True)
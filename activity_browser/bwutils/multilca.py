@@ -1,21 +1,21 @@
-from collections import OrderedDict
-from typing import Iterable, Optional, Union
+from typing import Callable, Iterable, Optional, Sequence, Union
 
-import bw2analyzer as ba
 import bw2calc as bc
 import numpy as np
 import pandas as pd
-from PySide2.QtWidgets import QApplication, QMessageBox
+from scipy import sparse
 
 from activity_browser import log
 from activity_browser.mod import bw2data as bd
 from activity_browser.mod.bw2data.backends import ActivityDataset
 
 from .commontasks import wrap_text
+from .compact import CompactContributionArray
 from .errors import ReferenceFlowValueError
+from .lazy import LazyMatrixDict
 from .metadata import AB_metadata
-
-ca = ba.ContributionAnalysis()
+from .parallel import calculate_in_processes
+from .solvers import build_demand_matrix, solve_demand_matrix
 
 
 class MLCA(object):
@@ -38,6 +38,26 @@ class MLCA(object):
     ----------
     cs_name : str
         Name of the calculation setup
+    batched : bool
+        Solve all reference flows as one block of demand vectors against a
+        single factorization instead of calling `redo_lci` per reference flow
+    cache_size : int, optional
+        Memory budget in bytes for each of the caches of `inventories` and
+        `characterized_inventories`, defaults to `INVENTORY_CACHE_SIZE`
+    contribution_storage : str
+        Either 'dense' (default) or one of the `CompactContributionArray`
+        modes 'sparse', 'topk' or 'float32' to store the contribution arrays
+        in less memory
+    contribution_top_n : int
+        Number of contributors kept per vector with 'topk' storage
+    cached : dict, optional
+        Previously calculated results loaded by `MLCAResultsCache`, the
+        calculation is then skipped and the LCA is only constructed on access
+    processes : int
+        Number of worker processes over which the reference flows (and
+        scenarios) are divided, see `calculate_in_processes`. Only worthwhile
+        for large setups, as every worker constructs and factorizes its own
+        LCA
 
     Attributes
     ----------
@@ -64,6 +84,12 @@ class MLCA(object):
         calculations
     method_matrices: list
         Contains the characterization matrix for each impact category.
+    stacked_cf_matrix: `scipy.sparse.csr_matrix`
+        The characterization factors of all impact categories stacked into
+        one matrix of shape (`methods`, `biosphere`)
+    impact_intensities: `scipy.sparse.csr_matrix`
+        The characterized biosphere matrix of shape (`methods`, `activities`),
+        holding the direct impact of one unit of each activity
     lca_scores: `numpy.ndarray`
         2-dimensional array of shape (`func_units`, `methods`) holding the
         calculated LCA scores of each combination of reference flow and
@@ -80,11 +106,13 @@ class MLCA(object):
         Contains the calculated technosphere flows per reference flow
     inventory: dict
         Life cycle inventory (biosphere flows) per reference flow
-    inventories: dict
-        Biosphere flows per reference flow and impact category combination
-    characterized_inventories: dict
+    inventories: `LazyMatrixDict`
+        Biosphere flows per reference flow and impact category combination,
+        calculated from the scaling factors when accessed
+    characterized_inventories: `LazyMatrixDict`
         Inventory multiplied by scaling (relative impact on environment) per
-        reference flow and impact category combination
+        reference flow and impact category combination, calculated from the
+        scaling factors when accessed
     elementary_flow_contributions: `numpy.ndarray`
         3-dimensional array of shape (`func_units`, `methods`, `biosphere`)
         which holds the characterized inventory results summed along the
@@ -105,10 +133,25 @@ class MLCA(object):
     ------
     ValueError
         If the given `cs_name` cannot be found in brightway calculation_setups
+    ReferenceFlowValueError
+        If any of the reference flows has an amount of 0
 
     """
 
-    def __init__(self, cs_name: str):
+    INVENTORY_CACHE_SIZE = 256 * 1024**2
+    # Progress callback of a running `calculate`, see `_report_progress`
+    _progress: Optional[Callable[[int, int], None]] = None
+
+    def __init__(
+        self,
+        cs_name: str,
+        batched: bool = True,
+        cache_size: Optional[int] = None,
+        contribution_storage: str = "dense",
+        contribution_top_n: int = 100,
+        cached: Optional[dict] = None,
+        processes: int = 1,
+    ):
         try:
             cs = bd.calculation_setups[cs_name]
         except KeyError:
@@ -118,17 +161,38 @@ class MLCA(object):
         # cs['inv'] contains all reference flows (rf),
         # all values of rf are the individual reference flow items.
         if [v for rf in cs["inv"] for v in rf.values() if v == 0]:
-            msg = QMessageBox()
-            msg.setWindowTitle("Reference flows equal 0")
-            msg.setText("All reference flows must be non-zero.")
-            msg.setInformativeText(
-                "Please enter a valid value before calculating LCA results again."
+            raise ReferenceFlowValueError(
+                "All reference flows must be non-zero.",
+                "Please enter a valid value before calculating LCA results again.",
             )
-            msg.setIcon(QMessageBox.Warning)
-            QApplication.restoreOverrideCursor()
-            msg.exec_()
-            raise ReferenceFlowValueError("Reference flow == 0")
 
+        self.batched = batched
+        self.processes = processes
+        self.contribution_storage = contribution_storage
+        self.contribution_top_n = contribution_top_n
+
+        self.cs_name = cs_name
+        self._set_indexes(cs)
+
+        # Inventory (biosphere flows) for specific reference flow (e.g. 2000x15000) and impact category.
+        # These matrices are large, so they are recalculated from the scaling
+        # factors on access and only the most recently used ones are kept.
+        cache_size = cache_size or self.INVENTORY_CACHE_SIZE
+        self.inventories = LazyMatrixDict(self._inventory_matrix, cache_size)
+        # Inventory multiplied by scaling (relative impact on environment) per impact category.
+        self.characterized_inventories = LazyMatrixDict(
+            self._characterized_inventory, cache_size
+        )
+
+        self._lca = None
+        self.restored = cached is not None
+        if self.restored:
+            self._restore_results(cached)
+        else:
+            self._prepare_results()
+
+    def _set_indexes(self, cs: dict) -> None:
+        """Set the reference flows, methods and their indexes of the setup."""
         # reference flows and related indexes
         self.func_units = cs["inv"]
         self.fu_activity_keys = [list(fu.keys())[0] for fu in self.func_units]
@@ -140,13 +204,40 @@ class MLCA(object):
         self.method_index = {m: i for i, m in enumerate(self.methods)}
         self.rev_method_index = {v: k for k, v in self.method_index.items()}
 
+        self.func_unit_translation_dict = {}
+        for fu in self.func_units:
+            key = next(iter(fu))
+            amount = fu[key]
+            act = bd.get_activity(key)
+            self.func_unit_translation_dict[
+                (
+                    f'{act["name"]} | '
+                    f'{act["reference product"]} | '
+                    f'{act["location"]} | '
+                    f'{act["database"]} | '
+                    f"{amount}"
+                )
+            ] = fu
+        self.func_key_dict = {
+            m: i for i, m in enumerate(self.func_unit_translation_dict.keys())
+        }
+        self.func_key_list = list(self.func_unit_translation_dict.keys())
+
+    def _prepare_results(self) -> None:
+        """Construct the LCA, characterization matrices and the empty result
+        containers that are filled by the calculation.
+        """
         # initial LCA and prepare method matrices
-        self.lca = self._construct_lca()
-        self.lca.lci(factorize=True)
         self.method_matrices = []
         for method in self.methods:
             self.lca.switch_method(method)
             self.method_matrices.append(self.lca.characterization_matrix)
+        # All characterization factors stacked as one (methods x biosphere)
+        # matrix, so every impact category is calculated in one product.
+        self.stacked_cf_matrix = sparse.csr_matrix(
+            np.vstack([cf_matrix.diagonal() for cf_matrix in self.method_matrices])
+        )
+        self.impact_intensities = None
 
         self.lca_scores = np.zeros((len(self.func_units), len(self.methods)))
 
@@ -162,20 +253,16 @@ class MLCA(object):
         self.technosphere_flows = dict()
         # Life cycle inventory (biosphere flows) by reference flow
         self.inventory = dict()
-        # Inventory (biosphere flows) for specific reference flow (e.g. 2000x15000) and impact category.
-        self.inventories = dict()
-        # Inventory multiplied by scaling (relative impact on environment) per impact category.
-        self.characterized_inventories = dict()
 
         # Summarized contributions for EF and processes.
-        self.elementary_flow_contributions = np.zeros(
+        self.elementary_flow_contributions = self._contribution_array(
             (
                 len(self.func_units),
                 len(self.methods),
                 self.lca.biosphere_matrix.shape[0],
             )
         )
-        self.process_contributions = np.zeros(
+        self.process_contributions = self._contribution_array(
             (
                 len(self.func_units),
                 len(self.methods),
@@ -183,24 +270,181 @@ class MLCA(object):
             )
         )
 
-        self.func_unit_translation_dict = {}
-        for fu in self.func_units:
-            key = next(iter(fu))
-            amount = fu[key]
-            act = bd.get_activity(key)
-            self.func_unit_translation_dict[
-                (
-                    f'{act["name"]} | '
-                    f'{act["reference product"]} | '
-                    f'{act["location"]} | '
-                    f'{act["database"]} | '
-                    f"{amount}"
+    def _restore_results(self, cached: dict) -> None:
+        """Restore calculated results, see `MLCAResultsCache`.
+
+        The LCA object is not constructed here, only when it is accessed.
+        """
+        self.stacked_cf_matrix = cached["stacked_cf_matrix"]
+        self.impact_intensities = cached["impact_intensities"]
+        self.method_matrices = []
+        for row in range(self.stacked_cf_matrix.shape[0]):
+            cfs = self.stacked_cf_matrix.getrow(row)
+            self.method_matrices.append(
+                sparse.csr_matrix(
+                    (cfs.data, (cfs.indices, cfs.indices)),
+                    shape=(cfs.shape[1], cfs.shape[1]),
                 )
-            ] = fu
-        self.func_key_dict = {
-            m: i for i, m in enumerate(self.func_unit_translation_dict.keys())
-        }
-        self.func_key_list = list(self.func_unit_translation_dict.keys())
+            )
+        self.lca_scores = cached["lca_scores"]
+        self.rev_activity_dict = cached["rev_activity_dict"]
+        self.rev_product_dict = cached["rev_product_dict"]
+        self.rev_biosphere_dict = cached["rev_biosphere_dict"]
+        self.scaling_factors = dict()
+        self.technosphere_flows = dict()
+        self.inventory = dict()
+        for row, func_unit in enumerate(self.func_units):
+            key = str(func_unit)
+            self.scaling_factors[key] = cached["scaling_factors"][row]
+            self.technosphere_flows[key] = cached["technosphere_flows"][row]
+            self.inventory[key] = cached["inventory"][row]
+            self.inventories.add(key)
+            for col in range(len(self.methods)):
+                self.characterized_inventories.add((row, col))
+        self.elementary_flow_contributions = cached["elementary_flow_contributions"]
+        self.process_contributions = cached["process_contributions"]
+
+    def update_setup(self) -> bool:
+        """Bring the results in line with the current contents of the
+        calculation setup without recalculating what is already known.
+
+        Results of reference flows and methods that were removed from the
+        setup are sliced out. A new method is calculated from the stored
+        inventories and scaling factors, a new reference flow is solved
+        against the existing factorization.
+
+        Returns whether the results could be updated. They cannot when a new
+        reference flow requires databases outside of the current matrices or
+        the contributions are not stored densely, the results are then left
+        as they are and the setup should be recalculated.
+        """
+        cs = bd.calculation_setups.get(self.cs_name)
+        if (
+            not cs
+            or not cs["inv"]
+            or not cs["ia"]
+            or [v for rf in cs["inv"] for v in rf.values() if v == 0]
+        ):
+            return False
+        if not all(
+            isinstance(a, np.ndarray)
+            for a in (self.elementary_flow_contributions, self.process_contributions)
+        ):
+            return False
+        old_fus = [str(fu) for fu in self.func_units]
+        fu_take = [
+            old_fus.index(str(fu)) if str(fu) in old_fus else -1 for fu in cs["inv"]
+        ]
+        m_take = [self.method_index.get(m, -1) for m in cs["ia"]]
+        try:
+            # Also constructs the LCA of restored results for the old setup.
+            build_demand_matrix(
+                self.lca, [fu for fu, i in zip(cs["inv"], fu_take) if i < 0]
+            )
+        except Exception:
+            # A new reference flow is not part of the current matrices.
+            return False
+
+        # Drop the stored inventories of removed reference flows.
+        for row in set(range(len(old_fus))) - set(fu_take):
+            for _, key in self._result_keys(row):
+                for store in (
+                    self.scaling_factors,
+                    self.technosphere_flows,
+                    self.inventory,
+                ):
+                    store.pop(key, None)
+                self.inventories.discard(key)
+
+        # Characterization matrices in the order of the new setup.
+        method_matrices = []
+        for method, i in zip(cs["ia"], m_take):
+            if i < 0:
+                self.lca.switch_method(method)
+                method_matrices.append(self.lca.characterization_matrix)
+            else:
+                method_matrices.append(self.method_matrices[i])
+        self.method_matrices = method_matrices
+        self.stacked_cf_matrix = sparse.csr_matrix(
+            np.vstack([cf_matrix.diagonal() for cf_matrix in self.method_matrices])
+        )
+        self._build_impact_intensities()
+
+        # Keep the results of existing reference flow and method combinations.
+        kept_rows = [row for row, i in enumerate(fu_take) if i >= 0]
+        kept_cols = [col for col, i in enumerate(m_take) if i >= 0]
+        block = np.ix_(kept_rows, kept_cols)
+        old_block = np.ix_(
+            [fu_take[r] for r in kept_rows], [m_take[c] for c in kept_cols]
+        )
+        for name in (
+            "lca_scores",
+            "elementary_flow_contributions",
+            "process_contributions",
+        ):
+            old = getattr(self, name)
+            array = np.zeros((len(cs["inv"]), len(cs["ia"])) + old.shape[2:])
+            array[block] = old[old_block]
+            setattr(self, name, array)
+
+        self._set_indexes(cs)
+        self.characterized_inventories.clear()
+        for row in kept_rows:
+            for index, _ in self._result_keys(row):
+                for col in range(len(self.methods)):
+                    self.characterized_inventories.add((row, col, *index[1:]))
+
+        # New methods only require the stored inventories and scaling factors.
+        new_cols = [col for col, i in enumerate(m_take) if i < 0]
+        if new_cols:
+            cfs = self.stacked_cf_matrix[new_cols]
+            for row in kept_rows:
+                for index, key in self._result_keys(row):
+                    idx = (row, new_cols) + tuple(index[1:])
+                    inventory = self.inventory[key]
+                    self.lca_scores[idx] = cfs * inventory
+                    self.elementary_flow_contributions[idx] = (
+                        cfs * sparse.diags(inventory)
+                    ).toarray()
+                    self.process_contributions[idx] = (
+                        cfs
+                        * self._biosphere_matrix(key)
+                        * sparse.diags(self.scaling_factors[key])
+                    ).toarray()
+
+        # New reference flows are solved against the existing factorization.
+        new_rows = [row for row, i in enumerate(fu_take) if i < 0]
+        if new_rows:
+            self._calculate_chunk(new_rows)
+        return True
+
+    def _result_keys(self, row: int) -> list:
+        """Return the (index, key) of the stored results of the reference flow
+        at `row`, see `_store_results`.
+        """
+        return [((row,), self._inventory_key(row))]
+
+    @property
+    def lca(self):
+        """The brightway LCA object, constructed and factorized on first use."""
+        if self._lca is None:
+            self._lca = self._construct_lca()
+            self._lca.lci(factorize=True)
+        return self._lca
+
+    @lca.setter
+    def lca(self, lca) -> None:
+        self._lca = lca
+
+    def _contribution_array(
+        self, shape: tuple
+    ) -> Union[np.ndarray, CompactContributionArray]:
+        """Create an empty contribution array in the configured storage."""
+        if self.contribution_storage == "dense":
+            return np.zeros(shape)
+        return CompactContributionArray(
+            shape, mode=self.contribution_storage, top_n=self.contribution_top_n
+        )
 
     def _construct_lca(self):
         return bc.LCA(demand=self.func_units_dict, method=self.methods[0])
@@ -208,52 +452,167 @@ class MLCA(object):
     def _perform_calculations(self):
         """Isolates the code which performs calculations to allow subclasses
         to either alter the code or redo calculations after matrix substitution.
+
+        With more than one process the calculation is divided over a pool of
+        worker processes, which requires dense contribution arrays.
         """
-        for row, func_unit in enumerate(self.func_units):
-            # Do the LCA for the current reference flow
-            try:
-                self.lca.redo_lci(func_unit)
-            except:
-                # bw25 compatibility
-                key = list(func_unit.keys())[0]
-                self.lca.redo_lci({bd.get_activity(key).id: func_unit[key]})
-
-            # Now update the:
-            # - Scaling factors
-            # - Technosphere flows
-            # - Life cycle inventory
-            # - Life-cycle inventory (disaggregated by contributing process)
-            # for current reference flow
-            self.scaling_factors.update({str(func_unit): self.lca.supply_array})
-            self.technosphere_flows.update(
-                {
-                    str(func_unit): np.multiply(
-                        self.lca.supply_array, self.lca.technosphere_matrix.diagonal()
-                    )
-                }
+        if self.processes > 1:
+            if self.contribution_storage == "dense":
+                calculate_in_processes(self, self.processes)
+                return
+            log.warning(
+                "Parallel calculation requires dense contribution arrays, "
+                "calculating in a single process."
             )
-            self.inventory.update(
-                {str(func_unit): np.array(self.lca.inventory.sum(axis=1)).ravel()}
+        self._calculate_chunk(range(len(self.func_units)))
+
+    def _calculate_chunk(self, rows: Sequence[int], columns=None) -> None:
+        """Calculate and store the results of the reference flows at `rows`.
+
+        `columns` selects scenarios in subclasses and is ignored here.
+        """
+        self._build_impact_intensities()
+        func_units = [self.func_units[row] for row in rows]
+        if self.batched:
+            supply = solve_demand_matrix(
+                self.lca, build_demand_matrix(self.lca, func_units)
             )
-            self.inventories.update({str(func_unit): self.lca.inventory})
-
-            # Now, for each method, take the current reference flow and do inventory analysis
-            for col, cf_matrix in enumerate(self.method_matrices):
-                self.lca.characterization_matrix = cf_matrix
-                self.lca.lcia_calculation()
-                self.lca_scores[row, col] = self.lca.score
-                self.characterized_inventories[row, col] = (
-                    self.lca.characterized_inventory.copy()
-                )
-                self.elementary_flow_contributions[row, col] = np.array(
-                    self.lca.characterized_inventory.sum(axis=1)
-                ).ravel()
-                self.process_contributions[row, col] = (
-                    self.lca.characterized_inventory.sum(axis=0)
-                )
+        for i, (row, func_unit) in enumerate(zip(rows, func_units)):
+            if self.batched:
+                supply_array = supply[:, i]
+            else:
+                # Do the LCA for the current reference flow
+                try:
+                    self.lca.redo_lci(func_unit)
+                except:
+                    # bw25 compatibility
+                    key = list(func_unit.keys())[0]
+                    self.lca.redo_lci({bd.get_activity(key).id: func_unit[key]})
+                supply_array = self.lca.supply_array
+            self._store_results(str(func_unit), (row,), supply_array)
+            self._report_progress(i + 1, len(rows))
+
+    def _worker_arguments(self) -> tuple:
+        """Positional arguments with which a worker process reconstructs this
+        object, see `calculate_in_processes`.
+        """
+        return (self.cs_name,)
+
+    def _report_progress(self, done: int, total: int) -> None:
+        """Pass the number of finished calculation steps to the progress
+        callback of `calculate`, if one was given.
+        """
+        if self._progress is not None:
+            self._progress(done, total)
 
-    def calculate(self):
-        self._perform_calculations()
+    def _build_impact_intensities(self) -> None:
+        """Multiply the stacked characterization factors with the biosphere
+        matrix, needs to be redone whenever the biosphere matrix changes.
+        """
+        self.impact_intensities = sparse.csr_matrix(
+            self.stacked_cf_matrix * self.lca.biosphere_matrix
+        )
+
+    def _store_results(self, key, index: tuple, supply_array: np.ndarray) -> None:
+        """Store the results of a reference flow given its supply vector.
+
+        The scores and contributions of all impact categories are calculated
+        at once from the supply vector through the stacked characterization
+        factors and the impact intensities.
+
+        Parameters
+        ----------
+        key : Key under which the inventory results are stored
+        index : Position of the reference flow (and scenario) in the result
+            arrays, the method index is inserted as second axis
+        supply_array : The scaling factors of the reference flow
+        """
+        inventory = self.lca.biosphere_matrix * supply_array
+        technosphere_flows = np.multiply(
+            supply_array, self.lca.technosphere_matrix.diagonal()
+        )
+        self._register_results(key, index, supply_array, technosphere_flows, inventory)
+
+        # Now, for all methods at once, take the current reference flow and do inventory analysis
+        idx = (index[0], slice(None)) + tuple(index[1:])
+        self.lca_scores[idx] = self.impact_intensities * supply_array
+        self.elementary_flow_contributions[idx] = (
+            self.stacked_cf_matrix * sparse.diags(inventory)
+        ).toarray()
+        self.process_contributions[idx] = (
+            self.impact_intensities * sparse.diags(supply_array)
+        ).toarray()
+
+    def _register_results(
+        self,
+        key,
+        index: tuple,
+        supply_array: np.ndarray,
+        technosphere_flows: np.ndarray,
+        inventory: np.ndarray,
+    ) -> None:
+        """Store the inventory results of a reference flow and register the
+        inventory matrices which can be calculated from them.
+        """
+        # Now update the:
+        # - Scaling factors
+        # - Technosphere flows
+        # - Life cycle inventory
+        # - Life-cycle inventory (disaggregated by contributing process)
+        # for current reference flow
+        self.scaling_factors.update({key: supply_array})
+        self.technosphere_flows.update({key: technosphere_flows})
+        self.inventory.update({key: inventory})
+        self.inventories.add(key)
+        for col in range(len(self.methods)):
+            self.characterized_inventories.add((index[0], col, *index[1:]))
+
+    def _inventory_key(self, row: int, *args):
+        """Return the key of the stored inventory results for the reference
+        flow at `row`.
+        """
+        return str(self.func_units[row])
+
+    def _biosphere_matrix(self, key) -> sparse.spmatrix:
+        """Return the biosphere matrix used to calculate the results under `key`."""
+        return self.lca.biosphere_matrix
+
+    def _inventory_matrix(self, key) -> sparse.spmatrix:
+        """Recalculate the inventory matrix of a reference flow from its
+        stored scaling factors.
+        """
+        supply_array = self.scaling_factors[key]
+        count = len(supply_array)
+        return self._biosphere_matrix(key) * sparse.spdiags(
+            [supply_array], [0], count, count
+        )
+
+    def _characterized_inventory(self, index: tuple) -> sparse.spmatrix:
+        """Recalculate the characterized inventory for the reference flow,
+        method (and scenario) given by `index`.
+        """
+        row, col, *args = index
+        inventory = self.inventories[self._inventory_key(row, *args)]
+        return self.method_matrices[col] * inventory
+
+    def calculate(self, progress: Optional[Callable[[int, int], None]] = None):
+        """Calculate the results of all reference flows and impact categories.
+
+        Parameters
+        ----------
+        progress : Optional callable which is called with the number of
+            finished and total calculation steps (reference flows, times
+            scenarios for scenario LCA). An exception raised by it, e.g. a
+            `CalculationCanceledError`, stops the calculation.
+
+        """
+        if self.restored:
+            return
+        self._progress = progress
+        try:
+            self._perform_calculations()
+        finally:
+            self._progress = None
 
     @property
     def func_units_dict(self) -> dict:
@@ -263,20 +622,7 @@ class MLCA(object):
     @property
     def all_databases(self) -> set:
         """Get all databases linked to the reference flows."""
-
-        def get_dependents(dbs: set, dependents: list) -> set:
-            for dep in (bd.databases[db].get("depends", []) for db in dependents):
-                if not dbs.issuperset(dep):
-                    dbs = get_dependents(dbs.union(dep), dep)
-            return dbs
-
-        dbs = set(f[0] for f in self.fu_activity_keys)
-        dbs = get_dependents(dbs, list(dbs))
-        # In rare cases, the default biosphere is not found as a dependency, see:
-        # https://github.com/LCA-ActivityBrowser/activity-browser/issues/298
-        # Always include it.
-        dbs.add(bd.config.biosphere)
-        return dbs
+        return get_dependent_databases(self.fu_activity_keys)
 
     def get_results_for_method(self, index: int = 0) -> pd.DataFrame:
         data = self.lca_scores[:, index]
@@ -383,16 +729,27 @@ class Contributions(object):
         self.aggregate_data = {
             "biosphere": (
                 self.mlca.rev_biosphere_dict,
-                self.mlca.lca.biosphere_dict,
+                self.mlca.rev_biosphere_dict.values(),
                 self.ef_fields,
             ),
             "technosphere": (
                 self.mlca.rev_activity_dict,
-                self.mlca.lca.activity_dict,
+                self.mlca.rev_activity_dict.values(),
                 self.act_fields,
             ),
         }
 
+    def update_setup(self) -> None:
+        """Pick up the reference flows of the MLCA after `MLCA.update_setup`."""
+        self.mlca.get_all_metadata()
+        for inventory, (data, rev_dict, _, fields) in self.inventory_data.items():
+            self.inventory_data[inventory] = (
+                data,
+                rev_dict,
+                self.mlca.fu_activity_keys,
+                fields,
+            )
+
     def normalize(self, contribution_array: np.ndarray) -> np.ndarray:
         """Normalise the contribution array.
 
@@ -408,46 +765,92 @@ class Contributions(object):
         scores = abs(contribution_array.sum(axis=1, keepdims=True))
         return contribution_array / scores
 
-    def _build_dict(
+    @staticmethod
+    def _select_top(absolute: np.ndarray, limit: Union[int, float], limit_type: str):
+        """Return a boolean mask of the top-contributing flows in every row of
+        the absolute contribution array.
+
+        * 'number': the `limit` largest contributors
+        * 'percent': contributors of at least `limit` times the row total
+        * 'cum_percent': the largest contributors which together make up
+          `limit` times the row total
+
+        Totals are the summed absolute contributions, as in
+        `bw2analyzer.ContributionAnalysis.sort_array`.
+        """
+        selected = np.zeros(absolute.shape, dtype=bool)
+        if limit_type == "number":
+            k = min(int(limit), absolute.shape[1])
+            if k > 0:
+                top = np.argpartition(-absolute, k - 1, axis=1)[:, :k]
+                np.put_along_axis(selected, top, True, axis=1)
+            return selected
+        if limit_type not in ("percent", "cum_percent"):
+            raise ValueError(
+                "Limit type must be 'number', 'percent' or 'cum_percent', "
+                "'{}' given.".format(limit_type)
+            )
+        if not 0 < limit <= 1:
+            raise ValueError("Percentage limits must be between 0 and 1.")
+        cutoff = absolute.sum(axis=1, keepdims=True) * limit
+        if limit_type == "percent":
+            return absolute >= cutoff
+        order = np.argsort(-absolute, axis=1)
+        ordered = np.take_along_axis(absolute, order, axis=1)
+        # Include each contributor until the ones before it reach the cutoff.
+        below = (np.cumsum(ordered, axis=1) - ordered) < cutoff
+        np.put_along_axis(selected, order, below, axis=1)
+        return selected
+
+    def _build_top_contributions(
         self,
         contributions: np.ndarray,
         FU_M_index: dict,
         rev_dict: dict,
-        limit: int,
+        limit: Union[int, float],
         limit_type: str,
-    ) -> dict:
-        """Sort the given contribution array on method or reference flow column.
+        rest: Optional[np.ndarray] = None,
+    ) -> pd.DataFrame:
+        """Select the top contributions of every method or reference flow row
+        of the contribution array at once.
 
         Parameters
         ----------
         contributions: A 2-dimensional contribution array
-        FU_M_index : Dictionary which maps the reference flows or methods to their matching columns
+        FU_M_index : Dictionary which maps the reference flows or methods to their matching rows
         rev_dict : 'reverse' dictionary used to map correct activity/method to its value
-        limit : Number of top-contributing items to include
-        limit_type : Either "number" or "percent", ContributionAnalysis.sort_array for complete explanation
+        limit : Number or fraction of top-contributing items to include
+        limit_type : Either "number", "percent" or "cum_percent", see `_select_top`
+        rest : Optional summed contributions per row that are not part of the array
 
         Returns
         -------
-        Top-contributing flows per method or activity
+        Dataframe of the 'Total', 'Rest' and top-contributing flows (largest
+        first) with a column per method or reference flow, flows which are not
+        among the top of a column are NaN
 
         """
-        topcontribution_dict = dict()
-        for fu_or_method, col in FU_M_index.items():
-            top_contribution = ca.sort_array(
-                contributions[col, :], limit=limit, limit_type=limit_type
-            )
-            cont_per = OrderedDict()
-            cont_per.update(
-                {
-                    ("Total", ""): contributions[col, :].sum(),
-                    ("Rest", ""): contributions[col, :].sum()
-                    - top_contribution[:, 0].sum(),
-                }
-            )
-            for value, index in top_contribution:
-                cont_per.update({rev_dict[index]: value})
-            topcontribution_dict.update({fu_or_method: cont_per})
-        return topcontribution_dict
+        rows = list(FU_M_index.values())
+        data = np.asarray(contributions)[rows, :]
+        selected = self._select_top(np.abs(data), limit, limit_type) & (data != 0)
+        top = np.where(selected, data, 0.0)
+
+        total = data.sum(axis=1)
+        if rest is not None:
+            total = total + np.asarray(rest)[rows]
+        flows = np.flatnonzero(selected.any(axis=0))
+        flows = flows[np.argsort(-np.abs(top[:, flows]).max(axis=0), kind="stable")]
+        values = np.where(selected[:, flows], data[:, flows], np.nan)
+
+        df = pd.DataFrame(np.vstack([total, total - top.sum(axis=1), values.T]))
+        df.index = [("Total", ""), ("Rest", "")] + ids_to_keys(
+            rev_dict[i] for i in flows
+        )
+        if all(isinstance(k, tuple) for k in FU_M_index):
+            df.columns = pd.MultiIndex.from_tuples(list(FU_M_index))
+        else:
+            df.columns = list(FU_M_index)
+        return df
 
     @staticmethod
     def get_labels(
@@ -556,46 +959,28 @@ class Contributions(object):
 
     def get_labelled_contribution_dict(
         self,
-        cont_dict: dict,
+        contributions: pd.DataFrame,
         x_fields: list = None,
         y_fields: list = None,
         mask: list = None,
     ) -> pd.DataFrame:
-        """Annotate the contribution dict with metadata.
+        """Annotate the top contributions with metadata.
 
         Parameters
         ----------
-        cont_dict : Holds the contribution data connected to the functions of methods
+        contributions : Top contributions as built by `_build_top_contributions`
         x_fields : X-axis fieldnames, these are usually the indexes/keys of specific processes
-        y_fields : Column names specific to the cont_dict to be labelled
+        y_fields : Column names specific to the contributions to be labelled
         mask : Used in case of aggregation or special cases where the usual way of using the metadata cannot be used
 
         Returns
         -------
-        Annotated contribution dict inside a pandas dataframe
+        Annotated contributions inside a pandas dataframe
 
         """
-        dfs = (
-            pd.DataFrame(v.values(), index=list(v.keys()), columns=[k])
-            for k, v in cont_dict.items()
-        )
-        df = pd.concat(dfs, sort=False, axis=1)
-        # If the cont_dict has tuples for keys, coerce df.columns into MultiIndex
-        if all(isinstance(k, tuple) for k in cont_dict.keys()):
-            df.columns = pd.MultiIndex.from_tuples(df.columns)
+        df = contributions
         special_keys = [("Total", ""), ("Rest", "")]
 
-        # replace all 0 values with NaN and drop all rows with only NaNs
-        # EXCEPT for the special keys
-        df.index = ids_to_keys(df.index)
-        index = (
-            df.loc[df.index.difference(special_keys)]
-            .replace(0, np.nan)
-            .dropna(how="all")
-            .index.union(special_keys)
-        )
-        df = df.loc[index]
-
         if not mask:
             joined = self.join_df_with_metadata(
                 df, x_fields=x_fields, y_fields=y_fields, special_keys=special_keys
@@ -604,8 +989,7 @@ class Contributions(object):
             df.columns = self.get_labels(df.columns, fields=y_fields)
             keys = [k for k in df.index if k in mask]
             combined_keys = special_keys + keys
-            # Reindex the combined_keys to ensure they always exist in the dataframe,
-            # this avoids keys with 0 values not existing due to the 'dropna' action above.
+            # Reindex the combined_keys to ensure they always exist in the dataframe.
             df = df.reindex(combined_keys, axis="index", fill_value=0.0)
             df.index = self.get_labels(df.index, mask=mask)
             joined = df
@@ -688,10 +1072,29 @@ class Contributions(object):
     def _build_contributions(data: np.ndarray, index: int, axis: int) -> np.ndarray:
         return data.take(index, axis=axis)
 
+    def _contribution_data(self, contribution: str, rest: bool = False):
+        """Return the contribution array of the given type, or with `rest`
+        the contributions that a compact array does not store individually.
+        """
+        dataset = {
+            "process": self.mlca.process_contributions,
+            "elementary_flow": self.mlca.elementary_flow_contributions,
+        }
+        data = dataset[contribution]
+        if not rest:
+            return data
+        if isinstance(data, CompactContributionArray) and data.mode == "topk":
+            return data.rest
+        return None
+
     def get_contributions(
-        self, contribution, functional_unit=None, method=None, **kwargs
-    ) -> np.ndarray:
-        """Return a contribution matrix given the type and fu / method."""
+        self, contribution, functional_unit=None, method=None, rest=False, **kwargs
+    ) -> Optional[np.ndarray]:
+        """Return a contribution matrix given the type and fu / method.
+
+        With `rest`, return the summed contributions not stored individually
+        for each row of that matrix instead, or None if all are stored.
+        """
         if all([functional_unit, method]) or not any([functional_unit, method]):
             raise ValueError(
                 "It must be either by reference flow or by impact category. Provided:"
@@ -699,18 +1102,16 @@ class Contributions(object):
                     functional_unit, method
                 )
             )
-        dataset = {
-            "process": self.mlca.process_contributions,
-            "elementary_flow": self.mlca.elementary_flow_contributions,
-        }
+        data = self._contribution_data(contribution, rest)
+        if data is None:
+            return None
         if method:
-            return self._build_contributions(
-                dataset[contribution], self.mlca.method_index[method], 1
-            )
+            data = self._build_contributions(data, self.mlca.method_index[method], 1)
         elif functional_unit:
-            return self._build_contributions(
-                dataset[contribution], self.mlca.func_key_dict[functional_unit], 0
+            data = self._build_contributions(
+                data, self.mlca.func_key_dict[functional_unit], 0
             )
+        return data.ravel() if rest else data
 
     def aggregate_by_parameters(
         self,
@@ -806,7 +1207,7 @@ class Contributions(object):
         aggregator : Used to aggregate EF contributions over certain columns
         limit : The number of top contributions to consider
         normalize : Determines whether or not to normalize the contribution values
-        limit_type : The type of limit, either 'number' or 'percent'
+        limit_type : The type of limit, either 'number', 'percent' or 'cum_percent'
 
         Returns
         -------
@@ -816,6 +1217,9 @@ class Contributions(object):
         contributions = self.get_contributions(
             self.EF, functional_unit, method, **kwargs
         )
+        rest = self.get_contributions(
+            self.EF, functional_unit, method, rest=True, **kwargs
+        )
 
         x_fields = self._contribution_rows(self.EF, aggregator)
         index, y_fields = self._contribution_index_cols(
@@ -826,14 +1230,18 @@ class Contributions(object):
         )
 
         # Normalise if required
-        if normalize:
+        if normalize and rest is not None:
+            # Normalize the rest together with the contributions.
+            normalized = self.normalize(np.column_stack([contributions, rest]))
+            contributions, rest = normalized[:, :-1], normalized[:, -1]
+        elif normalize:
             contributions = self.normalize(contributions)
 
-        top_cont_dict = self._build_dict(
-            contributions, index, rev_index, limit, limit_type
+        top_contributions = self._build_top_contributions(
+            contributions, index, rev_index, limit, limit_type, rest
         )
         labelled_df = self.get_labelled_contribution_dict(
-            top_cont_dict, x_fields=x_fields, y_fields=y_fields, mask=mask
+            top_contributions, x_fields=x_fields, y_fields=y_fields, mask=mask
         )
         self.adjust_table_unit(labelled_df, method)
         return labelled_df
@@ -861,7 +1269,7 @@ class Contributions(object):
         aggregator : Used to aggregate EF contributions over certain columns
         limit : The number of top contributions to consider
         normalize : Determines whether or not to normalize the contribution values
-        limit_type : The type of limit, either 'number' or 'percent'
+        limit_type : The type of limit, either 'number', 'percent' or 'cum_percent'
 
         Returns
         -------
@@ -871,6 +1279,9 @@ class Contributions(object):
         contributions = self.get_contributions(
             self.ACT, functional_unit, method, **kwargs
         )
+        rest = self.get_contributions(
+            self.ACT, functional_unit, method, rest=True, **kwargs
+        )
 
         x_fields = self._contribution_rows(self.ACT, aggregator)
         index, y_fields = self._contribution_index_cols(
@@ -881,18 +1292,40 @@ class Contributions(object):
         )
 
         # Normalise if required
-        if normalize:
+        if normalize and rest is not None:
+            # Normalize the rest together with the contributions.
+            normalized = self.normalize(np.column_stack([contributions, rest]))
+            contributions, rest = normalized[:, :-1], normalized[:, -1]
+        elif normalize:
             contributions = self.normalize(contributions)
 
-        top_cont_dict = self._build_dict(
-            contributions, index, rev_index, limit, limit_type
+        top_contributions = self._build_top_contributions(
+            contributions, index, rev_index, limit, limit_type, rest
         )
         labelled_df = self.get_labelled_contribution_dict(
-            top_cont_dict, x_fields=x_fields, y_fields=y_fields, mask=mask
+            top_contributions, x_fields=x_fields, y_fields=y_fields, mask=mask
         )
         self.adjust_table_unit(labelled_df, method)
         return labelled_df
 
 
+def get_dependent_databases(keys: Iterable[tuple]) -> set:
+    """Get all databases the given activity keys depend upon."""
+
+    def get_dependents(dbs: set, dependents: list) -> set:
+        for dep in (bd.databases[db].get("depends", []) for db in dependents):
+            if not dbs.issuperset(dep):
+                dbs = get_dependents(dbs.union(dep), dep)
+        return dbs
+
+    dbs = set(k[0] for k in keys)
+    dbs = get_dependents(dbs, list(dbs))
+    # In rare cases, the default biosphere is not found as a dependency, see:
+    # https://github.com/LCA-ActivityBrowser/activity-browser/issues/298
+    # Always include it.
+    dbs.add(bd.config.biosphere)
+    return dbs
+
+
 def ids_to_keys(index_list):
     return [bd.get_activity(i).key if isinstance(i, int) else i for i in index_list]
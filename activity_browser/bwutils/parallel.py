@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Calculate the results of an `MLCA` in several processes.
+
+The reference flows, and for scenario LCA the scenarios, of a calculation
+setup are divided into chunks which are calculated by worker processes, each
+with its own LCA object and factorization. The workers write their results
+directly into arrays in shared memory, so large results are never pickled.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from activity_browser import log
+from activity_browser.mod import bw2data as bd
+
+# Result arrays of the MLCA which are filled by the workers.
+RESULT_ARRAYS = ("lca_scores", "elementary_flow_contributions", "process_contributions")
+# Per reference flow (and scenario) vectors, stored in dictionaries by the MLCA.
+RESULT_VECTORS = ("scaling_factors", "technosphere_flows", "inventory")
+
+
+@contextmanager
+def headless_workers():
+    """Set `AB_HEADLESS` while worker processes are started, so they import
+    the Activity Browser without user interface, and restore the environment
+    of this process afterwards.
+
+    Worker processes are spawned when the tasks are submitted, so both the
+    pool and the submission of its tasks belong in this context.
+    """
+    previous = os.environ.get("AB_HEADLESS")
+    os.environ["AB_HEADLESS"] = "1"
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["AB_HEADLESS"]
+        else:
+            os.environ["AB_HEADLESS"] = previous
+
+
+def open_project(base_dir: str, project: str) -> None:
+    """Open `project` of the brightway data directory `base_dir` in a worker
+    process, which starts in the default directory.
+    """
+    if bd.projects.base_dir != base_dir:
+        bd.projects.switch_dir(base_dir)
+    if bd.projects.current != project:
+        bd.projects.set_current(project)
+
+
+def _shared_array(shape: tuple, name: Optional[str] = None):
+    """Create, or attach to when `name` is given, a float64 array in shared
+    memory and return the memory block and the array.
+    """
+    if name is None:
+        size = max(int(np.prod(shape)) * 8, 1)
+        shm = SharedMemory(create=True, size=size)
+    else:
+        shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def split_tasks(
+    rows: int, columns: Optional[int], processes: int
+) -> List[Tuple[list, Optional[list]]]:
+    """Divide the reference flow rows, and scenario columns if any, into
+    about `processes` chunks of (rows, columns).
+
+    Scenarios are divided first as every scenario requires its own
+    factorization, reference flows only when there are fewer scenarios than
+    processes.
+    """
+    if columns is None:
+        column_chunks = [None]
+    else:
+        column_chunks = [
+            c.tolist()
+            for c in np.array_split(np.arange(columns), min(processes, columns))
+        ]
+    n_row_chunks = min(rows, max(1, processes // len(column_chunks)))
+    row_chunks = [r.tolist() for r in np.array_split(np.arange(rows), n_row_chunks)]
+    return [(r, c) for c in column_chunks for r in row_chunks]
+
+
+def _result_indexes(rows: list, columns: Optional[list]) -> list:
+    if columns is None:
+        return [(row,) for row in rows]
+    return [(row, col) for col in columns for row in rows]
+
+
+def _calculate_task(
+    project: tuple, cls, args: tuple, kwargs: dict, shared: dict, rows, columns
+) -> int:
+    """Calculate one chunk in a worker process, returns the number of steps.
+
+    The `project` is given as the (data directory, project name).
+    """
+    open_project(*project)
+    mlca = cls(*args, **kwargs)
+    blocks, arrays = [], {}
+    try:
+        for name, (shm_name, shape) in shared.items():
+            shm, arrays[name] = _shared_array(shape, shm_name)
+            blocks.append(shm)
+        for name in RESULT_ARRAYS:
+            setattr(mlca, name, arrays[name])
+        mlca._calculate_chunk(rows, columns)
+        for index in _result_indexes(rows, columns):
+            key = mlca._inventory_key(*index)
+            for name in RESULT_VECTORS:
+                arrays[name][index] = getattr(mlca, name)[key]
+    finally:
+        for name in RESULT_ARRAYS:
+            setattr(mlca, name, None)
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+    return len(rows) * (len(columns) if columns is not None else 1)
+
+
+def calculate_in_processes(mlca, processes: int) -> None:
+    """Calculate all results of `mlca` with a pool of `processes` workers.
+
+    Progress is reported to the `mlca` per finished chunk. When reporting
+    raises (e.g. the calculation is canceled), chunks which have not started
+    yet are canceled and the exception is raised.
+    """
+    rows = len(mlca.func_units)
+    columns = getattr(mlca, "total", None)
+    tasks = split_tasks(rows, columns, processes)
+    steps = rows * (columns or 1)
+    lead = (rows,) if columns is None else (rows, columns)
+    shapes = {name: getattr(mlca, name).shape for name in RESULT_ARRAYS}
+    shapes["scaling_factors"] = lead + (mlca.lca.technosphere_matrix.shape[1],)
+    shapes["technosphere_flows"] = shapes["scaling_factors"]
+    shapes["inventory"] = lead + (mlca.lca.biosphere_matrix.shape[0],)
+    mlca._build_impact_intensities()
+
+    blocks, arrays = [], {}
+    try:
+        for name, shape in shapes.items():
+            shm, arrays[name] = _shared_array(shape)
+            arrays[name][...] = 0
+            blocks.append(shm)
+        shared = {name: (blocks[i].name, shapes[name]) for i, name in enumerate(shapes)}
+        kwargs = dict(batched=mlca.batched, contribution_storage="dense", processes=1)
+        project = (bd.projects.base_dir, bd.projects.current)
+        with headless_workers():
+            executor = ProcessPoolExecutor(
+                max_workers=min(processes, len(tasks)),
+                mp_context=get_context("spawn"),
+            )
+            futures = [
+                executor.submit(
+                    _calculate_task,
+                    project,
+                    type(mlca),
+                    mlca._worker_arguments(),
+                    kwargs,
+                    shared,
+                    task_rows,
+                    task_columns,
+                )
+                for task_rows, task_columns in tasks
+            ]
+        with executor:
+            try:
+                done = 0
+                for future in as_completed(futures):
+                    done += future.result()
+                    mlca._report_progress(done, steps)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        log.info(
+            "Calculated {} reference flows in {} chunks with {} processes".format(
+                steps, len(tasks), min(processes, len(tasks))
+            )
+        )
+
+        for name in RESULT_ARRAYS:
+            setattr(mlca, name, arrays[name].copy())
+        for index in _result_indexes(
+            list(range(rows)), list(range(columns)) if columns else None
+        ):
+            mlca._register_results(
+                mlca._inventory_key(*index),
+                index,
+                *(arrays[name][index].copy() for name in RESULT_VECTORS),
+            )
+    finally:
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+
+from activity_browser import log
+from activity_browser.mod import bw2data as bd
+
+from .multilca import MLCA, get_dependent_databases
+
+
+class MLCAResultsCache(object):
+    """Persistent cache of `MLCA` results in the project directory.
+
+    Each entry is a directory named after a hash of everything the results
+    depend on: the calculation setup, the characterization factors of its
+    impact categories and the 'modified' timestamps of all databases the
+    reference flows depend upon. Changing any of these leads to a new key,
+    so outdated entries are never read and are pruned over time.
+
+    Arrays are stored as `.npy` files which are memory-mapped on load, the
+    sparse characterization matrices as `.npz` and the reverse dictionaries
+    as json.
+
+    Only results with dense contribution arrays are cached.
+    """
+
+    VERSION = 1
+    MAX_ENTRIES = 20
+    ARRAYS = (
+        "lca_scores",
+        "elementary_flow_contributions",
+        "process_contributions",
+    )
+    VECTORS = ("scaling_factors", "technosphere_flows", "inventory")
+    MATRICES = ("stacked_cf_matrix", "impact_intensities")
+    DICTS = ("rev_activity_dict", "rev_product_dict", "rev_biosphere_dict")
+
+    def __init__(self, cs_name: str):
+        self.cs_name = cs_name
+        self.directory = os.path.join(str(bd.projects.dir), "ab_results_cache")
+        self.path = os.path.join(self.directory, self.cache_key(cs_name))
+
+    @classmethod
+    def cache_key(cls, cs_name: str) -> str:
+        """Hash the calculation setup and the data its results depend on."""
+        cs = bd.calculation_setups[cs_name]
+        keys = [next(iter(fu)) for fu in cs["inv"]]
+        digest = hashlib.sha256()
+        digest.update(repr((cls.VERSION, cs["inv"], cs["ia"])).encode())
+        for method in cs["ia"]:
+            digest.update(repr(bd.Method(method).load()).encode())
+        for db in sorted(get_dependent_databases(keys)):
+            digest.update(repr((db, bd.databases[db].get("modified"))).encode())
+        return digest.hexdigest()
+
+    def load(self, **kwargs) -> Optional[MLCA]:
+        """Return an `MLCA` with the cached results, or None on a cache miss."""
+        if not os.path.isdir(self.path):
+            return None
+        try:
+            # The large contribution arrays are memory-mapped, not read.
+            cached = {
+                name: np.load(
+                    os.path.join(self.path, name + ".npy"),
+                    mmap_mode="r" if name.endswith("contributions") else None,
+                )
+                for name in self.ARRAYS + self.VECTORS
+            }
+            for name in self.MATRICES:
+                cached[name] = sparse.load_npz(os.path.join(self.path, name + ".npz"))
+            with open(os.path.join(self.path, "dicts.json"), "r") as infile:
+                dicts = json.load(infile)
+            for name in self.DICTS:
+                cached[name] = {
+                    i: tuple(k) if isinstance(k, list) else k for i, k in dicts[name]
+                }
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Could not read cached results of '{self.cs_name}': {e}")
+            shutil.rmtree(self.path, ignore_errors=True)
+            return None
+        # Mark the entry as recently used for pruning.
+        os.utime(self.path)
+        log.info(f"Loaded cached results for '{self.cs_name}'")
+        return MLCA(self.cs_name, cached=cached, **kwargs)
+
+    def save(self, mlca: MLCA) -> None:
+        """Write the results of a calculated `MLCA` to the cache."""
+        if mlca.restored or not all(
+            isinstance(getattr(mlca, name), np.ndarray) for name in self.ARRAYS
+        ):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary directory first, so no partial entry is ever read.
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        try:
+            for name in self.ARRAYS:
+                np.save(os.path.join(tmp, name + ".npy"), getattr(mlca, name))
+            for name in self.VECTORS:
+                vectors = getattr(mlca, name)
+                np.save(
+                    os.path.join(tmp, name + ".npy"),
+                    np.vstack([vectors[str(fu)] for fu in mlca.func_units]),
+                )
+            for name in self.MATRICES:
+                sparse.save_npz(
+                    os.path.join(tmp, name + ".npz"),
+                    sparse.csr_matrix(getattr(mlca, name)),
+                )
+            dicts = {name: list(getattr(mlca, name).items()) for name in self.DICTS}
+            with open(os.path.join(tmp, "dicts.json"), "w") as outfile:
+                json.dump(dicts, outfile)
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(tmp, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            log.warning(f"Could not cache results of '{self.cs_name}': {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.prune()
+
+    def prune(self) -> None:
+        """Remove the least recently used entries beyond `MAX_ENTRIES`."""
+        entries = sorted(
+            (os.path.join(self.directory, d) for d in os.listdir(self.directory)),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for entry in entries[self.MAX_ENTRIES :]:
+            shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Quasi-random sampling of `stats_arrays` uncertainty distributions.
+
+Plain Monte Carlo samples every distribution with pseudo-random numbers
+(`MCRandomNumberGenerator`). The `QuasiRandomGenerator` instead draws
+uniform points from a Latin hypercube or a scrambled Sobol sequence and maps
+them through the inverse CDF of every distribution. These points cover the
+distributions more evenly, so the mean and percentiles of the results
+converge in fewer iterations.
+
+Distributions without an inverse CDF in `stats_arrays`, and those without
+uncertainty, are still sampled pseudo-randomly.
+"""
+
+import warnings
+from inspect import signature
+from typing import Optional
+
+import numpy as np
+from scipy.stats import qmc
+from stats_arrays import MCRandomNumberGenerator, uncertainty_choices
+from stats_arrays.distributions import NoUncertainty, UndefinedUncertainty
+
+SAMPLING_MODES = ("random", "lhs", "sobol")
+# The number of dimensions scipy has Sobol direction numbers for, any
+# further dimensions are sampled with a Latin hypercube.
+SOBOL_MAX_DIMENSION = 21201
+# Keep the uniform points away from 0 and 1, where inverse CDFs are infinite.
+_EPSILON = 2.0**-53
+
+# scipy 1.15 renamed the `seed` argument of its quasi-Monte Carlo engines
+_RNG = "rng" if "rng" in signature(qmc.LatinHypercube).parameters else "seed"
+
+
+class QuasiRandomGenerator(object):
+    """Generate samples of the distributions in `params`, like
+    `MCRandomNumberGenerator`, from quasi-random uniform points.
+
+    Parameters
+    ----------
+    params : A `stats_arrays` params array
+    mode : Either 'lhs' for Latin hypercube sampling or 'sobol' for a
+        scrambled Sobol sequence
+    seed : Seed of the Latin hypercubes and of the pseudo-random samples
+    sequence_seed : Seed of the scrambling of the Sobol sequence, which is
+        shared by all the generators continuing the same sequence
+    first : Position in the Sobol sequence of the first sample
+
+    Every call of `generate` returns a new Latin hypercube of the given
+    number of samples, or continues the Sobol sequence.
+    """
+
+    def __init__(
+        self,
+        params: np.ndarray,
+        mode: str = "sobol",
+        seed: Optional[int] = None,
+        sequence_seed=None,
+        first: int = 0,
+    ):
+        if mode not in ("lhs", "sobol"):
+            raise ValueError(
+                "Sampling mode must be 'lhs' or 'sobol', '{}' given.".format(mode)
+            )
+        self.params = params
+        self.mode = mode
+        self.random = np.random.default_rng(seed)
+        self.fallbacks = {}
+
+        kinds = params["uncertainty_type"]
+        constant = (kinds == NoUncertainty.id) | (kinds == UndefinedUncertainty.id)
+        self.dimensions = np.flatnonzero(~constant)
+        self.lhs_dimensions = len(self.dimensions)
+        self.sobol = None
+        if mode == "sobol" and len(self.dimensions):
+            dimensions = min(len(self.dimensions), SOBOL_MAX_DIMENSION)
+            self.sobol = qmc.Sobol(
+                dimensions,
+                scramble=True,
+                **{_RNG: np.random.default_rng(sequence_seed)}
+            )
+            if first:
+                self.sobol.fast_forward(first)
+            self.lhs_dimensions -= dimensions
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
+    def next(self) -> np.ndarray:
+        return self.generate(1).ravel()
+
+    def uniform(self, samples: int) -> np.ndarray:
+        """Return uniform points of shape (dimensions, samples)."""
+        points = []
+        if self.sobol is not None:
+            with warnings.catch_warnings():
+                # The balance properties need a power of 2 of samples in
+                # total, not in every call.
+                warnings.simplefilter("ignore", UserWarning)
+                points.append(self.sobol.random(samples))
+        if self.lhs_dimensions:
+            lhs = qmc.LatinHypercube(self.lhs_dimensions, **{_RNG: self.random})
+            points.append(lhs.random(samples))
+        if not points:
+            return np.empty((0, samples))
+        return np.clip(np.hstack(points).T, _EPSILON, 1 - _EPSILON)
+
+    def generate(self, samples: int = 1) -> np.ndarray:
+        """Return samples of shape (params, samples)."""
+        values = np.empty((len(self.params), samples))
+        uniform = np.empty((len(self.params), samples))
+        uniform[self.dimensions] = self.uniform(samples)
+        kinds = self.params["uncertainty_type"]
+        for kind in np.unique(kinds):
+            mask = kinds == kind
+            if kind in (NoUncertainty.id, UndefinedUncertainty.id):
+                # Constant amounts, nothing to map.
+                values[mask] = self._fallback(kind, mask).generate(samples)
+                continue
+            try:
+                values[mask] = self.inverse_cdf(
+                    uncertainty_choices[kind], self.params[mask], uniform[mask]
+                )
+            except NotImplementedError:
+                # Distributions without an inverse CDF are sampled randomly.
+                values[mask] = self._fallback(kind, mask).generate(samples)
+        return values
+
+    @staticmethod
+    def inverse_cdf(distribution, params: np.ndarray, uniform: np.ndarray):
+        """Map the `uniform` points through the inverse CDF of the
+        `distribution` of each row of `params`, truncated to the minimum and
+        maximum of the row if given.
+        """
+        lower = np.zeros(len(params))
+        upper = np.ones(len(params))
+        for bound, cdf in (("minimum", lower), ("maximum", upper)):
+            bounded = np.isfinite(params[bound])
+            if bounded.any():
+                cdf[bounded] = distribution.cdf(
+                    params[bounded], params[bound][bounded]
+                ).ravel()
+        points = lower.reshape(-1, 1) + uniform * (upper - lower).reshape(-1, 1)
+        return distribution.ppf(params, points)
+
+    def _fallback(self, kind: int, mask: np.ndarray) -> MCRandomNumberGenerator:
+        """Pseudo-random generator of the distributions of type `kind`."""
+        if kind not in self.fallbacks:
+            self.fallbacks[kind] = MCRandomNumberGenerator(
+                self.params[mask], seed=int(self.random.integers(2**31))
+            )
+        return self.fallbacks[kind]
@@ -7,15 +7,20 @@
 # =============================================================================
 import os
 import traceback
+from collections import defaultdict
 from time import time
 
 import bw2calc as bc
 import numpy as np
 import pandas as pd
+from peewee import chunked
 from SALib.analyze import delta
+from scipy import sparse
 
 from activity_browser import log
 from activity_browser.mod import bw2data as bd
+from activity_browser.mod.bw2data.backends import (ActivityDataset,
+                                                   ExchangeDataset)
 
 from ..settings import ab_settings
 from .montecarlo import MonteCarloLCA, perform_MonteCarlo_LCA
@@ -28,6 +33,10 @@ except ImportError:
     # standard import on failure
     from bw2calc import GraphTraversal
 
+# Number of codes or ids per database query, SQLite limits the number of
+# variables in a single query.
+QUERY_CHUNK_SIZE = 500
+
 
 def get_lca(fu, method):
     """Calculates a non-stochastic LCA and returns a the LCA object."""
@@ -88,29 +97,87 @@ def filter_biosphere_exchanges(lca, cutoff=0.005):
     return biosphere_exchange_indices
 
 
+def get_activity_keys(ids: list) -> list:
+    """Return the keys of the activities given by `ids`, which are either
+    activity keys or, for bw25, activity ids resolved in bulk.
+    """
+    numbers = {int(i) for i in ids if not isinstance(i, tuple)}
+    keys = {}
+    for chunk in chunked(list(numbers), QUERY_CHUNK_SIZE):
+        query = ActivityDataset.select(
+            ActivityDataset.id, ActivityDataset.database, ActivityDataset.code
+        ).where(ActivityDataset.id << chunk)
+        keys.update({doc.id: (doc.database, doc.code) for doc in query.iterator()})
+    return [i if isinstance(i, tuple) else keys[int(i)] for i in ids]
+
+
+def _codes_by_database(keys) -> dict:
+    codes = defaultdict(set)
+    for database, code in keys:
+        codes[database].add(code)
+    return codes
+
+
+def get_activities_data(keys) -> dict:
+    """Return the data of the activities or biosphere flows with the given
+    `keys`, read with one query per database instead of one per activity.
+    """
+    data = {}
+    for database, codes in _codes_by_database(keys).items():
+        for chunk in chunked(list(codes), QUERY_CHUNK_SIZE):
+            query = ActivityDataset.select(
+                ActivityDataset.code, ActivityDataset.data
+            ).where(
+                (ActivityDataset.database == database) & (ActivityDataset.code << chunk)
+            )
+            for doc in query.iterator():
+                data[(database, doc.code)] = dict(
+                    doc.data, database=database, code=doc.code
+                )
+    return data
+
+
+def get_exchanges_data(pairs) -> dict:
+    """Return the data of all exchanges between the (input key, output key)
+    `pairs`, grouped by pair. The exchanges are read with one query per
+    database of the output activities.
+    """
+    pairs = set(pairs)
+    data = defaultdict(list)
+    outputs = {output for _, output in pairs}
+    for database, codes in _codes_by_database(outputs).items():
+        for chunk in chunked(list(codes), QUERY_CHUNK_SIZE):
+            query = ExchangeDataset.select().where(
+                (ExchangeDataset.output_database == database)
+                & (ExchangeDataset.output_code << chunk)
+            )
+            for doc in query.iterator():
+                pair = (
+                    (doc.input_database, doc.input_code),
+                    (doc.output_database, doc.output_code),
+                )
+                if pair in pairs:
+                    data[pair].append(dict(doc.data, input=pair[0], output=pair[1]))
+    return data
+
+
 def get_exchanges(lca, indices, biosphere=False, only_uncertain=True):
-    """Get actual exchange objects from indices.
+    """Get the exchange data from indices.
     By default get only exchanges that have uncertainties.
 
     Returns
     -------
     exchanges : list
-        List of exchange objects
+        List of exchange data dictionaries
     indices : list of tuples
         List of indices
     """
-    exchanges = list()
-    for i in indices:
-        if biosphere:
-            from_act = bd.get_activity(lca.biosphere_dict_rev[i[0]])
-        else:  # technosphere
-            from_act = bd.get_activity(lca.activity_dict_rev[i[0]])
-        to_act = bd.get_activity(lca.activity_dict_rev[i[1]])
-
-        for exc in to_act.exchanges():
-            if exc.input == from_act.key:
-                exchanges.append(exc)
-                # continue  # if there was always only one max exchange between two activities
+    from_dict_rev = lca.biosphere_dict_rev if biosphere else lca.activity_dict_rev
+    from_keys = get_activity_keys([from_dict_rev[i[0]] for i in indices])
+    to_keys = get_activity_keys([lca.activity_dict_rev[i[1]] for i in indices])
+    pairs = list(zip(from_keys, to_keys))
+    data = get_exchanges_data(pairs)
+    exchanges = [dict(exc) for pair in pairs for exc in data.get(pair, [])]
 
     # in theory there should be as many exchanges as indices, but since
     # multiple exchanges are possible between two activities, the number of
@@ -148,10 +215,14 @@ def drop_no_uncertainty_exchanges(excs, indices):
 
 def get_exchanges_dataframe(exchanges, indices, biosphere=False):
     """Returns a Dataframe from the exchange data and a bit of additional information."""
+    activities = get_activities_data(
+        {exc.get("input") for exc in exchanges}
+        | {exc.get("output") for exc in exchanges}
+    )
 
     for exc, i in zip(exchanges, indices):
-        from_act = bd.get_activity(exc.get("input"))
-        to_act = bd.get_activity(exc.get("output"))
+        from_act = activities[exc.get("input")]
+        to_act = activities[exc.get("output")]
 
         exc.update(
             {
@@ -195,14 +266,21 @@ def get_exchanges_dataframe(exchanges, indices, biosphere=False):
 def get_CF_dataframe(lca, only_uncertain_CFs=True):
     """Returns a dataframe with the metadata for the characterization factors
     (in the biosphere matrix). Filters non-stochastic CFs if desired (default)."""
+    params_indices = list(range(len(lca.cf_params)))
+    if only_uncertain_CFs:
+        params_indices = np.flatnonzero(lca.cf_params["uncertainty_type"] > 1).tolist()
+    flow_keys = get_activity_keys(
+        [lca.biosphere_dict_rev[lca.cf_params["row"][i]] for i in params_indices]
+    )
+    flows = get_activities_data(flow_keys)
+
     data = dict()
-    for params_index, row in enumerate(lca.cf_params):
-        if only_uncertain_CFs and row["uncertainty_type"] <= 1:
-            continue
+    for params_index, key in zip(params_indices, flow_keys):
+        row = lca.cf_params[params_index]
         cf_index = row["row"]
-        bio_act = bd.get_activity(lca.biosphere_dict_rev[cf_index])
+        bio_act = flows[key]
 
-        data.update({params_index: bio_act.as_dict()})
+        data.update({params_index: dict(bio_act)})
 
         for name in row.dtype.names:
             data[params_index][name] = row[name]
@@ -235,19 +313,31 @@ def get_parameters_DF(mc):
         return pd.DataFrame()  # return emtpy df
 
 
-def get_exchange_values(matrix, indices):
-    """Get technosphere exchanges values from a list of exchanges
-    (row and column information)"""
-    return [matrix[i] for i in indices]
+def get_X(samples, params, indices, technosphere=False):
+    """Get the input data to the GSA, i.e. A or B matrix values for each
+    model run, from the sampled amounts of the matrix `params`.
 
-
-def get_X(matrix_list, indices):
-    """Get the input data to the GSA, i.e. A and B matrix values for each
-    model run."""
-    X = np.zeros((len(matrix_list), len(indices)))
-    for row, M in enumerate(matrix_list):
-        X[row, :] = get_exchange_values(M, indices)
-    return X
+    Amounts of params in the same matrix cell are summed and technosphere
+    inputs are negated, as in the technosphere matrix."""
+    rows = params["row"].astype(np.int64)
+    cols = params["col"].astype(np.int64)
+    cells = (rows << 32) | cols
+    wanted, inverse = np.unique(
+        [(np.int64(r) << 32) | np.int64(c) for r, c in indices], return_inverse=True
+    )
+    position = np.searchsorted(wanted, cells).clip(0, len(wanted) - 1)
+    matched = np.flatnonzero(wanted[position] == cells)
+
+    values = np.asarray(samples[:, matched])
+    if technosphere:
+        # params of type 1 are technosphere inputs
+        values = values * np.where(params["type"][matched] == 1, -1.0, 1.0)
+    mapping = sparse.csr_matrix(
+        (np.ones(len(matched)), (np.arange(len(matched)), position[matched])),
+        shape=(len(matched), len(wanted)),
+    )
+    X = np.asarray(values @ mapping)
+    return X[:, np.ravel(inverse)]
 
 
 def get_X_CF(mc, dfcf, method):
@@ -395,13 +485,23 @@ class GlobalSensitivityAnalysis(object):
         #     GSA
         # =============================================================================
 
-        # Get X (Technosphere, Biosphere and CF values)
+        # Get X (Technosphere, Biosphere and CF values), the samples are only
+        # kept for the params in the sample columns of the Monte Carlo LCA
         X_list = list()
         if self.mc.include_technosphere and self.t_indices:
-            self.Xa = get_X(self.mc.A_matrices, self.t_indices)
+            self.Xa = get_X(
+                self.mc.tech_samples,
+                self.mc.lca.tech_params[self.mc.tech_sample_columns],
+                self.t_indices,
+                technosphere=True,
+            )
             X_list.append(self.Xa)
         if self.mc.include_biosphere and self.b_indices:
-            self.Xb = get_X(self.mc.B_matrices, self.b_indices)
+            self.Xb = get_X(
+                self.mc.bio_samples,
+                self.mc.lca.bio_params[self.mc.bio_sample_columns],
+                self.b_indices,
+            )
             X_list.append(self.Xb)
         if self.mc.include_cfs and not self.dfcf.empty:
             self.Xc = get_X_CF(self.mc, self.dfcf, self.method)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Linear algebra helpers shared by the MLCA and Monte Carlo calculations.
+
+These functions work directly on a `bw2calc.LCA` object, reusing its
+factorization of the technosphere matrix to solve many demand vectors in
+one block instead of calling `redo_lci` once per reference flow, or
+solving perturbed technosphere matrices iteratively (`IterativeSolver`).
+"""
+from inspect import signature
+from typing import Hashable, Optional
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, bicgstab
+
+from activity_browser import log
+from activity_browser.mod import bw2data as bd
+
+try:
+    # use the same direct solver as bw2calc
+    from pypardiso import factorized, spsolve
+except ImportError:
+    from scipy.sparse.linalg import factorized, spsolve
+
+# scipy 1.12 renamed the `tol` argument of its iterative solvers to `rtol`
+_RTOL = "rtol" if "rtol" in signature(bicgstab).parameters else "tol"
+
+
+def product_index(lca, key: tuple) -> int:
+    """Return the technosphere matrix row of the product given by `key`."""
+    try:
+        return lca.product_dict[key]
+    except (AttributeError, KeyError):
+        # bw25 compatibility requires activity id instead of activity key
+        return lca.dicts.product[bd.get_activity(key).id]
+
+
+def build_demand_matrix(lca, func_units: list) -> np.ndarray:
+    """Construct a demand matrix with one column per reference flow.
+
+    Parameters
+    ----------
+    lca : A `bw2calc.LCA` object with loaded inventory data
+    func_units : List of dictionaries with reference flow keys and amounts
+
+    Returns
+    -------
+    2-dimensional array of shape (products, reference flows)
+
+    """
+    demand = np.zeros((lca.technosphere_matrix.shape[0], len(func_units)))
+    for col, func_unit in enumerate(func_units):
+        for key, amount in func_unit.items():
+            demand[product_index(lca, key), col] = amount
+    return demand
+
+
+def solve_demand_matrix(lca, demand: np.ndarray) -> np.ndarray:
+    """Solve the technosphere system for every column of `demand` at once.
+
+    The technosphere matrix is factorized if the LCA object has no solver
+    yet, after which all demand vectors are solved in a single block. Not
+    every sparse solver backend accepts a 2-dimensional right-hand side
+    (e.g. umfpack), in which case the columns are solved one by one against
+    the same factorization.
+
+    Returns
+    -------
+    2-dimensional array of shape (activities, demand columns) holding the
+    supply vectors.
+
+    """
+    if not hasattr(lca, "solver"):
+        lca.decompose_technosphere()
+    try:
+        supply = np.asarray(lca.solver(demand))
+    except Exception:
+        supply = None
+    if supply is None or supply.shape != demand.shape:
+        supply = np.column_stack(
+            [lca.solver(demand[:, col]) for col in range(demand.shape[1])]
+        )
+    return supply
+
+
+class IterativeSolver(object):
+    """Solve technosphere systems which are small perturbations of a static
+    technosphere matrix, as in Monte Carlo iterations.
+
+    The static matrix is factorized once and used as the preconditioner of
+    a BiCGSTAB solve of every perturbed system, which is started from the
+    previous supply vector of the same demand. Systems which do not
+    converge within `maxiter` iterations are solved directly instead.
+
+    Parameters
+    ----------
+    matrix : The static technosphere matrix
+    tolerance : Relative residual tolerance of the iterative solve
+    maxiter : Maximum number of BiCGSTAB iterations per solve
+
+    Attributes
+    ----------
+    fallbacks : int
+        Number of systems that were solved directly
+
+    """
+
+    def __init__(self, matrix, tolerance: float = 1e-8, maxiter: int = 100):
+        matrix = sparse.csc_matrix(matrix)
+        self.preconditioner = LinearOperator(
+            matrix.shape, matvec=factorized(matrix), dtype=np.float64
+        )
+        self.tolerance = tolerance
+        self.maxiter = maxiter
+        self.fallbacks = 0
+        self._previous = {}
+
+    def reset(self) -> None:
+        """Forget the previous supply vectors."""
+        self._previous = {}
+
+    def solve(
+        self, matrix, demand: np.ndarray, key: Optional[Hashable] = None
+    ) -> np.ndarray:
+        """Solve `matrix` for `demand`, warm-started from the last supply
+        vector solved for the same `key`.
+        """
+        supply, info = bicgstab(
+            matrix,
+            demand,
+            x0=self._previous.get(key),
+            M=self.preconditioner,
+            maxiter=self.maxiter,
+            **{_RTOL: self.tolerance},
+        )
+        if info != 0 or not np.isfinite(supply).all():
+            self.fallbacks += 1
+            log.debug("Iterative solve did not converge, solving directly")
+            supply = spsolve(sparse.csc_matrix(matrix), demand)
+        self._previous[key] = supply
+        return supply
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Online statistics of Monte Carlo results.
+
+`RunningStatistics` keeps the count, mean, variance (Welford's algorithm,
+merged per batch with the formulas of Chan et al.), minimum and maximum of
+every reference flow, method (and scenario) as iterations are added, and a
+`QuantileSketch` for their percentiles. Neither needs the results of the
+earlier iterations, and both can be merged with those of another set of
+iterations.
+"""
+
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch with relative accuracy for many values at
+    once, after DDSketch (Masson et al., 2019).
+
+    Every non-zero value is counted in a logarithmic bucket, the quantiles
+    returned are within `accuracy` relative to the true value of the same
+    rank. Each cell of `shape` has `buckets` buckets for positive and for
+    negative values, centred on the magnitude of its first values. Values
+    more than about `exp(accuracy * buckets)` times larger or smaller fall
+    into the outermost buckets.
+
+    Parameters
+    ----------
+    shape : Shape of the values added per iteration
+    accuracy : Relative accuracy of the quantiles
+    buckets : Number of buckets per sign and cell
+
+    """
+
+    def __init__(self, shape: tuple, accuracy: float = 0.01, buckets: int = 1024):
+        self.shape = tuple(shape)
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.buckets = buckets
+        cells = int(np.prod(self.shape))
+        self.count = 0
+        # Bucket key of the first bucket of each cell, set by the first `add`.
+        self.offsets: Optional[np.ndarray] = None
+        self.positive = np.zeros((cells, buckets), dtype=np.int64)
+        self.negative = np.zeros((cells, buckets), dtype=np.int64)
+        self.zeros = np.zeros(cells, dtype=np.int64)
+
+    def _keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore"):
+            keys = np.ceil(np.log(magnitudes) / np.log(self.gamma))
+        return np.where(magnitudes > 0, keys, 0).astype(np.int64)
+
+    def add(self, values: np.ndarray) -> None:
+        """Add the values of a batch of iterations, of shape
+        (iterations, *shape).
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.zeros))
+        if not len(values):
+            return
+        magnitudes = np.abs(values)
+        keys = self._keys(magnitudes)
+        if self.offsets is None:
+            # Centre the buckets on the first non-zero value of each cell.
+            first = np.argmax(magnitudes > 0, axis=0)
+            centre = keys[first, np.arange(len(self.zeros))]
+            self.offsets = centre - self.buckets // 2
+        index = np.clip(keys - self.offsets, 0, self.buckets - 1)
+        cells = np.broadcast_to(np.arange(len(self.zeros)), values.shape)
+        for counts, mask in (
+            (self.positive, values > 0),
+            (self.negative, values < 0),
+        ):
+            np.add.at(counts, (cells[mask], index[mask]), 1)
+        self.zeros += (values == 0).sum(axis=0)
+        self.count += len(values)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Add the counts of `other`, a sketch of the same shape and
+        accuracy.
+        """
+        if other.offsets is None:
+            return
+        if self.offsets is None:
+            self.offsets = other.offsets.copy()
+        shift = other.offsets - self.offsets
+        index = np.clip(
+            np.arange(self.buckets) + shift[:, np.newaxis], 0, self.buckets - 1
+        )
+        rows = np.arange(len(self.zeros))[:, np.newaxis]
+        np.add.at(self.positive, (rows, index), other.positive)
+        np.add.at(self.negative, (rows, index), other.negative)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: Union[float, Iterable[float]]) -> np.ndarray:
+        """Return the quantiles `q` of every cell, of shape `shape`, or
+        (len(q), *shape) for several quantiles.
+        """
+        qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if not self.count:
+            result = np.full((len(qs),) + self.shape, np.nan)
+            return result if np.ndim(q) else result[0]
+        # Buckets in ascending order of value: the negative buckets from the
+        # largest magnitude down, zero and the positive buckets.
+        counts = np.hstack(
+            [self.negative[:, ::-1], self.zeros[:, np.newaxis], self.positive]
+        )
+        cumulative = np.cumsum(counts, axis=1)
+        keys = np.arange(self.buckets) + self.offsets[:, np.newaxis]
+        centres = 2 * self.gamma ** keys.astype(np.float64) / (self.gamma + 1)
+        values = np.hstack([-centres[:, ::-1], np.zeros((len(self.zeros), 1)), centres])
+        rows = np.arange(len(self.zeros))
+        result = np.empty((len(qs), len(self.zeros)))
+        for i, quantile in enumerate(qs):
+            rank = quantile * (self.count - 1)
+            position = np.argmax(cumulative > rank, axis=1)
+            result[i] = values[rows, position]
+        result = result.reshape((len(qs),) + self.shape)
+        return result if np.ndim(q) else result[0]
+
+
+class RunningStatistics(object):
+    """Count, mean, variance, extremes and quantiles of every cell of
+    `shape`, updated with each batch of iterations.
+
+    Parameters
+    ----------
+    shape : Shape of the values added per iteration
+    accuracy : Relative accuracy of the quantiles, see `QuantileSketch`
+
+    """
+
+    def __init__(self, shape: tuple, accuracy: float = 0.01):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self._m2 = np.zeros(self.shape)
+        self.minimum = np.full(self.shape, np.inf)
+        self.maximum = np.full(self.shape, -np.inf)
+        self.sketch = QuantileSketch(self.shape, accuracy)
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Combine the moments of another set of iterations with these."""
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self._m2 = self._m2 + m2 + delta**2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, values: np.ndarray) -> None:
+        """Add the results of a batch of iterations, of shape
+        (iterations, *shape).
+        """
+        values = np.asarray(values, dtype=np.float64).reshape((-1,) + self.shape)
+        if not len(values):
+            return
+        mean = values.mean(axis=0)
+        self._combine(len(values), mean, ((values - mean) ** 2).sum(axis=0))
+        self.minimum = np.minimum(self.minimum, values.min(axis=0))
+        self.maximum = np.maximum(self.maximum, values.max(axis=0))
+        self.sketch.add(values)
+
+    def merge(self, other: "RunningStatistics") -> None:
+        """Add the statistics of another set of iterations."""
+        if not other.count:
+            return
+        self._combine(other.count, other.mean, other._m2)
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The sample variance (ddof=1), NaN for fewer than 2 iterations."""
+        if self.count < 2:
+            return np.full(self.shape, np.nan)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def quantile(self, q: Union[float, Iterable[float]]) -> np.ndarray:
+        """Return the approximate quantiles `q`, see `QuantileSketch.quantile`."""
+        return np.clip(self.sketch.quantile(q), self.minimum, self.maximum)
+
+    def relative_half_widths(self, quantiles: tuple, z: float) -> np.ndarray:
+        """Return the half-widths of the `z` confidence intervals of the
+        mean and `quantiles`, relative to their estimates, like
+        `MonteCarloLCA.relative_half_widths` but from the sketch.
+
+        Returns
+        -------
+        Array of shape (1 + quantiles, *shape)
+
+        """
+        n = self.count
+        estimates = [self.mean]
+        widths = [z * self.std / np.sqrt(n)]
+        for q in quantiles:
+            spread = z * np.sqrt(n * q * (1 - q))
+            low = np.clip(np.floor(n * q - spread), 0, n - 1) / max(n - 1, 1)
+            high = np.clip(np.ceil(n * q + spread), 0, n - 1) / max(n - 1, 1)
+            low, high = self.quantile([low, high])
+            estimates.append(self.quantile(q))
+            widths.append((high - low) / 2)
+        return relative_widths(np.array(widths), np.array(estimates))
+
+
+def relative_widths(widths: np.ndarray, estimates: np.ndarray) -> np.ndarray:
+    """Divide `widths` by the magnitude of `estimates`, a width around an
+    estimate of 0 is infinitely wide unless it is 0 too.
+    """
+    estimates = np.abs(estimates)
+    return np.divide(
+        widths,
+        estimates,
+        out=np.where(widths > 0, np.inf, 0.0),
+        where=estimates > 0,
+    )
@@ -1,6 +1,10 @@
+import re
+
 import pandas as pd
 from PySide2 import QtCore, QtWidgets
 
+from activity_browser import application, log
+
 from ...ui.icons import qicons
 
 """
@@ -198,6 +202,19 @@ class ABPopup(QtWidgets.QDialog):
         QtWidgets.QApplication.restoreOverrideCursor()
         return True
 
+    def exec_(self) -> int:
+        """Show the popup, unless the Activity Browser runs headless.
+
+        Without user interface the message is only logged and the popup is
+        accepted without saving anything, the calling code raises for
+        critical errors either way.
+        """
+        if not application.headless:
+            return super().exec_()
+        message = re.sub("<[^>]+>", " ", self.label.text() if self.label else "")
+        log.warning("{}: {}".format(self.windowTitle(), " ".join(message.split())))
+        return self.Accepted
+
     @QtCore.Slot(name="affirmative")
     def affirmative(self):
         if self.save_dataframe():
@@ -1,20 +1,20 @@
 # -*- coding: utf-8 -*-
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Sequence
 
 import numpy as np
 import pandas as pd
-from PySide2.QtWidgets import QPushButton
+from scipy import sparse
 
 from activity_browser.mod import bw2data as bd
 
 from ..commontasks import format_activity_label
 from ..errors import ScenarioExchangeNotFoundError
 from ..multilca import MLCA, Contributions
+from ..solvers import build_demand_matrix, solve_demand_matrix
 from ..utils import Index
 from .dataframe import (arrays_from_indexed_superstructure,
                         filter_databases_indexed_superstructure,
                         scenario_names_from_df)
-from .file_dialogs import ABPopup
 
 try:
     from bw2calc.matrices import TechnosphereBiosphereMatrixBuilder as MB
@@ -33,7 +33,7 @@ class SuperstructureMLCA(MLCA):
         "production": "technosphere_matrix",
     }
 
-    def __init__(self, cs_name: str, df: pd.DataFrame):
+    def __init__(self, cs_name: str, df: pd.DataFrame, **kwargs):
         assert isinstance(df, pd.DataFrame), (
             "Check if you have provided at least 1 reference flow, 1 impact category "
             "and 1 scenario file. "
@@ -43,7 +43,7 @@ class SuperstructureMLCA(MLCA):
         self.total = len(self.scenario_names)
         assert self.total > 0, "Cannot run analysis without scenarios"
 
-        super().__init__(cs_name)
+        super().__init__(cs_name, **kwargs)
 
         # Scenarios overwrite the lca.xxx_matrix. For supporting absent values
         # in scenario files defaults are required, to prevent these from being
@@ -55,10 +55,13 @@ class SuperstructureMLCA(MLCA):
             "production": "default_technosphere_matrix",
             "biosphere": "default_biosphere_matrix",
         }
+        # Most recently reconstructed scenario biosphere matrix, see `_biosphere_matrix`
+        self._scenario_biosphere = (None, None)
 
         # Filter dataframe for keys that do not occur in the LCA matrix.
         df = filter_databases_indexed_superstructure(df, self.all_databases)
         assert not df.empty, "Filtering unused flows removed all of the scenario data."
+        self.scenario_df = df
 
         self.indices, self.values = arrays_from_indexed_superstructure(df)
         # Note: Using the mapping scheme from brightway and presamples,
@@ -87,7 +90,7 @@ class SuperstructureMLCA(MLCA):
         self.lca_scores = np.zeros(
             (len(self.func_units), len(self.methods), self.total)
         )
-        self.elementary_flow_contributions = np.zeros(
+        self.elementary_flow_contributions = self._contribution_array(
             (
                 len(self.func_units),
                 len(self.methods),
@@ -95,7 +98,7 @@ class SuperstructureMLCA(MLCA):
                 self.lca.biosphere_matrix.shape[0],
             )
         )
-        self.process_contributions = np.zeros(
+        self.process_contributions = self._contribution_array(
             (
                 len(self.func_units),
                 len(self.methods),
@@ -152,37 +155,40 @@ class SuperstructureMLCA(MLCA):
                 # This is to be used as a fail safe for the case where we don't catch a bad exchange during the import
                 # process, or if something else causes an issue with the exchange
                 msg = f"One of the activities in the exchange between ({index.input.database}, {index.input.code}) and ({index.output.database}, {index.output.code}) from the scenario file is not present within the designated database. Please check both keys for this exchange within your scenario file with the corresponding databases."
-                critical = ABPopup.abCritical(
-                    "Scenario Key Error", msg, QPushButton("Cancel")
-                )
-                critical.exec_()
-                raise ScenarioExchangeNotFoundError
+                raise ScenarioExchangeNotFoundError(msg)
             except Exception as e:
                 continue
 
+    def _scenario_sample(self, kind: str, column: int) -> (np.ndarray, np.ndarray):
+        """Return the matrix indices and values of the given exchange kind for
+        the scenario at `column`.
+        """
+        types = np.array([idx[2] for idx in self.indices])
+        idx = self.matrix_indices[types == kind]
+        sample = self.values[types == kind, column]
+        # Previously filtered sample and idx for NaN values in samples.
+        # Currently replaces sample NaN values with defaults from the databases
+        if np.isnan(sample).any():
+            default = getattr(self, self.defaults[kind])
+            na_idx = idx[np.isnan(sample)]
+            if kind == "technosphere":
+                sample[np.isnan(sample)] = np.multiply(
+                    default[na_idx["row"], na_idx["col"]].tolist()[0], -1
+                )
+            else:
+                sample[np.isnan(sample)] = default[
+                    na_idx["row"], na_idx["col"]
+                ].tolist()[0]
+        return idx, sample
+
     def update_matrices(self) -> None:
         """A Simplified version of the `PackagesDataLoader.update_matrices` method.
         In this case, we expect to only replace technosphere and biosphere
         values, leaving out characterization factor values.
         """
         kinds = set([idx[2] for idx in self.indices])
-        types = np.array([idx[2] for idx in self.indices])
         for kind in kinds:
-            idx = self.matrix_indices[types == kind]
-            sample = self.values[types == kind, self.current]
-            # Previously filtered sample and idx for NaN values in samples.
-            # Currently replaces sample NaN values with defaults from the databases
-            if np.isnan(sample).any():
-                default = getattr(self, self.defaults[kind])
-                na_idx = idx[np.isnan(sample)]
-                if kind == "technosphere":
-                    sample[np.isnan(sample)] = np.multiply(
-                        default[na_idx["row"], na_idx["col"]].tolist()[0], -1
-                    )
-                else:
-                    sample[np.isnan(sample)] = default[
-                        na_idx["row"], na_idx["col"]
-                    ].tolist()[0]
+            idx, sample = self._scenario_sample(kind, self.current)
             try:
                 matrix = getattr(self.lca, self.matrices[kind])
             except AttributeError:
@@ -209,51 +215,60 @@ class SuperstructureMLCA(MLCA):
                 idx["col"],
             ] = sample
 
-    def _perform_calculations(self):
-        """Near copy of `MLCA` class, but includes a loop for all scenarios."""
-        for ps_col in range(self.total):
+    def _calculate_chunk(self, rows: Sequence[int], columns=None) -> None:
+        """Near copy of `MLCA` class, but includes a loop over the scenarios
+        at `columns`, all scenarios by default.
+        """
+        columns = range(self.total) if columns is None else columns
+        func_units = [self.func_units[row] for row in rows]
+        demand = build_demand_matrix(self.lca, func_units) if self.batched else None
+        for n, ps_col in enumerate(columns):
+            self.current = ps_col
             self.next_scenario()
-            for row, func_unit in enumerate(self.func_units):
-                try:
-                    self.lca.redo_lci(func_unit)
-                except:
-                    # bw25 compatibility requires activity id instead of activity key
-                    key = list(func_unit.keys())[0]
-                    self.lca.redo_lci({bd.get_activity(key).id: func_unit[key]})
-
-                self.scaling_factors.update(
-                    {(str(func_unit), ps_col): self.lca.supply_array}
-                )
-                self.technosphere_flows.update(
-                    {
-                        (str(func_unit), ps_col): np.multiply(
-                            self.lca.supply_array,
-                            self.lca.technosphere_matrix.diagonal(),
-                        )
-                    }
-                )
-                self.inventory.update(
-                    {
-                        (str(func_unit), ps_col): np.array(
-                            self.lca.inventory.sum(axis=1)
-                        ).ravel()
-                    }
+            self._build_impact_intensities()
+            if self.batched:
+                # The technosphere matrix changed, so factorize once per scenario
+                supply = solve_demand_matrix(self.lca, demand)
+            for i, (row, func_unit) in enumerate(zip(rows, func_units)):
+                if self.batched:
+                    supply_array = supply[:, i]
+                else:
+                    try:
+                        self.lca.redo_lci(func_unit)
+                    except:
+                        # bw25 compatibility requires activity id instead of activity key
+                        key = list(func_unit.keys())[0]
+                        self.lca.redo_lci({bd.get_activity(key).id: func_unit[key]})
+                    supply_array = self.lca.supply_array
+                self._store_results(
+                    (str(func_unit), ps_col), (row, ps_col), supply_array
                 )
-                self.inventories.update({(str(func_unit), ps_col): self.lca.inventory})
-
-                for col, cf_matrix in enumerate(self.method_matrices):
-                    self.lca.characterization_matrix = cf_matrix
-                    self.lca.lcia_calculation()
-                    self.lca_scores[row, col, ps_col] = self.lca.score
-                    self.characterized_inventories[(row, col, ps_col)] = (
-                        self.lca.characterized_inventory.copy()
-                    )
-                    self.elementary_flow_contributions[row, col, ps_col] = np.array(
-                        self.lca.characterized_inventory.sum(axis=1)
-                    ).ravel()
-                    self.process_contributions[row, col, ps_col] = (
-                        self.lca.characterized_inventory.sum(axis=0)
-                    )
+                self._report_progress(n * len(rows) + i + 1, len(columns) * len(rows))
+
+    def _worker_arguments(self) -> tuple:
+        return self.cs_name, self.scenario_df
+
+    def _inventory_key(self, row: int, *args):
+        return str(self.func_units[row]), args[-1]
+
+    def _result_keys(self, row: int) -> list:
+        return [
+            ((row, col), self._inventory_key(row, col)) for col in range(self.total)
+        ]
+
+    def _biosphere_matrix(self, key) -> sparse.spmatrix:
+        """Reconstruct the biosphere matrix of the scenario in `key` from the
+        default biosphere matrix, the most recent one is kept for reuse.
+        """
+        ps_col = key[1]
+        if self._scenario_biosphere[0] == ps_col:
+            return self._scenario_biosphere[1]
+        matrix = self.default_biosphere_matrix.copy()
+        if "biosphere" in set(idx[2] for idx in self.indices):
+            idx, sample = self._scenario_sample("biosphere", ps_col)
+            matrix[idx["row"], idx["col"]] = sample
+        self._scenario_biosphere = (ps_col, matrix)
+        return matrix
 
     def update_lca_calculation_for_sankey(
         self, scenario_index: int, func_unit: str, method_index: int
@@ -348,8 +363,9 @@ class SuperstructureContributions(Contributions):
     def _build_contributions(
         self, data: np.ndarray, index: int, axis: int
     ) -> np.ndarray:
-        data = data[:, :, self.mlca.current]
-        return super()._build_contributions(data, index, axis)
+        key = [slice(None), slice(None), self.mlca.current]
+        key[axis] = index
+        return data[tuple(key)]
 
     @staticmethod
     def _build_scenario_contributions(
@@ -358,8 +374,8 @@ class SuperstructureContributions(Contributions):
         return data[fu_index, m_index, :]
 
     def get_contributions(
-        self, contribution, functional_unit=None, method=None, scenario=0
-    ) -> np.ndarray:
+        self, contribution, functional_unit=None, method=None, scenario=0, rest=False
+    ) -> Optional[np.ndarray]:
         """Return a contribution matrix given the type and fu / method
 
         Allow for both fu and method to exist.
@@ -371,18 +387,20 @@ class SuperstructureContributions(Contributions):
                     functional_unit, method
                 )
             )
-        dataset = {
-            "process": self.mlca.process_contributions,
-            "elementary_flow": self.mlca.elementary_flow_contributions,
-        }
         if method and functional_unit:
-            return self._build_scenario_contributions(
-                dataset[contribution],
+            data = self._contribution_data(contribution, rest)
+            if data is None:
+                return None
+            data = self._build_scenario_contributions(
+                data,
                 self.mlca.func_key_dict[functional_unit],
                 self.mlca.method_index[method],
             )
+            return data.ravel() if rest else data
         self.mlca.current = scenario
-        return super().get_contributions(contribution, functional_unit, method)
+        return super().get_contributions(
+            contribution, functional_unit, method, rest=rest
+        )
 
     def _contribution_index_cols(self, **kwargs) -> (dict, Optional[Iterable]):
         # If both functional_unit and method are given, return scenario index.
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..montecarlo import MonteCarloLCA
+from ..utils import Index
+from .dataframe import (arrays_from_indexed_superstructure,
+                        scenario_names_from_df)
+
+
+class SuperstructureMonteCarloLCA(MonteCarloLCA):
+    """Subclass of the `MonteCarloLCA` class which calculates every iteration
+    for all scenarios of a superstructure.
+
+    The amounts of an iteration are sampled once and shared by all
+    scenarios (common random numbers), so the differences between the
+    scenarios are not blurred by sampling noise. For every scenario, the
+    exchanges of the scenario file are applied to the sampled amounts, see
+    `scenario_amounts`, before the scores are calculated.
+
+    The results and statistics have an extra dimension for the scenarios,
+    `current` selects the scenario shown by `get_results_by` and
+    `get_statistics_dataframe`.
+    """
+
+    def __init__(self, cs_name: str, df: pd.DataFrame):
+        super().__init__(cs_name)
+        assert not df.empty, "Cannot run analysis without data."
+        self.scenario_names = scenario_names_from_df(df)
+        self.total = len(self.scenario_names)
+        assert self.total > 0, "Cannot run analysis without scenarios"
+        self.scenario_df = df
+        self.indices, self.values = arrays_from_indexed_superstructure(df)
+        self.current = 0
+
+        # Positions in the tech_params and bio_params arrays of the scenario
+        # exchanges, and their amounts per scenario, see `load_data`.
+        self._scenario_tech: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._scenario_bio: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def set_scenario(self, index: int) -> None:
+        """Set the scenario of which the results are shown."""
+        self.current = index if index < self.total else 0
+
+    def _index_row_col(self, index: Index) -> Optional[tuple]:
+        """Return the (row, col, type) of a scenario exchange in the LCA
+        matrices, like `SuperstructureMLCA.indices_to_matrix`, or None if it
+        is not part of them.
+        """
+        exc_type = index.exchange_type
+        in_dict = (
+            self.lca.biosphere_dict
+            if index.flow_type == "biosphere"
+            else self.lca.product_dict
+        )
+        row = in_dict.get(index.input)
+        col = self.lca.activity_dict.get(index.output)
+        if row is None or col is None:
+            return None
+        return row, col, exc_type
+
+    def load_data(self) -> None:
+        """Load the matrix data and map the scenario exchanges onto the
+        `tech_params` and `bio_params` arrays.
+
+        An exchange which occurs several times in the params array is
+        given its scenario amount once, its duplicates are set to 0. Without
+        a scenario amount all of them keep their sampled amounts.
+        """
+        super().load_data()
+        converted = [self._index_row_col(index) for index in self.indices]
+        sources = np.array(
+            [i for i, rowcol in enumerate(converted) if rowcol is not None], dtype=int
+        )
+        exchanges = np.array(
+            [converted[i] + (0.0,) for i in sources], dtype=self.PARAM_EXCHANGE_DTYPE
+        )
+
+        def mapping(params: np.ndarray, types: list) -> Tuple[np.ndarray, np.ndarray]:
+            selected = np.flatnonzero(np.isin(exchanges["type"], types))
+            positions, matched = self._match_params(params, exchanges[selected])
+            values = self.values[sources[selected[matched]]]
+            _, first = np.unique(matched, return_index=True)
+            duplicate = np.ones(len(matched), dtype=bool)
+            duplicate[first] = False
+            # Duplicates without a scenario amount (NaN) keep their samples.
+            values[duplicate] = np.where(np.isnan(values[duplicate]), np.nan, 0)
+            return positions, values
+
+        self._scenario_tech = mapping(self.lca.tech_params, [0, 1])
+        self._scenario_bio = mapping(self.lca.bio_params, [2])
+
+    @staticmethod
+    def scenario_amounts(
+        vector: np.ndarray,
+        static: np.ndarray,
+        positions: np.ndarray,
+        values: np.ndarray,
+        out: np.ndarray,
+    ) -> None:
+        """Write the sampled amounts in `vector` with the scenario amounts
+        `values` applied at `positions` into `out`.
+
+        The scenario amount takes the place of the `static` amount, the
+        relative deviation of the sample from the static amount is kept. A
+        missing (NaN) scenario amount keeps the sampled amount.
+        """
+        out[:] = vector
+        sampled = vector[positions]
+        ratio = np.divide(
+            sampled,
+            static,
+            out=np.ones(len(positions)),
+            where=static != 0,
+        )
+        out[positions] = np.where(np.isnan(values), sampled, values * ratio)
+
+    def iteration_scores(
+        self,
+        tech_vector: np.ndarray,
+        bio_vector: np.ndarray,
+        cf_vectors: dict,
+        key: tuple = (),
+    ) -> np.ndarray:
+        """Calculate the scores of every scenario with the sampled amounts
+        of one iteration.
+        """
+        scores = np.zeros(self.score_shape)
+        tech_positions, tech_values = self._scenario_tech
+        bio_positions, bio_values = self._scenario_bio
+        tech_static = self.lca.tech_params["amount"][tech_positions]
+        bio_static = self.lca.bio_params["amount"][bio_positions]
+        # The sampled vectors are kept for the GSA, so the scenario amounts
+        # are written into a copy reused by all scenarios.
+        tech_scenario = np.empty_like(tech_vector)
+        bio_scenario = np.empty_like(bio_vector)
+        for column in range(self.total):
+            self.scenario_amounts(
+                tech_vector,
+                tech_static,
+                tech_positions,
+                tech_values[:, column],
+                tech_scenario,
+            )
+            self.scenario_amounts(
+                bio_vector,
+                bio_static,
+                bio_positions,
+                bio_values[:, column],
+                bio_scenario,
+            )
+            scores[..., column] = super().iteration_scores(
+                tech_scenario, bio_scenario, cf_vectors, key + (column,)
+            )
+        return scores
+
+    def _worker_arguments(self) -> tuple:
+        return self.cs_name, self.scenario_df
+
+    @property
+    def score_shape(self) -> tuple:
+        return len(self.func_units), len(self.methods), self.total
+
+    def current_view(self, array: np.ndarray) -> np.ndarray:
+        return array[..., self.current]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Command line batch runner for calculation setups, installed as
+`activity-browser-run`.
+
+Example::
+
+    activity-browser-run --project X --setup Y --scenarios file.xlsx --out results.parquet
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from activity_browser import application, log
+from activity_browser.mod import bw2data as bd
+
+from .bwutils.batch import combine_scenario_files, run_batch, write_results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="activity-browser-run",
+        description="Calculate calculation setups of a project without user interface.",
+    )
+    parser.add_argument("--project", required=True, help="Brightway project")
+    parser.add_argument(
+        "--setup",
+        action="append",
+        dest="setups",
+        metavar="SETUP",
+        help="Calculation setup to calculate, can be repeated (default: all setups)",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        type=Path,
+        metavar="FILE",
+        help="Scenario difference files for a scenario LCA",
+    )
+    parser.add_argument(
+        "--combine",
+        choices=("product", "addition"),
+        default="product",
+        help="How multiple scenario files are combined (default: product)",
+    )
+    parser.add_argument(
+        "--sheet",
+        type=int,
+        default=1,
+        help="Sheet index to read from Excel scenario files (default: 1)",
+    )
+    parser.add_argument(
+        "--separator",
+        default=";",
+        help="Field separator of CSV scenario files (default: ';')",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=0,
+        help="Number of Monte Carlo iterations, none are run if 0 (default: 0)",
+    )
+    parser.add_argument("--seed", type=int, help="Seed of the Monte Carlo simulation")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of setups calculated in parallel processes (default: 1)",
+    )
+    parser.add_argument(
+        "--out",
+        required=True,
+        type=Path,
+        help="Results file (.parquet, .feather, .csv or .xlsx)",
+    )
+    parser.add_argument(
+        "--mc-out",
+        type=Path,
+        help="Monte Carlo results file (default: '<out>_mc' with the suffix of --out)",
+    )
+    args = parser.parse_args(argv)
+    if args.mc_out is None:
+        args.mc_out = args.out.with_name(args.out.stem + "_mc" + args.out.suffix)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of `activity-browser-run`, returns 1 if any setup failed."""
+    args = parse_args(argv)
+    application.headless = True
+
+    if args.project not in bd.projects:
+        log.error("Project '{}' does not exist.".format(args.project))
+        return 2
+    bd.projects.set_current(args.project)
+    unknown = set(args.setups or []).difference(bd.calculation_setups)
+    if unknown:
+        log.error("Unknown calculation setups: {}".format(", ".join(sorted(unknown))))
+        return 2
+
+    scenario_data = None
+    if args.scenarios:
+        scenario_data = combine_scenario_files(
+            args.scenarios, args.combine, sheet=args.sheet, separator=args.separator
+        )
+
+    scores, mc, failed = run_batch(
+        args.project,
+        args.setups,
+        scenario_data,
+        iterations=args.iterations,
+        seed=args.seed,
+        jobs=args.jobs,
+    )
+    if not scores.empty:
+        write_results(scores, args.out)
+        log.info("LCA results written to {}".format(args.out))
+    if mc is not None:
+        write_results(mc, args.mc_out)
+        log.info("Monte Carlo results written to {}".format(args.mc_out))
+    if failed:
+        log.error("Failed calculation setups: {}".format(", ".join(failed)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,10 @@
 # -*- coding: utf-8 -*-
-import traceback
-
-from bw2calc.errors import BW2CalcError
 from PySide2.QtCore import Qt, Slot
-from PySide2.QtWidgets import QApplication, QMessageBox, QVBoxLayout
+from PySide2.QtWidgets import QMessageBox, QVBoxLayout
 
-from activity_browser import log, signals
+from activity_browser import signals
 from activity_browser.mod import bw2data as bd
 
-from ...bwutils.errors import ABError
 from ..panels import ABTab
 from .LCA_results_tabs import LCAResultsSubTab
 
@@ -54,34 +50,35 @@ class LCAResultsTab(ABTab):
             name = cs_name
         self.remove_setup(name)
 
-        try:
-            new_tab = LCAResultsSubTab(data, self)
-            self.tabs[name] = new_tab
-            self.addTab(new_tab, name)
-            self.select_tab(self.tabs[name])
-
-            new_tab.destroyed.connect(
-                lambda: (
-                    self.tabs.pop(name)
-                    if id(self.tabs.get(name, None)) == id(new_tab)
-                    else None
-                )
-            )
-            new_tab.destroyed.connect(signals.hide_when_empty.emit)
-
-            signals.show_tab.emit("LCA results")
-        except (BW2CalcError, ABError) as e:
-            initial, *other = e.args
-            log.error(traceback.format_exc())
-            QApplication.restoreOverrideCursor()
-            msg = QMessageBox(
-                QMessageBox.Warning,
-                "Calculation problem",
-                str(initial),
-                QMessageBox.Ok,
-                self,
+        new_tab = LCAResultsSubTab(data, self)
+        self.tabs[name] = new_tab
+        self.addTab(new_tab, name)
+        self.select_tab(self.tabs[name])
+
+        new_tab.calculation_failed.connect(self.calculation_failed)
+        new_tab.destroyed.connect(
+            lambda: (
+                self.tabs.pop(name)
+                if id(self.tabs.get(name, None)) == id(new_tab)
+                else None
             )
-            msg.setWindowModality(Qt.ApplicationModal)
-            if other:
-                msg.setDetailedText("\n".join(other))
-            msg.exec_()
+        )
+        new_tab.destroyed.connect(signals.hide_when_empty.emit)
+
+        signals.show_tab.emit("LCA results")
+
+    @Slot(object, name="calculationFailed")
+    def calculation_failed(self, error: Exception):
+        """Show the reason a calculation failed, the failed tab closes itself."""
+        initial, *other = error.args or (type(error).__name__,)
+        msg = QMessageBox(
+            QMessageBox.Warning,
+            "Calculation problem",
+            str(initial),
+            QMessageBox.Ok,
+            self,
+        )
+        msg.setWindowModality(Qt.ApplicationModal)
+        if other:
+            msg.setDetailedText("\n".join(str(o) for o in other))
+        msg.exec_()
@@ -4,30 +4,36 @@
 Each of these classes is either a parent for - or a sub-LCA results tab.
 """
 
+import threading
+import traceback
 from collections import namedtuple
 from typing import List, Optional, Union
 
+import numpy as np
 import pandas as pd
 from PySide2 import QtCore, QtGui
 from PySide2.QtWidgets import (QApplication, QButtonGroup, QCheckBox,
                                QComboBox, QFileDialog, QGridLayout, QGroupBox,
                                QHBoxLayout, QLabel, QLineEdit, QMessageBox,
-                               QPushButton, QRadioButton, QScrollArea,
-                               QTableView, QTabWidget, QToolBar, QVBoxLayout,
-                               QWidget)
+                               QProgressBar, QPushButton, QRadioButton,
+                               QScrollArea, QTableView, QTabWidget, QToolBar,
+                               QVBoxLayout, QWidget)
 from stats_arrays.errors import InvalidParamsError
 
-from activity_browser import log, signals
+from activity_browser import ab_settings, log, signals
 from activity_browser.mod.bw2data import calculation_setups
 
 from ...bwutils import (MLCA, Contributions, GlobalSensitivityAnalysis,
-                        MonteCarloLCA, SuperstructureMLCA, calculations)
+                        MonteCarloLCA, SuperstructureMLCA,
+                        SuperstructureMonteCarloLCA, calculations)
 from ...bwutils import commontasks as bc
+from ...bwutils.errors import CalculationCanceledError
 from ...ui.figures import (ContributionPlot, CorrelationPlot,
                            LCAResultsBarChart, LCAResultsPlot, MonteCarloPlot)
 from ...ui.icons import qicons
 from ...ui.style import header, horizontal_line, vertical_line
 from ...ui.tables import ContributionTable, InventoryTable, LCAResultsTable
+from ...ui.threading import ABThread
 from ...ui.web import SankeyNavigatorWidget
 from ...ui.widgets import CutoffMenu, SwitchComboBox
 from .base import BaseRightTab
@@ -80,15 +86,109 @@ Combobox = namedtuple(
 )
 
 
+class LCACalculationThread(ABThread):
+    """Worker which performs the calculations of an `LCAResultsSubTab`.
+
+    The results, or the exception which stopped the calculation, are kept on
+    the thread and read by the tab once the thread has finished.
+
+    The pardiso solver crashes when several instances factorize at the same
+    time, so the calculations of all tabs run one at a time. A calculation
+    which is canceled while it waits for its turn does not start at all.
+    """
+
+    progress = QtCore.Signal(int, int)
+    # Held by the thread that is calculating, the others wait for it.
+    calculation_lock = threading.Lock()
+
+    def __init__(self, data: dict, parent=None):
+        super().__init__(parent)
+        self.data = data
+        self.results: Optional[tuple] = None
+        self.error: Optional[Exception] = None
+
+    def run_safely(self):
+        try:
+            with self.calculation_lock:
+                self.report_progress(0, 0)
+                self.results = calculations.do_LCA_calculations(
+                    self.data, self.report_progress
+                )
+        except CalculationCanceledError as e:
+            self.error = e
+        except Exception as e:
+            log.error(traceback.format_exc())
+            self.error = e
+
+    def report_progress(self, done: int, total: int) -> None:
+        if self.isInterruptionRequested():
+            raise CalculationCanceledError("Calculation canceled.")
+        self.progress.emit(done, total)
+
+
+class MonteCarloThread(ABThread):
+    """Worker which runs the Monte Carlo simulation of a `MonteCarloTab`.
+
+    The iterations are calculated in worker processes, as the pardiso solver
+    crashes when it is used from several threads. This thread only prepares
+    the sampling and collects the results of the workers, reporting the
+    progress, the precision of the mean results and their statistics so far.
+    """
+
+    progress = QtCore.Signal(int, int, float, object)
+
+    def __init__(self, mc: MonteCarloLCA, kwargs: dict, parent=None):
+        super().__init__(parent)
+        self.mc = mc
+        self.kwargs = kwargs
+        self.error: Optional[Exception] = None
+
+    def run_safely(self):
+        try:
+            self.mc.calculate(
+                progress=self.report_progress, isolated=True, **self.kwargs
+            )
+        except InvalidParamsError as e:
+            # This can occur if uncertainty data is missing or otherwise broken
+            log.error(error=e)
+            self.error = e
+        except Exception as e:
+            log.error(traceback.format_exc())
+            self.error = e
+
+    def cancel(self) -> None:
+        """Stop the simulation, without waiting for the running iteration
+        blocks to finish.
+        """
+        self.requestInterruption()
+        self.mc.cancel()
+
+    def report_progress(self, done: int, total: int) -> None:
+        if self.isInterruptionRequested():
+            raise CalculationCanceledError("Monte Carlo simulation canceled.")
+        width, summary = np.nan, None
+        if done:
+            # A snapshot, as the statistics change while the view updates.
+            summary = self.mc.statistics_summary()
+            width = self.mc.statistics.relative_half_widths(
+                (), self.mc.CONFIDENCE_Z
+            ).max()
+        self.progress.emit(done, total, float(width), summary)
+
+
 class LCAResultsSubTab(QTabWidget):
     """Class for the main 'LCA Results' tab.
 
     Shows:
         One sub-tab for each calculation setup
         For each calculation setup-tab one array of relevant tabs.
+
+    The calculation runs on a `LCACalculationThread`, while it runs only a
+    progress bar is shown and the result tabs are built once it has finished.
     """
 
     update_scenario_box_index = QtCore.Signal(int)
+    calculation_failed = QtCore.Signal(object)
 
     def __init__(self, data: dict, parent=None):
         super().__init__(parent)
@@ -102,13 +202,62 @@ class LCAResultsSubTab(QTabWidget):
         self.method_dict = dict()
         self.single_func_unit = False
         self.single_method = False
+        self.tabs: Optional[Tabs] = None
 
         self.setMovable(True)
         self.setVisible(False)
         self.visible = False
 
-        QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
-        self.mlca, self.contributions, self.mc = calculations.do_LCA_calculations(data)
+        self.progress_page = QWidget(self)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.cancel_button = QPushButton("Cancel")
+        layout = QVBoxLayout(self.progress_page)
+        layout.addWidget(QLabel("Calculating results of '{}'".format(self.cs_name)))
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_button, alignment=QtCore.Qt.AlignLeft)
+        layout.addStretch(1)
+        self.addTab(self.progress_page, "Calculating")
+
+        # The thread is owned by the application, so closing this tab during
+        # the calculation only interrupts it and does not destroy it.
+        thread = LCACalculationThread(data, QApplication.instance())
+        thread.progress.connect(self.update_progress)
+        thread.finished.connect(self.calculation_finished)
+        thread.finished.connect(thread.deleteLater)
+        self.cancel_button.clicked.connect(self.deleteLater)
+        # Disconnected once the thread has finished, as it is deleted then.
+        self._interrupt_calculation = lambda: thread.requestInterruption()
+        self.destroyed.connect(self._interrupt_calculation)
+        self.calculation_thread = thread
+        self.calculation_thread.start()
+
+        calculation_setups.metadata_changed.connect(self.check_cs)
+
+    @QtCore.Slot(int, int, name="updateCalculationProgress")
+    def update_progress(self, done: int, total: int) -> None:
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    @QtCore.Slot(name="calculationFinished")
+    def calculation_finished(self) -> None:
+        """Build the result tabs, or report why the calculation failed."""
+        self.destroyed.disconnect(self._interrupt_calculation)
+        thread, self.calculation_thread = self.calculation_thread, None
+        if thread.error is not None:
+            if not isinstance(thread.error, CalculationCanceledError):
+                self.calculation_failed.emit(thread.error)
+            self.deleteLater()
+            return
+
+        self.mlca, self.contributions, self.mc = thread.results
+        self.removeTab(self.indexOf(self.progress_page))
+        self.progress_page.deleteLater()
+        self.build_tabs()
+        self.currentChanged.connect(self.generate_content_on_click)
+
+    def build_tabs(self) -> None:
+        """Construct the result tabs of the calculated setup."""
         self.method_dict = bc.get_LCIA_method_name_dict(self.mlca.methods)
         self.single_func_unit = True if len(self.mlca.func_units) == 1 else False
         self.single_method = True if len(self.mlca.methods) == 1 else False
@@ -135,10 +284,6 @@ class LCAResultsSubTab(QTabWidget):
         )
         self.setup_tabs()
         self.setCurrentWidget(self.tabs.results)
-        self.currentChanged.connect(self.generate_content_on_click)
-        QApplication.restoreOverrideCursor()
-
-        calculation_setups.metadata_changed.connect(self.check_cs)
 
     def setup_tabs(self):
         """Have all of the tabs pull in their required data and add them."""
@@ -162,6 +307,7 @@ class LCAResultsSubTab(QTabWidget):
         if index == self.mlca.current:
             return
         self.mlca.set_scenario(index)
+        self.mc.set_scenario(index)
         self._update_tabs()
         self.update_scenario_box_index.emit(index)
 
@@ -189,9 +335,49 @@ class LCAResultsSubTab(QTabWidget):
             df.to_excel(filepath)
 
     def check_cs(self):
-        if self.cs != calculation_setups.get(self.cs_name, None):
+        cs = calculation_setups.get(self.cs_name, None)
+        if self.cs == cs:
+            return
+        if cs is None or not self.update_results():
             self.deleteLater()
 
+    def update_results(self) -> bool:
+        """Update the results to the changed calculation setup, see
+        `MLCA.update_setup`, and rebuild the result tabs.
+
+        Returns whether that was possible, otherwise the setup has to be
+        recalculated.
+        """
+        if self.mlca is None or self.tabs.mc.mc_thread is not None:
+            # Still calculating
+            return False
+        if not LCACalculationThread.calculation_lock.acquire(blocking=False):
+            return False
+        try:
+            updated = self.mlca.update_setup()
+        except Exception:
+            log.error(traceback.format_exc())
+            updated = False
+        finally:
+            LCACalculationThread.calculation_lock.release()
+        if not updated:
+            return False
+
+        self.cs = calculation_setups[self.cs_name]
+        self.contributions.update_setup()
+        # The Monte Carlo results of the old setup no longer apply.
+        if self.has_scenarios:
+            self.mlca.set_scenario(0)
+            self.mc = SuperstructureMonteCarloLCA(self.cs_name, self.mlca.scenario_df)
+        else:
+            self.mc = MonteCarloLCA(self.cs_name)
+        for tab in self.tabs:
+            if tab:
+                self.removeTab(self.indexOf(tab))
+                tab.deleteLater()
+        self.build_tabs()
+        return True
+
 
 class NewAnalysisTab(BaseRightTab):
     """Parent class around which all sub-tabs are built."""
@@ -1187,11 +1373,15 @@ class MonteCarloTab(NewAnalysisTab):
         grid.addWidget(self.include_cf, 1, 0)
         grid.addWidget(self.include_parameters, 1, 1)
         self.include_box.setLayout(grid)
+        self.mc_thread: Optional[MonteCarloThread] = None
 
         self.add_MC_ui_elements()
 
         self.table = LCAResultsTable()
         self.table.table_name = "MonteCarlo_" + self.parent.cs_name
+        self.statistics_table = LCAResultsTable()
+        self.statistics_table.hide()
+        self.layout.addWidget(self.statistics_table)
         self.plot = MonteCarloPlot(self.parent)
         self.plot.hide()
         self.plot.plot_name = "MonteCarlo_" + self.parent.cs_name
@@ -1232,6 +1422,7 @@ class MonteCarloTab(NewAnalysisTab):
             self.parent.update_scenario_box_index.connect(
                 lambda index: self.set_combobox_index(self.scenario_box, index)
             )
+            self.parent.update_scenario_box_index.connect(self.update_scenario_results)
 
     def add_MC_ui_elements(self):
         layout_mc = QVBoxLayout()
@@ -1240,15 +1431,67 @@ class MonteCarloTab(NewAnalysisTab):
         self.button_run = QPushButton("Run")
         self.label_iterations = QLabel("Iterations:")
         self.iterations = QLineEdit("30")
-        self.iterations.setFixedWidth(40)
-        self.iterations.setValidator(QtGui.QIntValidator(1, 1000))
+        self.iterations.setFixedWidth(50)
+        self.iterations.setValidator(QtGui.QIntValidator(1, 100000))
         self.label_seed = QLabel("Random seed:")
         self.label_seed.setToolTip(
             "Seed value (integer) for the random number generator. "
             "Use this for reproducible samples."
         )
         self.seed = QLineEdit("")
-        self.seed.setFixedWidth(30)
+        self.seed.setFixedWidth(80)
+        self.sampling = QComboBox(self)
+        for label, mode in (
+            ("Random", "random"),
+            ("Latin hypercube", "lhs"),
+            ("Sobol", "sobol"),
+        ):
+            self.sampling.addItem(label, mode)
+        self.sampling.setToolTip(
+            "How the uncertainty distributions are sampled. Latin hypercube "
+            "and Sobol sampling cover the distributions more evenly, so the "
+            "results converge in fewer iterations."
+        )
+        self.iterative_solver = QCheckBox("Iterative solver", self)
+        self.iterative_solver.setToolTip(
+            "Solve the iterations iteratively, preconditioned with the "
+            "solution of the static technosphere matrix. Faster for large "
+            "databases, results are accurate up to the tolerance."
+        )
+        self.tolerance = QLineEdit("1e-8")
+        self.tolerance.setFixedWidth(50)
+        self.tolerance.setValidator(QtGui.QDoubleValidator(0.0, 1.0, 12))
+        self.tolerance.setToolTip("Relative tolerance of the iterative solver")
+        self.tolerance.setEnabled(False)
+        self.iterative_solver.toggled.connect(self.tolerance.setEnabled)
+        self.stop_converged = QCheckBox("Stop when converged", self)
+        self.stop_converged.setToolTip(
+            "Stop before the number of iterations once the 95% confidence "
+            "intervals of the mean and quantiles of all results are within "
+            "the relative tolerance, checked every 100 iterations."
+        )
+        self.convergence = QLineEdit("0.01")
+        self.convergence.setFixedWidth(50)
+        self.convergence.setValidator(QtGui.QDoubleValidator(0.0, 1.0, 6))
+        self.convergence.setToolTip(
+            "Relative half-width of the confidence intervals to stop at"
+        )
+        self.convergence.setEnabled(False)
+        self.stop_converged.toggled.connect(self.convergence.setEnabled)
+        self.keep_results = QCheckBox("Keep all iterations", self)
+        self.keep_results.setChecked(True)
+        self.keep_results.setToolTip(
+            "Keep the results of every iteration for the histogram, the "
+            "export and the sensitivity analysis. Otherwise only their "
+            "statistics are kept, which saves memory in long simulations."
+        )
+        self.resumable = QCheckBox("Resumable", self)
+        self.resumable.setToolTip(
+            "Save the results to disk while calculating. Running a simulation "
+            "with the same settings and random seed again continues where an "
+            "interrupted run stopped. A random seed is filled in if none is "
+            "given."
+        )
 
         self.hlayout_run = QHBoxLayout()
         self.hlayout_run.addWidget(self.scenario_label)
@@ -1258,10 +1501,33 @@ class MonteCarloTab(NewAnalysisTab):
         self.hlayout_run.addWidget(self.iterations)
         self.hlayout_run.addWidget(self.label_seed)
         self.hlayout_run.addWidget(self.seed)
+        self.hlayout_run.addWidget(self.sampling)
+        self.hlayout_run.addWidget(self.iterative_solver)
+        self.hlayout_run.addWidget(self.tolerance)
+        self.hlayout_run.addWidget(self.stop_converged)
+        self.hlayout_run.addWidget(self.convergence)
+        self.hlayout_run.addWidget(self.keep_results)
+        self.hlayout_run.addWidget(self.resumable)
         self.hlayout_run.addWidget(self.include_box)
         self.hlayout_run.addStretch(1)
         layout_mc.addLayout(self.hlayout_run)
 
+        # H-LAYOUT progress of a running simulation
+        self.progress_widget = QWidget()
+        self.progress_bar = QProgressBar()
+        self.label_progress = QLabel()
+        self.button_cancel = QPushButton("Cancel")
+        self.button_cancel.setToolTip(
+            "Stop the simulation, keeping the iterations calculated so far"
+        )
+        hlayout_progress = QHBoxLayout(self.progress_widget)
+        hlayout_progress.addWidget(self.progress_bar)
+        hlayout_progress.addWidget(self.label_progress)
+        hlayout_progress.addWidget(self.button_cancel)
+        hlayout_progress.addStretch(1)
+        layout_mc.addWidget(self.progress_widget)
+        self.progress_widget.hide()
+
         # self.label_running = QLabel('Running a Monte Carlo simulation. Please allow some time for this. '
         #                             'Please do not run another simulation at the same time.')
         # self.layout_mc.addWidget(self.label_running)
@@ -1296,6 +1562,8 @@ class MonteCarloTab(NewAnalysisTab):
 
         self.hlayout_methods.addWidget(self.label_methods)
         self.hlayout_methods.addWidget(self.combobox_methods)
+        self.label_iterations_used = QLabel()
+        self.hlayout_methods.addWidget(self.label_iterations_used)
         self.hlayout_methods.addStretch()
         self.method_selection_widget.setLayout(self.hlayout_methods)
 
@@ -1342,81 +1610,108 @@ class MonteCarloTab(NewAnalysisTab):
             "biosphere": self.include_bio.isChecked(),
             "cf": self.include_cf.isChecked(),
             "parameters": self.include_parameters.isChecked(),
+            "sampling": self.sampling.currentData(),
+            "keep_results": self.keep_results.isChecked(),
         }
+        if self.iterative_solver.isChecked():
+            try:
+                tolerance = float(self.tolerance.text())
+            except ValueError:
+                tolerance = 1e-8
+            includes.update(solver="iterative", tolerance=tolerance)
+        if self.stop_converged.isChecked():
+            try:
+                includes["convergence"] = float(self.convergence.text())
+            except ValueError:
+                includes["convergence"] = 0.01
+        if self.resumable.isChecked():
+            includes["resumable"] = True
+            if seed is None:
+                # A resumable run is found again by its seed, so pick one
+                # and show it for the next run.
+                seed = int(np.random.default_rng().integers(1, 2**31 - 1))
+                self.seed.setText(str(seed))
+
+        kwargs = dict(
+            iterations=iterations,
+            seed=seed,
+            processes=ab_settings.calculation_processes,
+            **includes,
+        )
+        # The thread is owned by the application, so closing the results
+        # during the simulation only interrupts it and does not destroy it.
+        thread = MonteCarloThread(self.parent.mc, kwargs, QApplication.instance())
+        thread.progress.connect(self.update_mc_progress)
+        thread.finished.connect(self.mc_lca_finished)
+        thread.finished.connect(thread.deleteLater)
+        self.button_cancel.clicked.connect(thread.cancel)
+        self._cancel_simulation = lambda: thread.cancel()
+        self.destroyed.connect(self._cancel_simulation)
+        self.mc_thread = thread
 
-        QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
-        try:
-            self.parent.mc.calculate(iterations=iterations, seed=seed, **includes)
-            signals.monte_carlo_finished.emit()
-            self.update_mc()
-        except (
-            InvalidParamsError
-        ) as e:  # This can occur if uncertainty data is missing or otherwise broken
-            # print(e)
-            log.error(error=e)
+        self.button_run.setEnabled(False)
+        self.button_cancel.setEnabled(True)
+        self.progress_bar.setRange(0, iterations)
+        self.progress_bar.setValue(0)
+        self.label_progress.setText("")
+        self.progress_widget.show()
+        thread.start()
+
+    @QtCore.Slot(int, int, float, object, name="updateMcProgress")
+    def update_mc_progress(
+        self, done: int, total: int, width: float, summary: Optional[dict]
+    ) -> None:
+        """Show the progress, the precision of the mean results and the
+        statistics of the results so far.
+        """
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        text = "{} of {} iterations".format(done, total)
+        if np.isfinite(width):
+            text += ", mean results known within \u00b1{:.1%}".format(width)
+        self.label_progress.setText(text)
+        if summary is not None:
+            self.update_statistics_table(summary)
+
+    def update_statistics_table(self, summary: Optional[dict] = None) -> None:
+        """Show the statistics of the results for the selected method."""
+        method = self.parent.mc.methods[max(self.combobox_methods.currentIndex(), 0)]
+        df = self.parent.mc.get_statistics_dataframe(method=method, summary=summary)
+        self.statistics_table.model.sync(df.rename_axis("Reference flow").reset_index())
+        self.statistics_table.show()
+
+    @QtCore.Slot(name="mcLcaFinished")
+    def mc_lca_finished(self) -> None:
+        """Show the results of a finished or canceled simulation, or report
+        why it failed.
+        """
+        thread, self.mc_thread = self.mc_thread, None
+        self.button_cancel.clicked.disconnect(thread.cancel)
+        self.destroyed.disconnect(self._cancel_simulation)
+        self.progress_widget.hide()
+        self.button_run.setEnabled(True)
+        if thread.error is not None:
             QMessageBox.warning(
-                self, "Could not perform Monte Carlo simulation", str(e)
+                self, "Could not perform Monte Carlo simulation", str(thread.error)
             )
-        QApplication.restoreOverrideCursor()
-
-        # a threaded way for this - unfortunatley this crashes as:
-        # pypardsio_solver is used for the 'spsolve' and 'factorized' functions. Python crashes on windows if multiple
-        # instances of PyPardisoSolver make calls to the Pardiso library
-        # worker_thread = WorkerThread()
-        # print('Created local worker_thread')
-        # worker_thread.set_mc(self.parent.mc, iterations=iterations)
-        # print('Passed object to thread.')
-        # worker_thread.start()
-        # self.label_running.show()
-
-        #
-
-        # thread = NewCSMCThread() #self.parent.mc
-        # thread.calculation_finished.connect(
-        #     lambda x: print('Calculation finished.'))
-        # thread.start()
-
-        # # give us a thread and start it
-        # thread = QtCore.QThread()
-        # thread.start()
-        #
-        # # create a worker and move it to our extra thread
-        # worker = Worker()
-        # worker.moveToThread(thread)
-
-        # self.parent.mct.start()
-        # self.parent.mct.run(iterations=iterations)
-        # self.parent.mct.finished()
-
-        # objThread = QtCore.QThread()
-        # obj = QObjectMC()  # self.parent.cs_name
-        # obj.moveToThread(objThread)
-        # obj.finished.connect(objThread.quit)
-        # objThread.started.connect(obj.long_running)
-        # # objThread.finished.connect(app.exit)
-        # objThread.finished.connect(
-        #     lambda x: print('Finished Thread!')
-        # )
-        # objThread.start()
-
-        # objThread = QtCore.QThread()
-        # obj = SomeObject()
-        # obj.moveToThread(objThread)
-        # obj.finished.connect(objThread.quit)
-        # objThread.started.connect(obj.long_running)
-        # objThread.finished.connect(
-        #     lambda x: print('Finished Thread!')
-        # )
-        # objThread.start()
-
-        # self.method_selection_widget.show()
-        # self.plot.show()
-        # self.export_widget.show()
+            return
+        if not self.parent.mc.iterations_used:
+            return
+        signals.monte_carlo_finished.emit()
+        self.update_mc()
 
     def configure_scenario(self):
         super().configure_scenario()
         self.scenario_label.setVisible(self.has_scenarios)
 
+    @QtCore.Slot(int, name="mcScenarioChanged")
+    def update_scenario_results(self, index: int) -> None:
+        """Show the Monte Carlo results of the selected scenario, the
+        iterations of a simulation include all scenarios.
+        """
+        if self.mc_thread is None and self.parent.mc.iterations_used:
+            self.update_mc()
+
     def update_tab(self):
         self.update_combobox(
             self.combobox_methods, [str(m) for m in self.parent.mc.methods]
@@ -1437,11 +1732,33 @@ class MonteCarloTab(NewAnalysisTab):
         method_index = self.combobox_methods.currentIndex()
         method = self.parent.mc.methods[method_index]
 
-        # data = self.parent.mc.get_results_by(act_key=act_key, method=method)
-        self.df = self.parent.mc.get_results_dataframe(method=method)
+        mc = self.parent.mc
+        self.update_statistics_table()
+        if mc.results is None:
+            # Only the statistics were kept, which are also exported.
+            self.df = mc.get_statistics_dataframe(method=method)
+        else:
+            # data = self.parent.mc.get_results_by(act_key=act_key, method=method)
+            self.df = mc.get_results_dataframe(method=method)
+
+        if mc.iterations_used < mc.iterations:
+            self.label_iterations_used.setText(
+                "{} after {} of {} iterations".format(
+                    "Canceled" if mc.canceled else "Converged",
+                    mc.iterations_used,
+                    mc.iterations,
+                )
+            )
+        else:
+            self.label_iterations_used.setText(
+                "{} iterations".format(mc.iterations_used)
+            )
 
         self.update_table()
-        self.update_plot(method=method)
+        if mc.results is None:
+            self.plot.hide()
+        else:
+            self.update_plot(method=method)
         filename = "_".join(
             [str(x) for x in [self.parent.cs_name, "Monte Carlo results", str(method)]]
         )
@@ -1606,6 +1923,16 @@ class GSATab(NewAnalysisTab):
         )
 
     def monte_carlo_finished(self):
+        if self.parent.mc.results is None:
+            # The GSA relates the samples to the result of every iteration.
+            self.button_run.setEnabled(False)
+            self.widget_settings.hide()
+            self.label_monte_carlo_first.setText(
+                "The sensitivity analysis needs the results of every iteration, "
+                "run the Monte Carlo simulation with 'Keep all iterations'."
+            )
+            self.label_monte_carlo_first.show()
+            return
         self.button_run.setEnabled(True)
         self.widget_settings.show()
         self.label_monte_carlo_first.hide()
@@ -1692,29 +2019,6 @@ class GSATab(NewAnalysisTab):
     #     filename = '_'.join((str(x) for x in fields if x is not None))
 
 
-class MonteCarloWorkerThread(QtCore.QThread):
-    """A worker for Monte Carlo simulations.
-
-    Unfortunately, pyparadiso does not allow parallel calculations on Windows (crashes).
-    So this is for future reference in case this issue is solved..."""
-
-    def __init__(self):
-        pass
-
-    def set_mc(self, mc, iterations=20):
-        self.mc = mc
-        self.iterations = iterations
-
-    def run(self):
-        log.info("Starting new Worker Thread. Iterations:", self.iterations)
-        self.mc.calculate(iterations=self.iterations)
-        # res = bw.GraphTraversal().calculate(self.demand, self.method, self.cutoff, self.max_calc)
-        log.info("in thread {}".format(QtCore.QThread.currentThread()))
-        signals.monte_carlo_ready.emit(self.mc.cs_name)
-
-
-worker_thread = MonteCarloWorkerThread()
-
 # TODO review if can be removed
 
 # class Worker(QtCore.QObject):
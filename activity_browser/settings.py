@@ -149,6 +149,17 @@ class ABSettings(BaseSettings):
         """Sets the startup project to `project`"""
         self.settings.update({"startup_project": project})
 
+    @property
+    def calculation_processes(self) -> int:
+        """Number of worker processes used to calculate LCA results, 1 (the
+        default) calculates in the application process itself.
+        """
+        return self.settings.get("calculation_processes", 1)
+
+    @calculation_processes.setter
+    def calculation_processes(self, processes: int) -> None:
+        self.settings.update({"calculation_processes": max(1, int(processes))})
+
     @staticmethod
     def get_default_directory() -> str:
         """Returns the default brightway application directory"""
@@ -41,6 +41,7 @@ setup(
     entry_points={
         "console_scripts": [
             "activity-browser = activity_browser:run_activity_browser",
+            "activity-browser-run = activity_browser.cli:main",
         ]
     },
     classifiers=[
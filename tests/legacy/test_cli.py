@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+from activity_browser.cli import parse_args
+
+
+def test_parse_args():
+    args = parse_args(
+        ["--project", "p", "--setup", "a", "--setup", "b", "--out", "res.parquet"]
+    )
+    assert args.setups == ["a", "b"]
+    assert args.iterations == 0
+    assert args.mc_out == Path("res_mc.parquet")
+
+
+def test_parse_args_scenario_monte_carlo():
+    args = parse_args(
+        [
+            "--project",
+            "p",
+            "--scenarios",
+            "s.xlsx",
+            "--iterations",
+            "10",
+            "--out",
+            "r.csv",
+        ]
+    )
+    assert args.scenarios == [Path("s.xlsx")]
+    assert args.iterations == 10
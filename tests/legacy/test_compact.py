@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from activity_browser.bwutils.compact import CompactContributionArray
+
+
+def dense_contributions():
+    data = np.random.default_rng(42).normal(size=(3, 4, 50))
+    data[np.abs(data) < 1] = 0
+    return data
+
+
+def test_sparse_storage_is_lossless():
+    data = dense_contributions()
+    compact = CompactContributionArray(data.shape, mode="sparse")
+    for row in range(data.shape[0]):
+        compact[row, :] = data[row]
+    assert np.array_equal(compact[1, 2], data[1, 2])
+    assert np.array_equal(compact.take(2, axis=1), data.take(2, axis=1))
+    assert np.array_equal(compact[:, :, 5:10], data[:, :, 5:10])
+    assert not compact.rest.any()
+
+
+def test_topk_storage_keeps_totals():
+    data = dense_contributions()
+    compact = CompactContributionArray(data.shape, mode="topk", top_n=3)
+    compact[:, :] = data
+    contributions = compact.take(0, axis=0)
+    assert (np.count_nonzero(contributions, axis=1) <= 3).all()
+    totals = contributions.sum(axis=1) + compact.rest.take(0, axis=0).ravel()
+    assert np.allclose(totals, data[0].sum(axis=1))
+    # The largest absolute contributor is always kept
+    largest = np.abs(data[0]).argmax(axis=1)
+    assert np.array_equal(
+        contributions[np.arange(4), largest], data[0][np.arange(4), largest]
+    )
+
+
+def test_float32_storage():
+    data = dense_contributions()
+    compact = CompactContributionArray(data.shape, mode="float32")
+    compact[0, :] = data[0]
+    assert compact[0].dtype == np.float64
+    assert np.allclose(compact[0], data[0], rtol=1e-6)
+
+
+def test_indexing_matches_dense():
+    data = dense_contributions()
+    compact = CompactContributionArray(data.shape, mode="sparse")
+    compact[:, :] = data
+    for key in [(1,), (slice(None), 2), (-1, slice(1, 3)), (slice(None, None, -1),)]:
+        assert np.array_equal(compact[key], data[key])
+    # Advanced indexes select the same vectors as in numpy.
+    assert np.array_equal(compact[[0, 2], 1], data[[0, 2], 1])
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from activity_browser.bwutils.multilca import Contributions
+
+
+def test_select_top():
+    absolute = np.array([[5.0, 1.0, 3.0, 0.5, 0.5], [0.0, 2.0, 2.0, 4.0, 2.0]])
+
+    top = Contributions._select_top(absolute, 2, "number")
+    assert top.sum(axis=1).tolist() == [2, 2]
+    assert top[0, [0, 2]].all() and top[1, 3]
+
+    top = Contributions._select_top(absolute, 0.2, "percent")
+    assert np.flatnonzero(top[0]).tolist() == [0, 2]
+    assert np.flatnonzero(top[1]).tolist() == [1, 2, 3, 4]
+
+    top = Contributions._select_top(absolute, 0.5, "cum_percent")
+    assert np.flatnonzero(top[0]).tolist() == [0]
+    assert top[1].sum() == 2 and top[1, 3]
+
+    with pytest.raises(ValueError):
+        Contributions._select_top(absolute, 5, "percent")
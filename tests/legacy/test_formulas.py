@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+import numpy as np
+
+from activity_browser.bwutils.formulas import FormulaProgram
+from activity_browser.bwutils.utils import Parameter
+
+Group = namedtuple("Group", ["group", "database"])
+
+
+class Initial(object):
+    """Parameters in the layout of `StaticParameters`."""
+
+    databases = {"db"}
+    act_by_group_db = [Group("grp", "db")]
+
+    def project(self):
+        return {"a": {"amount": 2}, "b": {"formula": "a * c"}, "c": {"amount": 3}}
+
+    def by_database(self, database):
+        return {"d": {"formula": "sqrt(a) + b"}, "c": {"amount": 10}}
+
+    def act_by_group(self, group):
+        return {"x": {"formula": "round(d, 1)"}, "y": {"amount": 1}}
+
+    def exc_by_group(self, group):
+        return {1: "x * y + c", 2: "max(y, d)", 3: "2"}
+
+
+def test_formula_program():
+    parameters = [
+        Parameter("a", "project", 2),
+        Parameter("b", "project", 0),
+        Parameter("c", "project", 3),
+        Parameter("c", "db", 10),
+        Parameter("y", "grp", 1),
+    ]
+    program = FormulaProgram(parameters, Initial())
+    # `round` is not compiled, but left to the interpreter.
+    assert program.interpreted == ["round(d, 1)"]
+
+    values = np.array([[2, 0, 3, 10, 1], [4, 0, 3, 5, 2]], dtype=np.float64)
+    amounts = program.evaluate(values)
+    d = np.sqrt([2, 4]) + [6, 12]
+    expected = [np.round(d, 1) * [1, 2] + [10, 5], np.maximum([1, 2], d), [2, 2]]
+    assert np.allclose(amounts, np.array(expected).T)
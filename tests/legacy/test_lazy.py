@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from activity_browser.bwutils.lazy import LazyMatrixDict
+
+
+def test_lazy_matrix_dict_lru():
+    calls = []
+
+    def factory(key):
+        calls.append(key)
+        return np.full(10, key, dtype=np.float64)  # 80 bytes
+
+    lazy = LazyMatrixDict(factory, max_bytes=160)
+    for key in range(3):
+        lazy.add(key)
+    assert len(lazy) == 3 and not calls
+
+    assert lazy[0][0] == 0 and lazy[1][0] == 1
+    lazy[0]  # cached, 0 becomes most recently used
+    assert calls == [0, 1]
+    lazy[2]  # evicts 1, the least recently used
+    assert lazy.cached_bytes == 160
+    lazy[1]
+    assert calls == [0, 1, 2, 1]
+
+    lazy.discard(1)
+    with pytest.raises(KeyError):
+        lazy[1]
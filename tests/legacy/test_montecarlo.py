@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+import bw2calc as bc
+import bw2data as bd
+import numpy as np
+import pytest
+from scipy import sparse
+
+from activity_browser.bwutils.montecarlo import MonteCarloLCA
+from activity_browser.bwutils.montecarlo_store import MonteCarloStore
+from activity_browser.bwutils.superstructure.montecarlo import \
+    SuperstructureMonteCarloLCA
+
+
+def test_iteration_blocks():
+    blocks = MonteCarloLCA.iteration_blocks(120, seed=42)
+    assert [(first, last) for first, last, _ in blocks] == [
+        (0, 50),
+        (50, 100),
+        (100, 120),
+    ]
+    assert len({seed for _, _, seed in blocks}) == len(blocks)
+    # The seeds of a block do not depend on the total number of iterations.
+    assert MonteCarloLCA.iteration_blocks(60, seed=42)[0] == blocks[0]
+
+
+def test_store_resumes_finished_blocks(tmp_path):
+    store = MonteCarloStore.__new__(MonteCarloStore)
+    store.path = str(tmp_path)
+    results = store.array("results", (120, 1, 1))
+    blocks = MonteCarloLCA.iteration_blocks(120, seed=42)
+
+    results[0:50] = 1.0
+    store.save_block(0, {"scores": results[0:50], "cf": {}}, [results])
+    # The block at 100 is finished, but not the one before it.
+    store.save_block(100, {"scores": results[100:120], "cf": {}}, [results])
+
+    finished = list(store.finished_blocks(blocks))
+    assert [(first, data["last"]) for first, data in finished] == [(0, 50)]
+    assert (store.array("results", (120, 1, 1))[0:50] == 1.0).all()
+
+
+def test_allocate_temporary_samples(tmp_path):
+    samples = MonteCarloLCA._allocate(
+        "technosphere_samples", (4, 3), directory=str(tmp_path), temporary=True
+    )
+    assert isinstance(samples, np.memmap)
+    samples[1:3] = [[1, 2, 3], [4, 5, 6]]
+    assert samples[:, 2].tolist() == [0, 3, 6, 0]
+    # Without any sample columns nothing is mapped.
+    empty = MonteCarloLCA._allocate(
+        "biosphere_samples", (4, 0), None, str(tmp_path), True
+    )
+    assert empty.shape == (4, 0)
+
+
+def test_match_params():
+    dtype = MonteCarloLCA.PARAM_EXCHANGE_DTYPE
+    params = np.array(
+        [(0, 0, 0, 1), (1, 0, 1, 1), (2, 3, 1, 1), (2, 3, 2, 1), (4, 1, 1, 1)],
+        dtype=dtype,
+    )
+    exchanges = np.array([(4, 1, 1, 0), (2, 3, 1, 0), (9, 9, 1, 0)], dtype=dtype)
+    positions, sources = MonteCarloLCA._match_params(params, exchanges)
+    assert positions.tolist() == [2, 4]
+    assert sources.tolist() == [1, 0]
+
+
+def test_update_matrix():
+    params = np.zeros(6, dtype=MonteCarloLCA.PARAM_EXCHANGE_DTYPE)
+    params["row"] = [0, 1, 2, 0, 2, 1]
+    params["col"] = [0, 1, 2, 2, 0, 0]
+    params["amount"] = [1, 1, 1, 0.5, 0.2, 0]
+    signs = np.array([1.0, 1, 1, -1, -1, -1])
+    vector = np.array([1.0, 2, 3, 4, 5, 6])
+
+    def build(values: np.ndarray) -> sparse.csr_matrix:
+        return sparse.coo_matrix(
+            (values * signs, (params["row"], params["col"])), (3, 3)
+        ).tocsr()
+
+    # The explicit 0 is stored too, so every exchange has its own value.
+    matrix = build(params["amount"])
+    update = MonteCarloLCA._data_mapping(matrix, params, signs)
+    assert update[0]
+    MonteCarloLCA.update_matrix(matrix, update, vector)
+    assert np.allclose(matrix.toarray(), build(vector).toarray())
+
+    # Duplicate exchanges are summed.
+    params["row"][5], params["col"][5] = 2, 2
+    matrix = build(params["amount"])
+    update = MonteCarloLCA._data_mapping(matrix, params, signs)
+    assert not update[0]
+    MonteCarloLCA.update_matrix(matrix, update, vector)
+    assert np.allclose(matrix.toarray(), build(vector).toarray())
+
+
+def test_draw_size():
+    mc = MonteCarloLCA.__new__(MonteCarloLCA)
+    mc.include_technosphere, mc.include_biosphere = True, False
+    mc.include_cfs = mc.include_parameters = False
+    mc.lca = type("LCA", (), {"tech_params": np.zeros(1000)})
+    assert mc.draw_size(50) == 50
+    mc.SAMPLE_MEMORY = 8000 * 20
+    assert mc.draw_size(50) == 20
+    mc.SAMPLE_MEMORY = 10
+    assert mc.draw_size(50) == 1
+
+
+def test_relative_half_widths():
+    results = np.random.default_rng(42).normal(10, 1, size=(10000, 1, 2))
+    results[:, :, 1] = 0
+    widths = MonteCarloLCA.relative_half_widths(results)
+    assert widths.shape == (1 + len(MonteCarloLCA.CONVERGENCE_QUANTILES), 1, 2)
+    # The mean of N(10, 1) is known within 1.96 * 1 / sqrt(10000).
+    assert np.isclose(widths[0, 0, 0], 0.00196, rtol=0.05)
+    assert np.all(widths[:, 0, 0] < 0.01)
+    # Constant zero results have converged.
+    assert np.all(widths[:, 0, 1] == 0)
+    assert np.all(MonteCarloLCA.relative_half_widths(results[:20])[:, 0, 0] > 0.01)
+
+
+def test_converged():
+    mc = MonteCarloLCA.__new__(MonteCarloLCA)
+    mc.results = np.random.default_rng(42).normal(10, 1, size=(1000, 1, 1))
+    mc.convergence, mc.convergence_interval, mc._checked = 0.02, 100, 0
+    mc.convergence_history = []
+    assert not mc.converged(50)
+    assert not mc.converged(100)
+    assert not mc.converged(150)
+    assert mc.converged(1000)
+    assert [n for n, _ in mc.convergence_history] == [100, 1000]
+
+
+def test_scenario_amounts():
+    sampled = np.array([1.0, 2.2, 0.5, 4.0])
+    static = np.array([2.0, 0.0, 4.0])
+    values = np.array([3.0, 5.0, np.nan])
+    out = np.empty_like(sampled)
+    SuperstructureMonteCarloLCA.scenario_amounts(
+        sampled, static, np.array([1, 2, 3]), values, out
+    )
+    # The deviation from the static amount is kept, a static amount of 0 is
+    # replaced and missing scenario amounts keep the sample.
+    assert np.allclose(out, [1.0, 3.3, 5.0, 4.0])
+    assert sampled[1] == 2.2
+
+
+def _write_uncertain_system() -> None:
+    """Write a small system with uncertain exchanges and characterization
+    factors, and a calculation setup "mc" for it.
+    """
+    uncertain = {"uncertainty type": 2, "scale": 0.1}
+    bd.Database("bio").write(
+        {
+            ("bio", "co2"): {"name": "CO2", "categories": ("air",), "type": "emission"},
+            ("bio", "ch4"): {"name": "CH4", "categories": ("air",), "type": "emission"},
+        }
+    )
+    bd.Database("db").write(
+        {
+            ("db", "a"): {
+                "name": "A",
+                "exchanges": [
+                    {"input": ("db", "a"), "amount": 1, "type": "production"},
+                    dict(
+                        uncertain,
+                        input=("db", "b"),
+                        amount=2,
+                        loc=np.log(2),
+                        type="technosphere",
+                    ),
+                    dict(
+                        uncertain,
+                        input=("bio", "co2"),
+                        amount=3,
+                        loc=np.log(3),
+                        type="biosphere",
+                    ),
+                ],
+            },
+            ("db", "b"): {
+                "name": "B",
+                "exchanges": [
+                    {"input": ("db", "b"), "amount": 1, "type": "production"},
+                    {"input": ("bio", "ch4"), "amount": 0.5, "type": "biosphere"},
+                ],
+            },
+        }
+    )
+    method = bd.Method(("test", "gwp"))
+    method.register()
+    method.write(
+        [
+            (("bio", "co2"), 1),
+            (("bio", "ch4"), dict(uncertain, amount=28, loc=np.log(28))),
+        ]
+    )
+    bd.calculation_setups["mc"] = {
+        "inv": [{("db", "a"): 1}, {("db", "b"): 2}],
+        "ia": [("test", "gwp")],
+    }
+
+
+def test_isolated_workers_open_project_in_data_directory(bw2test):
+    # The temporary data directory of `bw2test` is not the default one.
+    bd.projects.set_current("mc_worker_test")
+    _write_uncertain_system()
+
+    expected = MonteCarloLCA("mc")
+    expected.calculate(iterations=60, seed=7)
+    mc = MonteCarloLCA("mc")
+    mc.calculate(iterations=60, seed=7, processes=2, isolated=True)
+    assert mc.iterations_used == 60
+    assert np.allclose(mc.results, expected.results)
+    assert np.allclose(mc.tech_samples, expected.tech_samples)
+
+
+def test_iteration_scores_match_separate_calculations(bw2test):
+    bd.projects.set_current("mc_scores_test")
+    _write_uncertain_system()
+    # Duplicate characterization factors of a flow are summed.
+    method = bd.Method(("test", "duplicates"))
+    method.register()
+    method.write(
+        [
+            (("bio", "co2"), 1),
+            (
+                ("bio", "co2"),
+                {"amount": 2, "uncertainty type": 4, "minimum": 1, "maximum": 3},
+            ),
+            (("bio", "ch4"), 25),
+        ]
+    )
+    bd.calculation_setups["mc"] = dict(
+        bd.calculation_setups["mc"], ia=[("test", "gwp"), ("test", "duplicates")]
+    )
+
+    mc = MonteCarloLCA("mc")
+    mc.seed = 3
+    mc.set_options(parameters=False)
+    mc.load_data()
+    samples = mc.draw_samples(1)
+    tech_vector, bio_vector = samples["tech"][0], samples["bio"][0]
+    cf_vectors = {m: samples["cf"][m][0] for m in mc.methods}
+    scores = mc.iteration_scores(tech_vector, bio_vector, cf_vectors)
+
+    # The calculation per reference flow and method of before.
+    lca = bc.LCA(demand=mc.func_units_dict, method=mc.methods[0])
+    lca.lci()
+    lca.rebuild_technosphere_matrix(tech_vector)
+    lca.rebuild_biosphere_matrix(bio_vector)
+    expected = np.zeros(mc.score_shape)
+    for row, func_unit in enumerate(mc.func_units):
+        lca.redo_lci(func_unit)
+        for col, m in enumerate(mc.methods):
+            lca.switch_method(m)
+            lca.rebuild_characterization_matrix(cf_vectors[m])
+            lca.lcia_calculation()
+            expected[row, col] = lca.score
+    assert np.allclose(scores, expected)
+
+
+@pytest.mark.parametrize("excluded", ["technosphere", "biosphere", "cf"])
+def test_calculate_without_uncertainty_of(bw2test, excluded):
+    bd.projects.set_current("mc_static_test")
+    _write_uncertain_system()
+    mc = MonteCarloLCA("mc")
+    mc.calculate(iterations=5, seed=11, **{excluded: False})
+    assert mc.iterations_used == 5
+    assert np.isfinite(mc.results).all()
+    # The static amounts are used in place of samples.
+    static = {
+        "technosphere": mc.tech_rng,
+        "biosphere": mc.bio_rng,
+        "cf": mc.cf_rngs[mc.methods[0]],
+    }[excluded]
+    assert static.dtype == np.float64
+
+
+def test_results_not_kept(bw2test):
+    bd.projects.set_current("mc_statistics_test")
+    _write_uncertain_system()
+    mc = MonteCarloLCA("mc")
+    mc.calculate(iterations=5, seed=11, keep_results=False)
+    assert mc.results is None
+    with pytest.raises(ValueError, match="not kept"):
+        mc.get_results_dataframe(act_key=mc.activity_keys[0])
+    with pytest.raises(ValueError, match="not kept"):
+        mc.get_results_by(method=mc.methods[0])
+    # Only the statistics are available.
+    df = mc.get_statistics_dataframe(method=mc.methods[0])
+    assert len(df) == len(mc.activity_keys)
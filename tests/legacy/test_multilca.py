@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import bw2data as bd
+import numpy as np
+import pandas as pd
+
+from activity_browser.bwutils.multilca import MLCA, Contributions
+from activity_browser.bwutils.superstructure.mlca import SuperstructureMLCA
+
+RESULTS = ("lca_scores", "elementary_flow_contributions", "process_contributions")
+
+
+def _write_system() -> None:
+    """Write a small system of three activities and three methods."""
+    bd.Database("bio").write(
+        {
+            ("bio", "co2"): {"name": "CO2", "categories": ("air",), "type": "emission"},
+            ("bio", "ch4"): {"name": "CH4", "categories": ("air",), "type": "emission"},
+        }
+    )
+    bd.Database("db").write(
+        {
+            ("db", "a"): {
+                "name": "A",
+                "location": "CH",
+                "reference product": "a",
+                "exchanges": [
+                    {"input": ("db", "a"), "amount": 1, "type": "production"},
+                    {"input": ("db", "b"), "amount": 2, "type": "technosphere"},
+                    {"input": ("bio", "co2"), "amount": 3, "type": "biosphere"},
+                ],
+            },
+            ("db", "b"): {
+                "name": "B",
+                "location": "DE",
+                "reference product": "b",
+                "exchanges": [
+                    {"input": ("db", "b"), "amount": 1, "type": "production"},
+                    {"input": ("db", "c"), "amount": 0.5, "type": "technosphere"},
+                    {"input": ("bio", "ch4"), "amount": 0.2, "type": "biosphere"},
+                ],
+            },
+            ("db", "c"): {
+                "name": "C",
+                "location": "FR",
+                "reference product": "c",
+                "exchanges": [
+                    {"input": ("db", "c"), "amount": 1, "type": "production"},
+                    {"input": ("bio", "co2"), "amount": 1.5, "type": "biosphere"},
+                ],
+            },
+        }
+    )
+    for name, cfs in (
+        ("gwp", [(("bio", "co2"), 1), (("bio", "ch4"), 28)]),
+        ("co2", [(("bio", "co2"), 1)]),
+        ("ch4", [(("bio", "ch4"), 1)]),
+    ):
+        method = bd.Method(("test", name))
+        method.register()
+        method.write(cfs)
+
+
+def _change_setup() -> None:
+    """Remove B and the "co2" method, add C and the "ch4" method."""
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "c"): 4}, {("db", "a"): 1}],
+        "ia": [("test", "ch4"), ("test", "gwp")],
+    }
+
+
+def _assert_same_results(updated: MLCA, recalculated: MLCA) -> None:
+    assert updated.fu_activity_keys == recalculated.fu_activity_keys
+    assert updated.fu_index == recalculated.fu_index
+    assert updated.method_index == recalculated.method_index
+    for name in RESULTS:
+        assert np.allclose(getattr(updated, name), getattr(recalculated, name))
+    assert sorted(updated.scaling_factors) == sorted(recalculated.scaling_factors)
+    for key, supply in recalculated.scaling_factors.items():
+        assert np.allclose(updated.scaling_factors[key], supply)
+    assert sorted(updated.characterized_inventories) == sorted(
+        recalculated.characterized_inventories
+    )
+
+
+def test_update_setup_matches_recalculation(bw2test):
+    bd.projects.set_current("mlca_update_test")
+    _write_system()
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "a"): 1}, {("db", "b"): 2}],
+        "ia": [("test", "gwp"), ("test", "co2")],
+    }
+    mlca = MLCA("setup")
+    mlca.calculate()
+    contributions = Contributions(mlca)
+
+    _change_setup()
+    assert mlca.update_setup()
+    recalculated = MLCA("setup")
+    recalculated.calculate()
+    _assert_same_results(mlca, recalculated)
+    col = mlca.method_index[("test", "gwp")]
+    assert np.allclose(
+        mlca.characterized_inventories[(0, col)].toarray(),
+        recalculated.characterized_inventories[(0, col)].toarray(),
+    )
+
+    contributions.update_setup()
+    _, _, keys, _ = contributions.inventory_data["technosphere"]
+    assert keys == [("db", "c"), ("db", "a")]
+
+
+def test_update_setup_requires_known_activities(bw2test):
+    bd.projects.set_current("mlca_update_test")
+    _write_system()
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "c"): 1}],
+        "ia": [("test", "gwp")],
+    }
+    # D depends on the system, but is not part of its matrices.
+    bd.Database("other").write(
+        {
+            ("other", "d"): {
+                "name": "D",
+                "location": "IT",
+                "reference product": "d",
+                "exchanges": [
+                    {"input": ("other", "d"), "amount": 1, "type": "production"},
+                    {"input": ("db", "a"), "amount": 1, "type": "technosphere"},
+                ],
+            }
+        }
+    )
+    mlca = MLCA("setup")
+    mlca.calculate()
+    scores = mlca.lca_scores.copy()
+
+    # The results are left as they are, to be recalculated.
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "c"): 1}, {("other", "d"): 1}],
+        "ia": [("test", "gwp")],
+    }
+    assert not mlca.update_setup()
+    assert mlca.fu_activity_keys == [("db", "c")]
+    assert np.array_equal(mlca.lca_scores, scores)
+
+
+def test_scenario_update_setup_matches_recalculation(bw2test):
+    bd.projects.set_current("mlca_update_test")
+    _write_system()
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "a"): 1}, {("db", "b"): 2}],
+        "ia": [("test", "gwp"), ("test", "co2")],
+    }
+    df = pd.DataFrame(
+        [[2.0, 4.0], [3.0, 1.0]],
+        index=pd.MultiIndex.from_tuples(
+            [
+                (("db", "b"), ("db", "a"), "technosphere"),
+                (("bio", "co2"), ("db", "a"), "biosphere"),
+            ]
+        ),
+        columns=["low", "high"],
+    )
+    mlca = SuperstructureMLCA("setup", df)
+    mlca.calculate()
+
+    _change_setup()
+    assert mlca.update_setup()
+    recalculated = SuperstructureMLCA("setup", df)
+    recalculated.calculate()
+    _assert_same_results(mlca, recalculated)
+    assert mlca.lca_scores.shape == (2, 2, 2)
+    # The scenarios differ in the scores of A.
+    row = mlca.fu_index[("db", "a")]
+    assert not np.isclose(mlca.lca_scores[row, 1, 0], mlca.lca_scores[row, 1, 1])
+
+
+def test_update_setup_requires_dense_contributions(bw2test):
+    bd.projects.set_current("mlca_update_test")
+    _write_system()
+    bd.calculation_setups["setup"] = {
+        "inv": [{("db", "a"): 1}],
+        "ia": [("test", "gwp")],
+    }
+    mlca = MLCA("setup", contribution_storage="sparse")
+    mlca.calculate()
+    _change_setup()
+    assert not mlca.update_setup()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import bw2data as bd
+import pytest
+
+from activity_browser.bwutils.parallel import (headless_workers, open_project,
+                                               split_tasks)
+
+
+@pytest.mark.parametrize(
+    "rows, columns, processes", [(5, None, 2), (1, None, 4), (3, 2, 4), (2, 7, 3)]
+)
+def test_split_tasks(rows, columns, processes):
+    tasks = split_tasks(rows, columns, processes)
+    cells = [
+        (row, col)
+        for task_rows, task_columns in tasks
+        for col in (task_columns or [None])
+        for row in task_rows
+    ]
+    expected = {
+        (r, c) for r in range(rows) for c in (range(columns) if columns else [None])
+    }
+    assert len(cells) == len(expected)
+    assert set(cells) == expected
+    assert len(tasks) <= max(processes, 1)
+
+
+def _project_databases() -> list:
+    return sorted(bd.databases)
+
+
+def test_worker_opens_project_in_data_directory(bw2test):
+    # The temporary data directory of `bw2test` is not the default one.
+    bd.projects.set_current("worker_test")
+    bd.Database("worker_db").register()
+    headless = os.environ.get("AB_HEADLESS")
+    with headless_workers():
+        executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=get_context("spawn"),
+            initializer=open_project,
+            initargs=(bd.projects.base_dir, bd.projects.current),
+        )
+        future = executor.submit(_project_databases)
+    with executor:
+        assert future.result() == ["worker_db"]
+    assert os.environ.get("AB_HEADLESS") == headless
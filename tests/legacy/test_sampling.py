@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from stats_arrays import (LognormalUncertainty, MCRandomNumberGenerator,
+                          NormalUncertainty, UncertaintyBase,
+                          UniformUncertainty)
+
+from activity_browser.bwutils.sampling import QuasiRandomGenerator
+
+
+def uncertain_params():
+    return UncertaintyBase.from_dicts(
+        {"loc": np.log(2), "scale": 0.5, "uncertainty_type": LognormalUncertainty.id},
+        {"loc": 5, "scale": 1, "uncertainty_type": NormalUncertainty.id},
+        {
+            "loc": 5,
+            "scale": 1,
+            "minimum": 4,
+            "maximum": 7,
+            "uncertainty_type": NormalUncertainty.id,
+        },
+        {"minimum": 1, "maximum": 3, "uncertainty_type": UniformUncertainty.id},
+        {"loc": 8, "uncertainty_type": 0},
+    )
+
+
+def test_quasi_random_generator():
+    params = uncertain_params()
+    for mode in ("lhs", "sobol"):
+        samples = QuasiRandomGenerator(params, mode, seed=1).generate(256)
+        assert samples.shape == (5, 256)
+        assert np.all(samples[2] >= 4) and np.all(samples[2] <= 7)
+        assert np.all((samples[3] >= 1) & (samples[3] <= 3))
+        assert np.all(samples[4] == 8)
+
+    # A Sobol sequence continued from the 64th point in a new generator
+    # matches the sequence of a single generator.
+    sequence = QuasiRandomGenerator(params, "sobol", sequence_seed=3).generate(128)
+    continued = QuasiRandomGenerator(params, "sobol", sequence_seed=3, first=64)
+    assert np.allclose(continued.generate(64)[:4], sequence[:4, 64:])
+
+
+def test_sampling_convergence():
+    """Benchmark the error of the estimated mean and 5% and 95% percentiles
+    of the product of the uncertain parameters, over repeated simulations
+    with the same number of iterations.
+    """
+    params = uncertain_params()
+    reference = QuasiRandomGenerator(params, "sobol", sequence_seed=0).generate(2**16)
+    reference = reference[:4].prod(axis=0)
+    expected = np.array([reference.mean(), *np.percentile(reference, [5, 95])])
+
+    def rmse(generator) -> np.ndarray:
+        estimates = []
+        for seed in range(20):
+            results = generator(seed).generate(256)[:4].prod(axis=0)
+            estimates.append([results.mean(), *np.percentile(results, [5, 95])])
+        return np.sqrt(((np.array(estimates) - expected) ** 2).mean(axis=0))
+
+    errors = {
+        "random": rmse(lambda seed: MCRandomNumberGenerator(params, seed=seed)),
+        "lhs": rmse(lambda seed: QuasiRandomGenerator(params, "lhs", seed=seed)),
+        "sobol": rmse(
+            lambda seed: QuasiRandomGenerator(params, "sobol", sequence_seed=seed)
+        ),
+    }
+    # Latin hypercubes only stratify every parameter on its own, which
+    # improves the mean of the results, but not necessarily their tails.
+    assert errors["lhs"][0] < errors["random"][0]
+    assert np.all(errors["sobol"] < errors["random"])
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import bw2data as bd
+import numpy as np
+from scipy import sparse
+
+from activity_browser.bwutils.sensitivity_analysis import (
+    get_exchanges, get_exchanges_dataframe, get_X)
+
+
+def test_get_X_matches_matrix_values():
+    params = np.array(
+        [(0, 0, 0), (1, 0, 1), (1, 0, 1), (2, 1, 1), (1, 1, 0)],
+        dtype=[("row", "<u4"), ("col", "<u4"), ("type", "u1")],
+    )
+    samples = np.random.default_rng(3).random((4, len(params)))
+    indices = [(1, 0), (2, 1), (1, 0), (0, 0)]
+
+    X = get_X(samples, params, indices, technosphere=True)
+    signs = np.where(params["type"] == 1, -1.0, 1.0)
+    for i, vector in enumerate(samples):
+        matrix = sparse.coo_matrix(
+            (vector * signs, (params["row"], params["col"])), shape=(3, 2)
+        ).tocsr()
+        assert np.allclose(X[i], [matrix[r, c] for r, c in indices])
+
+
+def test_get_exchanges(bw2test):
+    uncertain = {"uncertainty type": 2, "loc": np.log(2), "scale": 0.1}
+    bd.Database("bio").write(
+        {("bio", "co2"): {"name": "CO2", "categories": ("air",), "type": "emission"}}
+    )
+    bd.Database("db").write(
+        {
+            ("db", "a"): {
+                "name": "A",
+                "location": "CH",
+                "reference product": "a",
+                "exchanges": [
+                    {"input": ("db", "a"), "amount": 1, "type": "production"},
+                    dict(uncertain, input=("db", "b"), amount=2, type="technosphere"),
+                    dict(uncertain, input=("bio", "co2"), amount=2, type="biosphere"),
+                ],
+            },
+            ("db", "b"): {
+                "name": "B",
+                "location": "DE",
+                "reference product": "b",
+                "exchanges": [
+                    {"input": ("db", "b"), "amount": 1, "type": "production"}
+                ],
+            },
+        }
+    )
+    lca = SimpleNamespace(
+        activity_dict_rev={0: ("db", "a"), 1: ("db", "b")},
+        biosphere_dict_rev={0: ("bio", "co2")},
+    )
+
+    # The production exchange of A has no uncertainty and is dropped.
+    exchanges, indices = get_exchanges(lca, [(1, 0), (0, 0)])
+    assert indices == [(1, 0)]
+    df = get_exchanges_dataframe(exchanges, indices)
+    assert df.loc[0, "GSA name"] == "T: b FROM B [DE] TO A (a) [CH]"
+
+    exchanges, indices = get_exchanges(lca, [(0, 0)], biosphere=True)
+    df = get_exchanges_dataframe(exchanges, indices, biosphere=True)
+    assert df.loc[0, "from name"] == "CO2"
+    assert df.loc[0, "GSA name"] == "B: CO2 // A (a) [CH]"
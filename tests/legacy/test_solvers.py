@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import factorized
+
+from activity_browser.bwutils.solvers import (IterativeSolver,
+                                              build_demand_matrix,
+                                              solve_demand_matrix)
+
+
+def small_lca():
+    """A minimal stand-in for a `bw2calc.LCA` with three products."""
+    technosphere = sparse.csr_matrix(
+        np.array([[1.0, -0.2, 0.0], [0.0, 1.0, -0.5], [-0.1, 0.0, 1.0]])
+    )
+    lca = SimpleNamespace(
+        technosphere_matrix=technosphere,
+        product_dict={("db", "a"): 0, ("db", "b"): 1, ("db", "c"): 2},
+    )
+    lca.decompose_technosphere = lambda: setattr(
+        lca, "solver", factorized(technosphere.tocsc())
+    )
+    return lca
+
+
+def test_batched_solve_matches_single_solves():
+    lca = small_lca()
+    func_units = [{("db", "a"): 1}, {("db", "c"): 2.5}, {("db", "b"): -1}]
+    demand = build_demand_matrix(lca, func_units)
+    assert demand.shape == (3, 3)
+    assert demand[2, 1] == 2.5
+
+    supply = solve_demand_matrix(lca, demand)
+    for col in range(len(func_units)):
+        expected = sparse.linalg.spsolve(
+            lca.technosphere_matrix.tocsc(), demand[:, col]
+        )
+        assert np.allclose(supply[:, col], expected)
+
+
+def test_iterative_solver_warm_start_and_fallback():
+    lca = small_lca()
+    solver = IterativeSolver(lca.technosphere_matrix, tolerance=1e-10)
+    demand = np.array([1.0, 0.0, 2.0])
+    perturbed = lca.technosphere_matrix.multiply(1.05).tocsr()
+    perturbed.setdiag(1.0)
+    expected = sparse.linalg.spsolve(perturbed.tocsc(), demand)
+    assert np.allclose(solver.solve(perturbed, demand, key=0), expected)
+    assert np.allclose(solver.solve(perturbed, demand, key=0), expected)
+    assert solver.fallbacks == 0
+
+    # Without convergence the solver falls back to a direct solve.
+    solver = IterativeSolver(lca.technosphere_matrix, tolerance=1e-300, maxiter=1)
+    assert np.allclose(solver.solve(perturbed, demand), expected)
+    assert solver.fallbacks == 1
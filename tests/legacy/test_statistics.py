@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from activity_browser.bwutils.statistics import RunningStatistics
+
+
+def test_running_statistics():
+    rng = np.random.default_rng(3)
+    results = np.stack(
+        [rng.lognormal(0, 1, (2000, 2)), -rng.lognormal(2, 0.5, (2000, 2))], axis=2
+    )
+    stats, other = RunningStatistics((2, 2)), RunningStatistics((2, 2))
+    for first in range(0, 1000, 50):
+        stats.update(results[first : first + 50])
+    for first in range(1000, 2000, 50):
+        other.update(results[first : first + 50])
+    stats.merge(other)
+
+    assert stats.count == 2000
+    assert np.allclose(stats.mean, results.mean(axis=0))
+    assert np.allclose(stats.std, results.std(axis=0, ddof=1))
+    assert np.allclose(stats.maximum, results.max(axis=0))
+    # The quantiles are within the relative accuracy of the sketch.
+    for q in (0.05, 0.95):
+        expected = np.quantile(results, q, axis=0)
+        assert np.allclose(stats.quantile(q), expected, rtol=0.015)